@@ -0,0 +1,96 @@
+# Microbenchmark for highlighting the bonuses (+1 Card, +2 Actions...) in the
+# card descriptions.
+#
+# Highlights every card description of every set and edition in every
+# language, once with the compiled per-language highlighter and once the way
+# it used to be done, with one re.sub per language regex, and reports the
+# time taken for each and whether the results agree.
+#
+#   python benchmarks/bonus_highlighting.py [--repeat 5]
+
+import argparse
+import re
+import time
+
+from domdiv import config_options, db, main
+
+ARGS = ["--edition=all", "--expansions", "*"]
+
+
+def legacy_regexes(card_db, languages):
+    # The regex strings as they were built before, one per language
+    regexes = []
+    for language in languages:
+        bonus = card_db.get_language_text("bonuses", language)
+        exclude = sorted(bonus.get("exclude", []), reverse=True)
+        exclude_regex = r"(?!\w)(?!\s*(" + "|".join(exclude) + "))" if exclude else ""
+        include = sorted(bonus["include"], reverse=True)
+        include_regex = r"(\+\s*\d+\s*(" + "|".join(include) + "))"
+        regexes.append(
+            r"(?i)((?!\<b\>)" + include_regex + exclude_regex + r"(?!\<\/b\>))"
+        )
+    return regexes
+
+
+def legacy_highlight(regexes, text):
+    for regex in regexes:
+        text = re.sub(regex, "<b>\\1</b>", text)
+    return text
+
+
+def read_descriptions(language):
+    options = config_options.clean_opts(
+        config_options.parse_opts(ARGS + [f"--language={language}"])
+    )
+    card_db = db.get_card_database(language=language).view()
+    cards = main.filter_sort_cards(
+        db.read_card_data(options, card_db), options, card_db
+    )
+    languages = [db.LANGUAGE_DEFAULT]
+    if language != db.LANGUAGE_DEFAULT:
+        languages.append(language)
+    return cards, legacy_regexes(card_db, languages)
+
+
+def time_it(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, time.perf_counter() - start
+
+
+def main_(repeat):
+    legacy_total = compiled_total = 0
+    differences = 0
+    for language in db.get_languages("card_db"):
+        cards, regexes = read_descriptions(language)
+        legacy, legacy_seconds = time_it(
+            lambda: [legacy_highlight(regexes, card.description) for card in cards],
+            repeat,
+        )
+        compiled, compiled_seconds = time_it(
+            lambda: [card.getBonusBoldText(card.description) for card in cards],
+            repeat,
+        )
+        differences += sum(a != b for a, b in zip(legacy, compiled))
+        legacy_total += legacy_seconds
+        compiled_total += compiled_seconds
+        print(
+            f"{language:6s} {len(cards):5d} cards  legacy {legacy_seconds:7.3f}s  "
+            f"compiled {compiled_seconds:7.3f}s"
+        )
+    print(
+        f"total  legacy {legacy_total:.3f}s  compiled {compiled_total:.3f}s  "
+        f"({legacy_total / compiled_total:.1f}x), {differences} differences"
+    )
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main_(args.repeat)
+
+
+if __name__ == "__main__":
+    run()
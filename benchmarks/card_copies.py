@@ -0,0 +1,74 @@
+# Microbenchmark for the card copies made while reading the card database.
+#
+# Reads every card of every set and edition (with --curse10, --start-decks and
+# --group-special, which make copies too) and reports the memory allocated
+# and the time taken.  It also copies each of the resulting cards once with
+# copy.deepcopy, as the expansion used to, and once with Card.variant.
+#
+#   python benchmarks/card_copies.py [--language en_us]
+
+import argparse
+import copy
+import time
+import tracemalloc
+
+from domdiv import config_options, db, main
+
+ARGS = ["--edition=all", "--expansions", "*", "--curse10", "--start-decks"]
+
+
+def measure(function):
+    # Returns (result, peak bytes allocated, bytes still allocated, seconds)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, current, seconds
+
+
+def read_cards(language, group_special):
+    args = ARGS + [f"--language={language}"]
+    if group_special:
+        args.append("--group-special")
+    options = config_options.clean_opts(config_options.parse_opts(args))
+    card_db = db.get_card_database(language=language).view()
+    cards = db.read_card_data(options, card_db)
+    return main.filter_sort_cards(cards, options, card_db)
+
+
+def report(name, peak, current, seconds):
+    print(
+        f"{name:28s} {current / 2**20:8.2f}MB kept {peak / 2**20:8.2f}MB peak "
+        f"{seconds:8.3f}s"
+    )
+
+
+def main_(language):
+    # load the database (and its text) outside of the measurements
+    read_cards(language, False)
+    for group_special in [False, True]:
+        cards, peak, current, seconds = measure(
+            lambda: read_cards(language, group_special)
+        )
+        name = "read, grouped" if group_special else "read"
+        report(f"{name} ({len(cards)} cards)", peak, current, seconds)
+
+    for name, copier in [
+        ("copy.deepcopy", copy.deepcopy),
+        ("Card.variant", lambda card: card.variant()),
+    ]:
+        _, peak, current, seconds = measure(lambda: [copier(card) for card in cards])
+        report(name, peak, current, seconds)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--language", default=db.LANGUAGE_DEFAULT)
+    args = parser.parse_args()
+    main_(args.language)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,99 @@
+# Benchmark for --divider-forms.
+#
+# Generates domdiv_bench scenarios, and a few runs with many identical
+# dividers, with and without --divider-forms and reports the time taken, the
+# number of dividers drawn and of forms they share, the bytes of the
+# (uncompressed) content streams of the pages and forms, and the file size.
+#
+#   python benchmarks/divider_forms.py [--scenario default]
+
+import argparse
+import io
+import re
+import time
+
+from loguru import logger
+from pypdf import PdfReader
+
+from domdiv import config_options, main
+from domdiv.tools import bench
+
+SCENARIOS = {
+    "default": None,
+    "bgg_release": None,
+    "curse10_start_decks": [
+        ["--expansions=base", "--curse10", "--start-decks", "--tab-side=left"]
+    ],
+    "full_tabs": [["--expansions", "base", "intrigue", "--curse10", "--tab-side=full"]],
+}
+
+DO_FORM = re.compile(rb"/FormXob\.divider\d+ Do")
+
+
+def get_content_stats(pdf):
+    # (bytes in the content streams of the pages and forms, dividers placed, forms)
+    reader = PdfReader(io.BytesIO(pdf))
+    content = placed = 0
+    forms = {}
+    for page in reader.pages:
+        data = page.get_contents().get_data()
+        content += len(data)
+        placed += len(DO_FORM.findall(data))
+        xobjects = page["/Resources"].get("/XObject", {})
+        for name, ref in xobjects.items():
+            xobject = ref.get_object()
+            if xobject["/Subtype"] == "/Form" and name not in forms:
+                forms[name] = len(xobject.get_data())
+    return content + sum(forms.values()), placed, len(forms)
+
+
+def generate(argsets, extra=()):
+    # Returns (seconds, [PDF bytes]) for generating each of the argsets
+    pdfs = []
+    seconds = 0
+    for args in argsets:
+        options = config_options.clean_opts(
+            config_options.parse_opts(args + list(extra))
+        )
+        options.outfile = io.BytesIO()
+        start = time.perf_counter()
+        main.generate(options)
+        seconds += time.perf_counter() - start
+        pdfs.append(options.outfile.getvalue())
+    return seconds, pdfs
+
+
+def main_(scenarios):
+    logger.remove()
+    all_scenarios = bench.get_scenarios()
+    for name in scenarios:
+        argsets = SCENARIOS[name] or all_scenarios[name]
+        # load the card database, fonts and images and fit the text outside of
+        # the measurements
+        generate(argsets)
+        print(f"{name} ({len(argsets)} PDFs)")
+        for run_name, extra in [("drawn", []), ("forms", ["--divider-forms"])]:
+            seconds, pdfs = generate(argsets, extra)
+            content = placed = forms = 0
+            for pdf in pdfs:
+                stats = get_content_stats(pdf)
+                content += stats[0]
+                placed += stats[1]
+                forms += stats[2]
+            size = sum(len(pdf) for pdf in pdfs)
+            shared = f", {placed} dividers in {forms} forms" if extra else ""
+            print(
+                f"  {run_name:5s} {seconds:6.2f}s, content streams "
+                f"{content / 2**10:8.1f}KB, file {size / 2**20:6.2f}MB{shared}"
+            )
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS))
+    args = parser.parse_args()
+    main_(args.scenario or list(SCENARIOS))
+
+
+if __name__ == "__main__":
+    run()
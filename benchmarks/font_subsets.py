@@ -0,0 +1,118 @@
+# Benchmark for --font-subset-cache.
+#
+# Generates the bgg_release and all_languages scenarios of domdiv_bench in one
+# process, first without the font subset cache and then twice with it (once
+# to fill it, once reusing it), and reports the time taken for all of it and
+# for embedding the font subsets, and whether the PDFs come out the same.  TrueType fonts are needed for there to be any
+# subsets, so without --font-dir the fonts are stood in for by the Vera fonts
+# that come with reportlab.
+#
+#   python benchmarks/font_subsets.py [--font-dir local_fonts] [--scenario bgg_release]
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import reportlab
+from reportlab import rl_config
+
+from domdiv import config_options, fonts, main
+from domdiv.tools import bench
+
+SCENARIOS = ["bgg_release", "all_languages"]
+
+
+def make_font_dir(directory):
+    # Vera copies under the names of all of the fonts looked for
+    vera = os.path.join(os.path.dirname(reportlab.__file__), "fonts")
+    sources = {"Bold": "VeraBd.ttf", "Italic": "VeraIt.ttf", "It": "VeraIt.ttf"}
+    for filenames in list(fonts.FONT_FILENAMES.values()) + list(
+        fonts.TIMES_TTF_FILENAMES.values()
+    ):
+        for fname in filenames or []:
+            source = "Vera.ttf"
+            for word, name in sources.items():
+                if word in fname:
+                    source = name
+            shutil.copy(os.path.join(vera, source), os.path.join(directory, fname))
+    return directory
+
+
+# seconds spent embedding font subsets
+embedding = [0.0]
+
+
+def timed(addSubsetObjects):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return addSubsetObjects(*args, **kwargs)
+        finally:
+            embedding[0] += time.perf_counter() - start
+
+    return wrapper
+
+
+def generate(argsets, font_dir, cache):
+    # Returns (seconds, seconds embedding font subsets, [PDF bytes]) for generating
+    # each of the argsets
+    pdfs = []
+    seconds = 0
+    embedding[0] = 0.0
+    for args in argsets:
+        extra = [f"--font-dir={font_dir}"]
+        if cache:
+            extra.append("--font-subset-cache")
+        options = config_options.clean_opts(config_options.parse_opts(args + extra))
+        options.outfile = io.BytesIO()
+        start = time.perf_counter()
+        main.generate(options)
+        seconds += time.perf_counter() - start
+        pdfs.append(options.outfile.getvalue())
+    return seconds, embedding[0], pdfs
+
+
+def main_(font_dir, scenarios):
+    # no creation dates or ids, so the PDFs can be compared
+    rl_config.invariant = 1
+    face = fonts.SubsetCachingTTFontFace
+    face.addSubsetObjects = timed(face.addSubsetObjects)
+    all_scenarios = bench.get_scenarios()
+    for name in scenarios:
+        argsets = all_scenarios[name]
+        # load the card database, fonts and artwork outside of the measurements
+        generate(argsets, font_dir, False)
+        runs = [
+            ("no cache", generate(argsets, font_dir, False)),
+            ("filling", generate(argsets, font_dir, True)),
+            ("reusing", generate(argsets, font_dir, True)),
+        ]
+        expected = runs[0][1][2]
+        same = all(pdfs == expected for _, (_, _, pdfs) in runs)
+        print(f"{name} ({len(argsets)} PDFs, {'identical' if same else 'DIFFERENT'})")
+        for run_name, (seconds, embedding_seconds, _) in runs:
+            print(
+                f"  {run_name:9s} {seconds:7.2f}s, "
+                f"embedding font subsets {embedding_seconds * 1000:7.1f}ms"
+            )
+    print(f"subset cache: {fonts.get_subset_cache_stats()}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--font-dir", default=None)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    args = parser.parse_args()
+    scenarios = args.scenario or SCENARIOS
+    if args.font_dir:
+        main_(args.font_dir, scenarios)
+        return
+    with tempfile.TemporaryDirectory() as font_dir:
+        main_(make_font_dir(font_dir), scenarios)
+
+
+if __name__ == "__main__":
+    run()
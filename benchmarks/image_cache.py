@@ -0,0 +1,102 @@
+# Benchmark for the image cache of images.ImageCachingCanvas.
+#
+# Generates domdiv_bench scenarios with reportlab's own drawImage (every image
+# read, compressed and encoded again for every PDF), then with the image cache
+# in a fresh process (filling it), reusing it, and reusing a filled
+# --image-cache-dir as a new process would.  Reports the time taken for
+# everything, for drawImage and for saving the PDFs, the size of the PDFs and
+# whether they come out the same as reportlab's.
+#
+#   python benchmarks/image_cache.py [--scenario default]
+
+import argparse
+import io
+import tempfile
+import time
+
+from reportlab import rl_config
+from reportlab.pdfgen import canvas
+
+from domdiv import config_options, images, main
+from domdiv.tools import bench
+
+SCENARIOS = ["default", "expansion_artwork", "label", "all_languages"]
+
+# seconds spent in each of the timed methods
+timings = {}
+
+
+def timed(name, method):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings[name] += time.perf_counter() - start
+
+    return wrapper
+
+
+def generate(argsets, extra=()):
+    # Returns (seconds, {timed method: seconds}, [PDF bytes]) for generating
+    # each of the argsets
+    pdfs = []
+    seconds = 0
+    timings.update(drawImage=0.0, save=0.0)
+    for args in argsets:
+        options = config_options.clean_opts(
+            config_options.parse_opts(args + list(extra))
+        )
+        options.outfile = io.BytesIO()
+        start = time.perf_counter()
+        main.generate(options)
+        seconds += time.perf_counter() - start
+        pdfs.append(options.outfile.getvalue())
+    return seconds, dict(timings), pdfs
+
+
+def main_(scenarios):
+    # no creation dates or ids, so the PDFs can be compared
+    rl_config.invariant = 1
+    cls = images.ImageCachingCanvas
+    cached_drawImage = timed("drawImage", cls.drawImage)
+    reportlab_drawImage = timed("drawImage", canvas.Canvas.drawImage)
+    cls.save = timed("save", cls.save)
+    all_scenarios = bench.get_scenarios()
+    for name in scenarios:
+        argsets = all_scenarios[name]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cls.drawImage = reportlab_drawImage
+            # load the card database, fonts and artwork outside of the measurements
+            generate(argsets)
+            runs = [("reportlab", generate(argsets))]
+            cls.drawImage = cached_drawImage
+            images.image_cache.clear()
+            runs.append(("filling", generate(argsets)))
+            runs.append(("reusing", generate(argsets)))
+            extra = [f"--image-cache-dir={cache_dir}"]
+            images.image_cache.clear()
+            generate(argsets, extra)
+            images.image_cache.clear()
+            runs.append(("from disk", generate(argsets, extra)))
+        expected = runs[0][1][2]
+        same = all(pdfs == expected for _, (_, _, pdfs) in runs)
+        print(f"{name} ({len(argsets)} PDFs, {'identical' if same else 'DIFFERENT'})")
+        for run_name, (seconds, times, pdfs) in runs:
+            size = sum(len(pdf) for pdf in pdfs)
+            print(
+                f"  {run_name:9s} {seconds:7.2f}s, drawImage {times['drawImage']:6.2f}s, "
+                f"save {times['save']:5.2f}s, {size / 2**20:7.2f}MB"
+            )
+    print(f"image cache: {images.get_cache_stats()}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    args = parser.parse_args()
+    main_(args.scenario or SCENARIOS)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,71 @@
+# Microbenchmark for fitting tab, spine and types labels.
+#
+# Shrinks the name and types line of every card to a range of widths, once the
+# way drawTab/drawText used to (0.01pt at a time) and once with
+# textfit.fit_font_size, and reports how many widths each had to measure.
+#
+#   python benchmarks/name_width.py [--language en_us]
+
+import argparse
+import time
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from domdiv import db, textfit
+
+WIDTHS = [40, 60, 80, 100, 120]
+
+
+def shrink_linearly(measure, fontSize, maxWidth, minFontSize):
+    width = measure(fontSize)
+    while width > maxWidth and fontSize > minFontSize:
+        fontSize -= 0.01
+        width = measure(fontSize)
+    return fontSize, width
+
+
+def run_fits(fitter, labels):
+    calls = 0
+
+    def make_measure(label):
+        def measure(size):
+            nonlocal calls
+            calls += 1
+            return stringWidth(label, "Times-Roman", size)
+
+        return measure
+
+    start = time.perf_counter()
+    results = [
+        fitter(make_measure(label), 8, width, 6) for label in labels for width in WIDTHS
+    ]
+    return results, calls, time.perf_counter() - start
+
+
+def main(language):
+    card_db = db.get_card_database(language=language)
+    card_text = card_db.get_language_text("cards", language)
+    labels = sorted(
+        {text["name"] for text in card_text.values() if text.get("name")}
+        | {
+            " - ".join(card_db.type_names.get(t, t) for t in card.get("types", []))
+            for card in card_db.card_records
+        }
+    )
+    before, before_calls, before_time = run_fits(shrink_linearly, labels)
+    after, after_calls, after_time = run_fits(textfit.fit_font_size, labels)
+    assert before == after, "fitted sizes differ"
+    print(f"{len(labels)} labels x {len(WIDTHS)} widths")
+    print(f"linear:   {before_calls:8d} width measurements {before_time:8.3f}s")
+    print(f"bisected: {after_calls:8d} width measurements {after_time:8.3f}s")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--language", default=db.LANGUAGE_DEFAULT)
+    args = parser.parse_args()
+    main(args.language)
+
+
+if __name__ == "__main__":
+    run()
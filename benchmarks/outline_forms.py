@@ -0,0 +1,141 @@
+# Benchmark for the outline forms of --divider-forms.
+#
+# Generates wrapper jobs with cropmarks and dotted lines (and a few others)
+# with and without --divider-forms and reports the time taken, the time spent
+# drawing the outlines, the number of outlines placed and of forms they share,
+# the bytes of the (uncompressed) content streams of the pages and forms, and
+# the file size.
+#
+#   python benchmarks/outline_forms.py [--scenario wrapper_dots]
+
+import argparse
+import io
+import re
+import time
+
+from loguru import logger
+from pypdf import PdfReader
+
+from domdiv import config_options, draw, main
+
+SCENARIOS = {
+    "wrapper_dots": [
+        ["--expansions", "dominion2ndEdition", "intrigue2ndEdition", "--wrapper"],
+        ["--expansions=seaside2ndEdition", "--wrapper", "--head=strap", "--tail=cover"],
+        ["--expansions=prosperity2ndEdition", "--pull-tab", "--tab-side=left"],
+    ],
+    "cropmarks_dots": [
+        ["--expansions", "dominion2ndEdition", "intrigue2ndEdition"],
+        ["--expansions=seaside2ndEdition", "--tab-side=left-alternate"],
+    ],
+    "cropmarks_lines": [
+        ["--expansions", "dominion2ndEdition", "intrigue2ndEdition", "--linetype=line"],
+    ],
+}
+
+EXTRA = {
+    "wrapper_dots": ["--cropmarks", "--linetype=dot", "--no-tab-artwork"],
+    "cropmarks_dots": ["--cropmarks", "--linetype=dot", "--no-tab-artwork"],
+    "cropmarks_lines": ["--cropmarks", "--no-tab-artwork"],
+}
+
+DO_FORM = re.compile(rb"/FormXob\.outline\d+ Do")
+
+# seconds spent drawing the outlines
+timings = {"outline": 0.0}
+
+
+def timed(method):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings["outline"] += time.perf_counter() - start
+
+    return wrapper
+
+
+def get_content_stats(pdf):
+    # (bytes in the content streams of the pages and forms, outlines placed, forms)
+    reader = PdfReader(io.BytesIO(pdf))
+    content = placed = 0
+    forms = {}
+
+    def add_forms(resources):
+        # adds the forms not seen yet, and the divider forms' forms; returns the
+        # outlines placed in them
+        placed = 0
+        for name, ref in resources.get("/XObject", {}).items():
+            xobject = ref.get_object()
+            if xobject["/Subtype"] == "/Form" and name not in forms:
+                data = xobject.get_data()
+                forms[name] = len(data)
+                placed += len(DO_FORM.findall(data))
+                placed += add_forms(xobject.get("/Resources", {}))
+        return placed
+
+    for page in reader.pages:
+        data = page.get_contents().get_data()
+        content += len(data)
+        placed += len(DO_FORM.findall(data))
+        placed += add_forms(page["/Resources"])
+    outlines = [name for name in forms if name.startswith("/FormXob.outline")]
+    return content + sum(forms.values()), placed, len(outlines)
+
+
+def generate(argsets, extra=()):
+    # Returns (seconds, outline seconds, [PDF bytes]) for generating each of the
+    # argsets
+    pdfs = []
+    seconds = 0
+    timings["outline"] = 0.0
+    for args in argsets:
+        options = config_options.clean_opts(
+            config_options.parse_opts(args + list(extra))
+        )
+        options.outfile = io.BytesIO()
+        start = time.perf_counter()
+        main.generate(options)
+        seconds += time.perf_counter() - start
+        pdfs.append(options.outfile.getvalue())
+    return seconds, timings["outline"], pdfs
+
+
+def main_(scenarios):
+    logger.remove()
+    cls = draw.DividerDrawer
+    # the outlines are drawn by drawOutline on the pages, and up front for the forms
+    cls.drawOutlineShape = timed(cls.drawOutlineShape)
+    for name in scenarios:
+        argsets = [args + EXTRA[name] for args in SCENARIOS[name]]
+        # load the card database, fonts and images and fit the text outside of
+        # the measurements
+        generate(argsets)
+        print(f"{name} ({len(argsets)} PDFs)")
+        for run_name, extra in [("drawn", []), ("forms", ["--divider-forms"])]:
+            seconds, outline, pdfs = generate(argsets, extra)
+            content = placed = forms = 0
+            for pdf in pdfs:
+                stats = get_content_stats(pdf)
+                content += stats[0]
+                placed += stats[1]
+                forms += stats[2]
+            size = sum(len(pdf) for pdf in pdfs)
+            shared = f", {placed} outlines in {forms} forms" if extra else ""
+            print(
+                f"  {run_name:5s} {seconds:6.2f}s, outlines {outline:5.2f}s, "
+                f"content streams {content / 2**10:8.1f}KB, "
+                f"file {size / 2**20:6.2f}MB{shared}"
+            )
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS))
+    args = parser.parse_args()
+    main_(args.scenario or list(SCENARIOS))
+
+
+if __name__ == "__main__":
+    run()
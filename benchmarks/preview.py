@@ -0,0 +1,104 @@
+# Benchmark for rendering the --preview image.
+#
+# Times where a preview that isn't cached yet goes, once the process has made
+# one before (so the card database, fonts, images and fitted texts are loaded,
+# as in the service): drawing the front of the first sheet, saving it as a PDF
+# in memory, rasterizing the PDF with pdfium and encoding the png, and the
+# whole of ImageMagick through wand, if it is installed.
+#
+#   python benchmarks/preview.py [--scenario default] [--repeat 5]
+
+import argparse
+import io
+import time
+
+from loguru import logger
+
+from domdiv import config_options, main, profiling
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+SCENARIOS = {
+    "default": [],
+    "artwork": ["--tab-artwork-resolution=300"],
+    "wrapper": ["--wrapper", "--head=strap", "--papersize=A4"],
+}
+
+PHASES = ["draw_dividers", "save"]
+
+
+def draw(args):
+    # Returns ({phase: seconds}, PDF bytes, resolution) for the page of the preview
+    options = config_options.clean_opts(config_options.parse_opts(args + ["--preview"]))
+    options.num_pages = 1
+    options.outfile = io.BytesIO()
+    with profiling.Profile() as profile:
+        main.generate(options)
+    timings = {phase: 0.0 for phase in PHASES}
+    for phase in profile.report()["phases"]:
+        if phase["name"] in timings:
+            timings[phase["name"]] += phase["wall_seconds"]
+    return timings, options.outfile.getvalue(), options.preview_resolution
+
+
+def render_pdfium(pdf, resolution, timings):
+    start = time.perf_counter()
+    document = pypdfium2.PdfDocument(pdf)
+    try:
+        image = document[0].render(scale=resolution / 72).to_pil()
+    finally:
+        document.close()
+    timings["pdfium"] += time.perf_counter() - start
+    start = time.perf_counter()
+    image.save(io.BytesIO(), "PNG")
+    timings["png"] += time.perf_counter() - start
+
+
+def render_wand(pdf, resolution, timings):
+    from wand.image import Image
+
+    start = time.perf_counter()
+    with Image(blob=pdf, resolution=resolution) as sample:
+        sample.format = "png"
+        sample.save(io.BytesIO())
+    timings["wand"] += time.perf_counter() - start
+
+
+def main_(scenarios, repeat):
+    logger.remove()
+    for name in scenarios:
+        args = SCENARIOS[name]
+        # load everything outside of the measurements
+        draw(args)
+        timings = {phase: 0.0 for phase in PHASES + ["pdfium", "png", "wand"]}
+        have_wand = True
+        for _ in range(repeat):
+            drawn, pdf, resolution = draw(args)
+            for phase, seconds in drawn.items():
+                timings[phase] += seconds
+            if pypdfium2 is not None:
+                render_pdfium(pdf, resolution, timings)
+            if have_wand:
+                try:
+                    render_wand(pdf, resolution, timings)
+                except ImportError:
+                    have_wand = False
+        print(f"{name} ({resolution} dpi, seconds per preview)")
+        for phase, seconds in timings.items():
+            if seconds:
+                print(f"  {phase:13s} {seconds / repeat:6.3f}s")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main_(args.scenario or list(SCENARIOS), args.repeat)
+
+
+if __name__ == "__main__":
+    run()
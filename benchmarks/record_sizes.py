@@ -0,0 +1,57 @@
+# Memory used by the Card and CardPlot records of a layout.
+#
+# Lays out the dividers for every set and edition and reports the size of a
+# single Card and CardPlot (the object and its attribute dict, if it has
+# one) and the memory allocated for all of the cards and plots.
+#
+#   python benchmarks/record_sizes.py [--language en_us]
+
+import argparse
+import sys
+import tracemalloc
+
+from domdiv import config_options, db, main
+
+ARGS = ["--edition=all", "--expansions", "*"]
+
+
+def get_size(obj):
+    # The object and, if it has one, its attribute dict
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main_(language):
+    options = config_options.clean_opts(
+        config_options.parse_opts(ARGS + [f"--language={language}"])
+    )
+    card_db = db.get_card_database(language=language).view()
+    # load the text outside of the measurement
+    main.filter_sort_cards(db.read_card_data(options, card_db.view()), options)
+
+    tracemalloc.start()
+    cards = main.filter_sort_cards(db.read_card_data(options, card_db), options)
+    after_cards = tracemalloc.get_traced_memory()[0]
+    dd = main.calculate_layout(options, cards, card_db)
+    after_plots = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    plots = [item for _, _, page in dd.pages for item in page]
+    print(f"{len(cards)} cards, {len(plots)} plots")
+    print(f"Card:     {get_size(cards[0]):5d} bytes each")
+    print(f"CardPlot: {get_size(plots[0]):5d} bytes each")
+    print(f"cards allocated  {after_cards / 2**20:8.2f}MB")
+    print(f"layout allocated {(after_plots - after_cards) / 2**20:8.2f}MB")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--language", default=db.LANGUAGE_DEFAULT)
+    args = parser.parse_args()
+    main_(args.language)
+
+
+if __name__ == "__main__":
+    run()
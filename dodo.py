@@ -1,7 +1,8 @@
 import glob
 import os
 
-from domdiv.tools import bgg_release, update_language
+from domdiv import db
+from domdiv.tools import bgg_release, build_snapshots, update_language
 
 DOIT_CONFIG = {"default_tasks": ["build"]}
 
@@ -36,6 +37,21 @@ def task_update_languages():
     }
 
 
+def task_build_snapshots():
+    return {
+        "file_dep": glob_no_dirs("src/domdiv/card_db/*.json.gz")
+        + glob_no_dirs("src/domdiv/card_db/*/*.json.gz")
+        + ["src/domdiv/db.py", "src/domdiv/tools/build_snapshots.py"],
+        "task_dep": ["update_languages"],
+        "actions": [lambda: build_snapshots.main("src/domdiv/card_db")],
+        "targets": [
+            os.path.join("src", "domdiv", db.get_snapshot_path("card_db", language))
+            for language in db.get_languages("card_db")
+        ],
+        "clean": True,
+    }
+
+
 def task_build():
     files = [
         fname
@@ -45,7 +61,7 @@ def task_build():
     ]
     return {
         "file_dep": files,
-        "task_dep": ["update_languages"],
+        "task_dep": ["update_languages", "build_snapshots"],
         "actions": ["uv sync", "uv run python -m build"],
     }
 
@@ -54,6 +70,13 @@ def task_make_bgg_release():
     return {"actions": [lambda: bgg_release.make_bgg_release()]}
 
 
+def task_bench():
+    return {
+        "actions": ["uv run domdiv_bench --baseline benchmarks/baseline.json"],
+        "verbosity": 2,
+    }
+
+
 def task_test():
     files = glob_no_dirs("src/domdiv/**")
     return {"file_dep": files, "actions": ["uv sync", "uv run pytest"]}
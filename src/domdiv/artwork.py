@@ -0,0 +1,172 @@
+###########################################################################
+# Tab artwork, prepared at the resolution and opacity the options ask for.
+#
+# Resizing and re-encoding the artwork is slow, so the prepared images are
+# kept in an ArtworkCache.  It is keyed on the pixel size the artwork ends up
+# with rather than on the size of the tab, so tabs that are only slightly
+# different share an entry, and it evicts the least recently used artwork
+# once it holds more than max_bytes.  Given a cache directory, the prepared
+# PNGs are also kept on disk for other processes.
+###########################################################################
+
+import collections
+import hashlib
+import io
+import os
+import threading
+
+from loguru import logger
+from PIL import Image, ImageEnhance
+from reportlab.lib.utils import ImageReader
+
+from . import resource_handling
+
+# How much prepared artwork to keep in memory
+ARTWORK_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def get_artwork_key(image, w, h, resolution, opacity):
+    # The prepared artwork only depends on its size in pixels and its opacity,
+    # so key on those rather than on the size it is drawn at.
+    width, height = resource_handling.get_image_size(image)
+    if resolution:
+        # Limit artwork resolution.
+        width = min(width, round(w * resolution / 72))
+        height = min(height, round(h * resolution / 72))
+    return image, width, height, opacity
+
+
+def prepare_artwork(image, width, height, opacity):
+    # Returns the PNG bytes of the image at the given size and opacity
+    with Image.open(resource_handling.get_image_filepath(image)) as imgObj:
+        if (width, height) != imgObj.size:
+            imgObj = imgObj.resize((width, height), Image.Resampling.LANCZOS)
+        if opacity != 1.0:
+            # Set image opacity.
+            if imgObj.mode != "RGBA":
+                imgObj = imgObj.convert("RGBA")
+            alpha = imgObj.getchannel("A")
+            alpha = ImageEnhance.Brightness(alpha).enhance(opacity)
+            imgObj.putalpha(alpha)
+        imageBytes = io.BytesIO()
+        imgObj.save(imageBytes, "PNG")
+    return imageBytes.getvalue()
+
+
+class ArtworkCache(object):
+    def __init__(self, max_bytes=ARTWORK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        # key -> (ImageReader, footprint in bytes), least recently used first
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.stats_counter = collections.Counter()
+        self.lock = threading.Lock()
+
+    def get(self, image, w, h, resolution=0, opacity=1.0, cache_dir=None):
+        # Returns the artwork to draw in a w x h box: the image file itself if it
+        # doesn't need any adjustments, otherwise an ImageReader for the prepared image.
+        if resolution == 0 and opacity == 1.0:
+            return resource_handling.get_image_filepath(image)
+
+        key = get_artwork_key(image, w, h, resolution, opacity)
+        with self.lock:
+            if key in self.entries:
+                self.stats_counter["hits"] += 1
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            self.stats_counter["misses"] += 1
+
+        png = self.load(key, cache_dir)
+        _, width, height, _ = key
+        # The reader keeps the decoded pixels once it has been drawn
+        footprint = len(png) + width * height * 4
+        reader = ImageReader(io.BytesIO(png))
+        # what images.ImageCache keys the encoded image on
+        reader.asset_key = self.get_asset_key(key)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = reader, footprint
+                self.bytes += footprint
+                self.evict()
+        return reader
+
+    def load(self, key, cache_dir):
+        # The PNG bytes for the key, from the cache directory if they are there
+        fname = None
+        if cache_dir:
+            fname = os.path.join(cache_dir, self.get_cache_filename(key))
+            if os.path.exists(fname):
+                with open(fname, "rb") as f:
+                    png = f.read()
+                with self.lock:
+                    self.stats_counter["disk_hits"] += 1
+                return png
+
+        png = prepare_artwork(*key)
+
+        if fname:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                # write to a temporary file first, so other processes never see half a file
+                tmpname = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmpname, "wb") as f:
+                    f.write(png)
+                os.replace(tmpname, fname)
+                with self.lock:
+                    self.stats_counter["disk_writes"] += 1
+            except OSError as e:
+                logger.warning(f"Could not save artwork to {cache_dir}: {e}")
+        return png
+
+    @staticmethod
+    def get_asset_key(key):
+        # The digest of the original image and how it was prepared
+        image, width, height, opacity = key
+        digest = hashlib.sha256(resource_handling.get_resource_bytes(f"images/{image}"))
+        return digest.hexdigest(), width, height, opacity
+
+    @staticmethod
+    def get_cache_filename(key):
+        image, width, height, opacity = key
+        # tie the file to the contents of the original too, in case it changes
+        digest = hashlib.sha256(resource_handling.get_resource_bytes(f"images/{image}"))
+        digest.update(repr(key).encode("utf-8"))
+        name = os.path.splitext(os.path.basename(image))[0]
+        return f"{name}-{width}x{height}-{digest.hexdigest()[:16]}.png"
+
+    def evict(self):
+        # Drop the least recently used artwork until we're within max_bytes,
+        # always keeping the newest entry
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, footprint) = self.entries.popitem(last=False)
+            self.bytes -= footprint
+            self.stats_counter["evictions"] += 1
+
+    def stats(self):
+        # Hits, misses, disk_hits, disk_writes, evictions, entries, bytes and max_bytes
+        with self.lock:
+            stats = {
+                name: self.stats_counter[name]
+                for name in ["hits", "misses", "disk_hits", "disk_writes", "evictions"]
+            }
+            stats.update(
+                entries=len(self.entries), bytes=self.bytes, max_bytes=self.max_bytes
+            )
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.stats_counter.clear()
+
+
+artwork_cache = ArtworkCache()
+
+
+def get_artwork(image, w, h, resolution=0, opacity=1.0, cache_dir=None):
+    return artwork_cache.get(image, w, h, resolution, opacity, cache_dir)
+
+
+def get_cache_stats():
+    return artwork_cache.stats()
@@ -1,5 +1,5 @@
+import copy
 import json
-import re
 
 from loguru import logger
 from reportlab.lib.units import cm
@@ -53,20 +53,38 @@ class CardType(object):
 
 
 class Card(object):
-    sets = None
-    types = None
-    type_names = None
-    bonus_regex = None
+    # There is one of these for every divider, so they keep their attributes in slots
+    __slots__ = (
+        "name",
+        "cardset",
+        "types",
+        "types_name",
+        "cost",
+        "description",
+        "potcost",
+        "debtcost",
+        "extra",
+        "card_tag",
+        "cardset_tags",
+        "group_tag",
+        "group_top",
+        "image",
+        "text_icon",
+        "cardset_tag",
+        "randomizer",
+        "card_db",
+        "_counts",
+    )
 
     class CardJSONEncoder(json.JSONEncoder):
         def default(self, obj):
             if isinstance(obj, Card):
-                return obj.__dict__
+                return {k: v for k, v in obj.getAttributes().items() if k != "card_db"}
             return json.JSONEncoder.default(self, obj)
 
     @staticmethod
-    def decode_json(obj):
-        return Card(**obj)
+    def decode_json(obj, card_db=None):
+        return Card(card_db=card_db, **obj)
 
     def __init__(
         self,
@@ -87,6 +105,7 @@ class Card(object):
         text_icon=None,
         randomizer=True,
         cardset_tag="",
+        card_db=None,
     ):
         if types is None:
             types = []  # make sure types is a list
@@ -112,6 +131,7 @@ class Card(object):
         self.text_icon = text_icon
         self.cardset_tag = cardset_tag
         self.randomizer = randomizer
+        self.card_db = card_db  # the database (view) with the card's types and sets
 
         if count is not None:
             if isinstance(count, int):
@@ -125,6 +145,22 @@ class Card(object):
         else:
             self._counts = None
 
+    def getAttributes(self):
+        # {name: value} of the card's attributes
+        return {name: getattr(self, name) for name in Card.__slots__}
+
+    def variant(self, **changes):
+        # A copy of the card (for another set, pile or group) with the given attributes changed.
+        # The strings and the lists of types and sets are never changed in place, so the copy
+        # shares them with the original, which is much cheaper than a deepcopy.  Only the
+        # counts, which are, get a list of their own.
+        card = copy.copy(self)
+        if self._counts is not None:
+            card._counts = list(self._counts)
+        for key, value in changes.items():
+            setattr(card, key, value)
+        return card
+
     def getCardCount(self) -> int:
         return sum(self.getCardCounts())
 
@@ -150,45 +186,13 @@ class Card(object):
         return self.getCardCount() * cm * (thickness / 60.0) + 2
 
     def getType(self) -> CardType:
-        return Card.types[tuple(self.types)]
+        return self.card_db.types[tuple(self.types)]
 
     def getBonusBoldText(self, text):
-        for regex in Card.bonus_regex:
-            text = re.sub(regex, "<b>\\1</b>", text)
-        return text
-
-    @staticmethod
-    def addBonusRegex(bonus):
-        # Each bonus_regex matches the bonus keywords to be highlighted
-        # This only needs to be done once per language
-        if Card.bonus_regex is None:
-            # initialize the information holder
-            Card.bonus_regex = []
-
-        # Make sure have minimum to to anything
-        if not isinstance(bonus, dict):
-            return
-        if "include" not in bonus:
-            return
-        if not bonus["include"]:
-            return
-        if "exclude" not in bonus:
-            bonus["exclude"] = []
-
-        # Start processing of lists into a single regex statement
-        # (?i) makes this case insensitive
-        # (?!\<b\>) and (?!\<\/b\>) prevents matching already bolded items
-        # (?!\w) prevents smaller word matches.  Prevents matching "Action" in "Actions"
-        if bonus["exclude"]:
-            bonus["exclude"].sort(reverse=True)
-            exclude_regex = r"(?!\w)(?!\s*(" + "|".join(bonus["exclude"]) + "))"
-        else:
-            exclude_regex = ""
-
-        bonus["include"].sort(reverse=True)
-        include_regex = r"(\+\s*\d+\s*(" + "|".join(bonus["include"]) + "))"
-        regex = r"(?i)((?!\<b\>)" + include_regex + exclude_regex + r"(?!\<\/b\>))"
-        Card.bonus_regex.append(regex)
+        highlighter = self.card_db.bonus_highlighter
+        if highlighter is None:
+            return text
+        return highlighter.sub(r"<b>\g<0></b>", text)
 
     def __repr__(self):
         return '"' + self.name + '"'
@@ -260,9 +264,9 @@ class Card(object):
         if not use_set_icon and self.image is not None:
             setImage = self.image
         else:
-            if self.cardset_tag in Card.sets:
-                if "image" in Card.sets[self.cardset_tag]:
-                    setImage = Card.sets[self.cardset_tag]["image"]
+            if self.cardset_tag in self.card_db.sets:
+                if "image" in self.card_db.sets[self.cardset_tag]:
+                    setImage = self.card_db.sets[self.cardset_tag]["image"]
 
         if setImage is None and self.cardset_tag != "base":
             logger.warning(f'no set image for set "{self.cardset}", card "{self.name}"')
@@ -273,9 +277,9 @@ class Card(object):
         if self.text_icon:
             setTextIcon = self.text_icon
         else:
-            if self.cardset_tag in Card.sets:
-                if "text_icon" in Card.sets[self.cardset_tag]:
-                    setTextIcon = Card.sets[self.cardset_tag]["text_icon"]
+            if self.cardset_tag in self.card_db.sets:
+                if "text_icon" in self.card_db.sets[self.cardset_tag]:
+                    setTextIcon = self.card_db.sets[self.cardset_tag]["text_icon"]
 
         if setTextIcon is None and self.cardset != "base":
             logger.warning(f'no set text for set "{self.cardset}", card "{self.name}"')
@@ -286,6 +290,8 @@ class Card(object):
 
 
 class BlankCard(Card):
+    __slots__ = ()
+
     def __init__(self, num):
         Card.__init__(self, str(num), "extra", ("Blank",), 0)
 
@@ -6,7 +6,7 @@ import reportlab.lib.pagesizes as pagesizes
 from loguru import logger
 from reportlab.lib.units import cm
 
-from . import db
+from . import db, output_cache
 
 LOCATION_CHOICES = ["tab", "body-top", "hide"]
 NAME_ALIGN_CHOICES = ["left", "right", "centre", "edge"]
@@ -245,6 +245,12 @@ def parse_opts(cmdline_args=None):
         "If nonzero, any higher-resolution images will be resized to "
         "reduce output file size.",
     )
+    group_tab.add_argument(
+        "--tab-artwork-cache-dir",
+        default=None,
+        help="Keep the tab background art prepared for --tab-artwork-opacity and "
+        "--tab-artwork-resolution in this directory, so later runs can reuse it.",
+    )
     group_tab.add_argument(
         "--use-text-set-icon",
         action="store_true",
@@ -802,7 +808,8 @@ def parse_opts(cmdline_args=None):
     group_printing.add_argument(
         "--preview",
         action="store_true",
-        help="Only generate a preview png image of the first page",
+        help="Only generate a preview png image of the front of the first page. "
+        "Needs the pypdfium2 package (pip install domdiv[preview]) or ImageMagick and wand.",
     )
     group_printing.add_argument(
         "--preview-resolution",
@@ -833,6 +840,94 @@ def parse_opts(cmdline_args=None):
         is_write_out_config_file_arg=True,
         help="Write out the given options to the specified configuration file.",
     )
+    group_special.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to encode the images of the pages with, "
+        "which takes most of the time of drawing them the first time. "
+        "The pages are then drawn into the one file as with a single process, "
+        "so the file is the same.",
+    )
+    group_special.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Draw each sheet on its own and reuse the sheets drawn before with the "
+        "same dividers and drawing options, in the same process (like the service) or "
+        "in --cache-dir, so changing the selection of cards only redraws the sheets "
+        "that change. Needs the pypdf package. The file is larger, since each sheet "
+        "embeds its own copy of the images and fonts.",
+    )
+    group_special.add_argument(
+        "--chunk-pages",
+        type=int,
+        default=0,
+        help="Write the dividers as separate PDFs of this many sheets each, "
+        "named like the output file with -001, -002, ... added. Each one is "
+        "written as soon as it is drawn, and only one is kept in memory at a time.",
+    )
+    group_special.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Keep the finished output in this directory and reuse it when the same "
+        "dividers are asked for again, instead of drawing them again. Equivalent "
+        "options (like --sleeved and --size=sleeved) share the same output.",
+    )
+    group_special.add_argument(
+        "--cache-size",
+        type=int,
+        default=output_cache.DEFAULT_CACHE_MEGABYTES,
+        help="Size in MB that --cache-dir may grow to before the least recently "
+        "used output is removed.",
+    )
+    group_special.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't use or fill the --cache-dir cache (e.g. if it's set in a configuration file).",
+    )
+    group_special.add_argument(
+        "--font-subset-cache",
+        action="store_true",
+        help="Keep the subsets of the TrueType fonts embedded in each PDF and reuse "
+        "them in the following PDFs made by the same process (like the service or "
+        "--batch), instead of cutting and compressing them again.",
+    )
+    group_special.add_argument(
+        "--divider-forms",
+        action="store_true",
+        help="Draw each different divider side once and place copies of it, "
+        "so that identical dividers (like the extra Curses of --curse10 or the "
+        "Start Deck dividers) are only drawn and stored once. The same goes for "
+        "the outlines and cropmarks of dividers with the same shape. "
+        "The pages look the same.",
+    )
+    group_special.add_argument(
+        "--image-cache-dir",
+        default=None,
+        help="Keep the images embedded in the PDFs, encoded, in this directory so "
+        "later runs can reuse them instead of compressing and encoding them again. "
+        "Within a run they are always reused.",
+    )
+    group_special.add_argument(
+        "--batch",
+        default=None,
+        help="Generate several sets of dividers, one for each line of the given file. "
+        'Each line is a JSON object with the command line "args" of one set, '
+        "as a list or a single string. The other options given here are not passed on "
+        "to the sets, but --jobs sets how many of them are generated at the same time.",
+    )
+    group_special.add_argument(
+        "--profile",
+        nargs="?",
+        const="time",
+        default=None,
+        choices=["time", "memory"],
+        help="Profile the generation and write a JSON report next to the output file, "
+        "with the time taken by each phase and page, the peak memory of the process "
+        "and counts of the calls and cache hits that matter most. Profiling makes the "
+        "generation slower; '--profile=memory' traces the memory Python allocates in "
+        "each phase and page, which makes it a lot slower.",
+    )
     group_special.add_argument(
         "--log-level",
         default="WARNING",
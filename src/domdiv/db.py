@@ -1,7 +1,11 @@
 import copy
 import functools
+import hashlib
 import json
 import os
+import pickle
+import re
+from collections import defaultdict
 
 from loguru import logger
 
@@ -14,6 +18,20 @@ LANGUAGE_DEFAULT = (
     "en_us"  # the primary language used if a language's parts are missing
 )
 LANGUAGE_XX = "xx"  # a dummy language for starting translations
+LANGUAGE_TEXT_KINDS = ("cards", "sets", "types", "bonuses")  # the per-language files
+
+# Bump when the layout of the card database snapshots changes, so old ones are ignored
+SNAPSHOT_VERSION = 1
+
+
+@functools.lru_cache(maxsize=None)
+def load_json(path):
+    # Read and parse one of the gzipped json files in the card database.
+    # The result is kept for the life of the process, so that repeated generations
+    # don't pay for decompressing and parsing the same files over and over again.
+    # Callers must treat the returned data as read only and copy anything they modify.
+    with resource_handling.get_resource_stream(path) as f:
+        return json.loads(f.read().decode("utf-8"))
 
 
 @functools.lru_cache()
@@ -38,18 +56,14 @@ def get_languages(path="card_db"):
 
 @functools.lru_cache()
 def get_expansions():
-    set_db_filepath = os.path.join("card_db", "sets_db.json.gz")
-    with resource_handling.get_resource_stream(set_db_filepath) as setfile:
-        set_file = json.loads(setfile.read().decode("utf-8"))
+    set_file = load_json(os.path.join("card_db", "sets_db.json.gz"))
     assert set_file, "Could not load any sets from database"
 
     fan = []
     official = []
     for s in set_file:
         if EXPANSION_EXTRA_POSTFIX not in s:
-            # Make sure these are set either True or False
-            set_file[s]["fan"] = set_file[s].get("fan", False)
-            if set_file[s]["fan"]:
+            if set_file[s].get("fan", False):
                 fan.append(s)
             else:
                 official.append(s)
@@ -60,9 +74,7 @@ def get_expansions():
 
 @functools.lru_cache()
 def get_global_groups():
-    type_db_filepath = os.path.join("card_db", "types_db.json.gz")
-    with resource_handling.get_resource_stream(type_db_filepath) as typefile:
-        type_file = json.loads(typefile.read().decode("utf-8"))
+    type_file = load_json(os.path.join("card_db", "types_db.json.gz"))
     assert type_file, "Could not load any card types from database"
 
     group_global_choices = []
@@ -81,9 +93,9 @@ def get_global_groups():
 def get_types(language=LANGUAGE_DEFAULT):
     # get a list of valid types
     language = language.lower()
-    type_text_filepath = os.path.join("card_db", language, f"types_{language}.json.gz")
-    with resource_handling.get_resource_stream(type_text_filepath) as type_text_file:
-        type_text = json.loads(type_text_file.read().decode("utf-8"))
+    type_text = load_json(
+        os.path.join("card_db", language, f"types_{language}.json.gz")
+    )
     assert type_text, "Could not load type file for %r" % language
 
     types = [x.lower() for x in type_text]
@@ -110,109 +122,283 @@ def get_label_data():
     return label_info, label_keys, label_selections, label_choices
 
 
-def find_index_of_object(lst=None, attributes=None):
-    if lst is None:
-        lst = []
-    if attributes is None:
-        attributes = {}
-    # Returns the index of the first object in lst that matches the given attributes.  Otherwise returns None.
-    # attributes is a dict of key: value pairs.   Object attributes that are lists are checked to have value in them.
-    for i, d in enumerate(lst):
-        # Set match to false just in case there are no attributes.
-        match = False
-        for key, value in attributes.items():
-            # if anything does not match, then break out and start the next one.
-            match = hasattr(d, key)
-            if match:
-                test = getattr(d, key, None)
-                if isinstance(test, list):
-                    match = value in test
-                else:
-                    match = value == test
-            if not match:
-                break
-
-        if match:
-            # If all the attributes are found, then we have a match
-            return i
-
-    # nothing matched
-    return None
-
-
-def read_card_data(options) -> list[Card]:
-    # Read in the card types
-    types_db_filepath = os.path.join("card_db", "types_db.json.gz")
-    with resource_handling.get_resource_stream(types_db_filepath) as typefile:
-        Card.types = json.loads(
-            typefile.read().decode("utf-8"), object_hook=CardType.decode_json
+def get_snapshot_path(path="card_db", language=LANGUAGE_DEFAULT):
+    return os.path.join(path, language, f"card_db_{language}.pickle")
+
+
+def get_snapshot_languages(language=LANGUAGE_DEFAULT):
+    # The languages whose text goes into a snapshot, the default language always does
+    if language == LANGUAGE_DEFAULT:
+        return [LANGUAGE_DEFAULT]
+    return [LANGUAGE_DEFAULT, language]
+
+
+def get_snapshot_sources(path="card_db", language=LANGUAGE_DEFAULT):
+    # The json files that a language's snapshot is made from
+    sources = [
+        os.path.join(path, f"{name}_db.json.gz") for name in ("types", "sets", "cards")
+    ]
+    for lang in get_snapshot_languages(language):
+        for kind in LANGUAGE_TEXT_KINDS:
+            sources.append(os.path.join(path, lang, f"{kind}_{lang}.json.gz"))
+    return sources
+
+
+def get_sources_digest(path="card_db", language=LANGUAGE_DEFAULT):
+    # Hash of the (compressed) json files, used to spot snapshots that are out of date
+    digest = hashlib.sha256()
+    for source in get_snapshot_sources(path, language):
+        digest.update(resource_handling.get_resource_bytes(source))
+    return digest.hexdigest()
+
+
+def make_snapshot(path="card_db", language=LANGUAGE_DEFAULT):
+    # Everything a generation in the given language reads from the card database,
+    # parsed from the json files and joined into a single object
+    return {
+        "version": SNAPSHOT_VERSION,
+        "digest": get_sources_digest(path, language),
+        "types": load_json(os.path.join(path, "types_db.json.gz")),
+        "sets": load_json(os.path.join(path, "sets_db.json.gz")),
+        "cards": load_json(os.path.join(path, "cards_db.json.gz")),
+        "language_text": {
+            (kind, lang): load_json(os.path.join(path, lang, f"{kind}_{lang}.json.gz"))
+            for lang in get_snapshot_languages(language)
+            for kind in LANGUAGE_TEXT_KINDS
+        },
+    }
+
+
+def write_snapshot(f, snapshot):
+    pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_snapshot(f, path="card_db", language=LANGUAGE_DEFAULT):
+    # Returns the snapshot read from f, or None if it is not for the current
+    # snapshot version or the json files have changed since it was made
+    snapshot = pickle.load(f)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        logger.info(f"Ignoring card database snapshot for {language}: old version")
+        return None
+    if snapshot.get("digest") != get_sources_digest(path, language):
+        logger.info(f"Ignoring card database snapshot for {language}: out of date")
+        return None
+    return snapshot
+
+
+def read_snapshot(path="card_db", language=LANGUAGE_DEFAULT):
+    # The language's snapshot if it has been built and is up to date, otherwise None
+    snapshot_path = get_snapshot_path(path, language)
+    if not resource_handling.resource_exists(snapshot_path):
+        return None
+    with resource_handling.get_resource_bytestream(snapshot_path) as f:
+        return load_snapshot(f, path, language)
+
+
+class CardIndex(object):
+    # Lookups of cards by card_tag while the cards are read.
+    # The index has to be told about cards that are added or removed.
+
+    def __init__(self, cards=None):
+        # map from card_tag to the cards with it, in the order they were added
+        self.cards = defaultdict(list)
+        for card in cards or []:
+            self.add(card)
+
+    def add(self, card):
+        self.cards[card.card_tag].append(card)
+
+    def remove(self, card):
+        self.cards[card.card_tag].remove(card)
+
+    def find(self, card_tag):
+        # All the cards with the given card_tag
+        return list(self.cards.get(card_tag, []))
+
+    def byCardTag(self, card_tag):
+        # The first card with the given card_tag, or None
+        cards = self.cards.get(card_tag)
+        return cards[0] if cards else None
+
+
+class CardDatabase(object):
+    # The parsed card database: the card types, the sets (including the generated
+    # "extras" sets) and the raw card records, plus the per-language text overlays.
+    # A CardDatabase is loaded once and never modified.  Each generation works on
+    # its own view(), which holds copies of everything that filtering and drawing
+    # change, so any number of generations can share the same database.
+
+    def __init__(self, types, sets, card_records, path="card_db"):
+        self.path = path
+        self.types = types  # map from the tuple of type names to the CardType
+        self.sets = sets  # map from the set tag to the set entry
+        self.card_records = card_records  # list of the card json entries
+        # map from type name to its text, in the requested language once filtered
+        self.type_names = {}
+        for card_type in types.values():
+            for t in card_type.getTypeNames():
+                self.type_names[t] = t
+        self.bonus_highlighter = (
+            None  # compiled bonus highlighting regex, set when filtering
         )
-    assert Card.types, "Could not load any card types from database"
-
-    # extract unique types
-    type_list = []
-    for c in Card.types:
-        type_list = list(set(c.getTypeNames()) | set(type_list))
-    # set up the basic type translation.  The actual language will be added later.
-    Card.type_names = {}
-    for t in type_list:
-        Card.type_names[t] = t
-
-    # turn Card.types into a dictionary for later
-    Card.types = dict(((c.getTypeNames(), c) for c in Card.types))
-
-    # Read in the card database
-    card_db_filepath = os.path.join("card_db", "cards_db.json.gz")
-    with resource_handling.get_resource_stream(card_db_filepath) as cardfile:
-        cards = json.loads(
-            cardfile.read().decode("utf-8"), object_hook=Card.decode_json
-        )
-    assert cards, "Could not load any cards from database"
-
-    set_db_filepath = os.path.join("card_db", "sets_db.json.gz")
-    with resource_handling.get_resource_stream(set_db_filepath) as setfile:
-        Card.sets = json.loads(setfile.read().decode("utf-8"))
-    assert Card.sets, "Could not load any sets from database"
-    new_sets = {}
-    for s in Card.sets:
-        # Make sure these are set either True or False
-        Card.sets[s]["no_randomizer"] = Card.sets[s].get("no_randomizer", False)
-        Card.sets[s]["fan"] = Card.sets[s].get("fan", False)
-        Card.sets[s]["has_extras"] = Card.sets[s].get("has_extras", True)
-        Card.sets[s]["upgrades"] = Card.sets[s].get("upgrades", None)
-        new_sets[s] = Card.sets[s]
-        # Make an "Extras" set for normal expansions
-        if Card.sets[s]["has_extras"]:
-            e = s + EXPANSION_EXTRA_POSTFIX
-            new_sets[e] = copy.deepcopy(Card.sets[s])
-            new_sets[e]["set_name"] = "*" + s + EXPANSION_EXTRA_POSTFIX + "*"
-            new_sets[e]["no_randomizer"] = True
-            new_sets[e]["has_extras"] = False
-    Card.sets = new_sets
+        self.bonus_highlighters = {}  # map from the languages to their compiled regex
+        self.language_text = {}  # map from (kind, language) to the text overlay
+
+    @staticmethod
+    def load(path="card_db", language=LANGUAGE_DEFAULT):
+        # Use the prebuilt snapshot for the language if there is an up to date one
+        snapshot = read_snapshot(path, language)
+        if snapshot is None:
+            snapshot = make_snapshot(path, language)
+        return CardDatabase.from_snapshot(snapshot, path)
+
+    @staticmethod
+    def from_snapshot(snapshot, path="card_db"):
+        # Read in the card types
+        types = [CardType.decode_json(t) for t in snapshot["types"]]
+        assert types, "Could not load any card types from database"
+        types = dict(((t.getTypeNames(), t) for t in types))
+
+        # Read in the card database
+        card_records = snapshot["cards"]
+        assert card_records, "Could not load any cards from database"
+
+        sets = {}
+        for s, set_data in snapshot["sets"].items():
+            set_data = dict(set_data)
+            # Make sure these are set either True or False
+            set_data["no_randomizer"] = set_data.get("no_randomizer", False)
+            set_data["fan"] = set_data.get("fan", False)
+            set_data["has_extras"] = set_data.get("has_extras", True)
+            set_data["upgrades"] = set_data.get("upgrades", None)
+            sets[s] = set_data
+            # Make an "Extras" set for normal expansions
+            if set_data["has_extras"]:
+                e = s + EXPANSION_EXTRA_POSTFIX
+                sets[e] = dict(set_data)
+                sets[e]["set_name"] = "*" + s + EXPANSION_EXTRA_POSTFIX + "*"
+                sets[e]["no_randomizer"] = True
+                sets[e]["has_extras"] = False
+        assert sets, "Could not load any sets from database"
+
+        card_db = CardDatabase(types, sets, card_records, path)
+        card_db.language_text.update(snapshot["language_text"])
+        return card_db
+
+    def view(self):
+        # A copy for a single generation.  The card types, card records and language
+        # text and bonus regexes are shared, the set entries and type names are its own.
+        card_db = copy.copy(self)
+        card_db.sets = {s: dict(set_data) for s, set_data in self.sets.items()}
+        card_db.type_names = dict(self.type_names)
+        return card_db
+
+    def __deepcopy__(self, memo):
+        # Cards refer to the database they were read from; copies of a card share it.
+        return self
+
+    def get_language_text(self, kind, language=LANGUAGE_DEFAULT):
+        # The text overlay of the given kind, one of LANGUAGE_TEXT_KINDS
+        language = language.lower()
+        key = (kind, language)
+        if key not in self.language_text:
+            self.language_text[key] = load_json(
+                os.path.join(self.path, language, f"{kind}_{language}.json.gz")
+            )
+        return self.language_text[key]
+
+    def get_bonus_highlighter(self, languages):
+        # The compiled regex matching the bonus keywords of all the given languages.
+        # It is built once per database and shared by its views.
+        languages = tuple(language.lower() for language in languages)
+        if languages not in self.bonus_highlighters:
+            regexes = []
+            for language in languages:
+                bonus = self.get_language_text("bonuses", language)
+                assert bonus, "Could not load bonus keywords for %r" % language
+                regex = get_bonus_regex(bonus)
+                if regex:
+                    regexes.append(regex)
+            # All of the bonuses start with "+<number>", so that part is shared, which
+            # lets the search skip ahead to the next "+".
+            # (?!\<\/b\>) prevents matching already bolded items
+            self.bonus_highlighters[languages] = (
+                re.compile(
+                    r"\+\s*\d+\s*(?:" + "|".join(regexes) + r")(?!\<\/b\>)",
+                    re.IGNORECASE,
+                )
+                if regexes
+                else None
+            )
+        return self.bonus_highlighters[languages]
+
+
+def get_bonus_regex(bonus):
+    # The regex matching the bonus keywords (after the "+<number>") to be highlighted,
+    # or None if there are none
+
+    # Make sure have minimum to to anything
+    if not isinstance(bonus, dict) or not bonus.get("include"):
+        return None
+
+    # (?!\w) prevents smaller word matches.  Prevents matching "Action" in "Actions"
+    exclude = sorted(bonus.get("exclude", []), reverse=True)
+    if exclude:
+        exclude_regex = r"(?!\w)(?!\s*(?:" + "|".join(exclude) + "))"
+    else:
+        exclude_regex = ""
+
+    include = sorted(bonus["include"], reverse=True)
+    return r"(?:" + "|".join(include) + ")" + exclude_regex
+
+
+@functools.lru_cache()
+def get_card_database(path="card_db", language=LANGUAGE_DEFAULT) -> CardDatabase:
+    return CardDatabase.load(path, language.lower())
+
+
+def read_card_data(options, card_db=None) -> list[Card]:
+    # Returns the cards for a generation.  They refer to card_db, which must be a view
+    # for this generation only, since it is changed while filtering and drawing.
+    # Without one, a new view of the default database is used.
+    if card_db is None:
+        card_db = get_card_database(language=options.language).view()
+
+    cards = [Card.decode_json(c, card_db) for c in card_db.card_records]
+    index = CardIndex(cards)
+
+    def remove_card(card):
+        cards.remove(card)
+        index.remove(card)
+
+    def add_card(card):
+        cards.append(card)
+        index.add(card)
 
     # Remove the Trash card. Do early before propagating to various sets.
     if options.no_trash:
-        i = find_index_of_object(cards, {"card_tag": "Trash"})
-        if i is not None:
-            del cards[i]
+        trash = index.byCardTag("Trash")
+        if trash is not None:
+            remove_card(trash)
 
     # Repackage Curse cards into 10 per divider. Do early before propagating to various sets.
     if options.curse10:
-        i = find_index_of_object(cards, {"card_tag": "Curse"})
-        if i is not None:
+        curse = index.byCardTag("Curse")
+        if curse is not None:
             new_cards = []
-            cards_remaining = cards[i].getCardCount()
+            cards_remaining = curse.getCardCount()
             while cards_remaining > 10:
                 # make a new copy of the card and set count to 10
-                new_card = copy.deepcopy(cards[i])
+                new_card = curse.variant()
                 new_card.setCardCount(10)
                 new_cards.append(new_card)
                 cards_remaining -= 10
 
             # Adjust original Curse card to the remaining cards (should be 10)
-            cards[i].setCardCount(cards_remaining)
+            curse.setCardCount(cards_remaining)
             # Add the new dividers
-            cards.extend(new_cards)
+            for new_card in new_cards:
+                add_card(new_card)
 
     # Add any blank cards
     if options.include_blanks > 0:
@@ -224,24 +410,25 @@ def read_card_data(options) -> list[Card]:
                 cardset_tags=[config_options.EXPANSION_GLOBAL_GROUP],
                 randomizer=False,
                 types=("Blank",),
+                card_db=card_db,
             )
-            cards.append(c)
+            add_card(c)
 
     # Create Start Deck dividers. 4 sets. Adjust totals for other cards, too.
     # Do early before propagating to various sets.
     # The card database contains one prototype divider that needs to be either duplicated or deleted.
+    start_deck = index.byCardTag("Start Deck")
     if options.start_decks:
-        # Find the index to the individual cards that need changed in the cards list
-        StartDeck_index = find_index_of_object(cards, {"card_tag": "Start Deck"})
-        Copper_index = find_index_of_object(cards, {"card_tag": "Copper"})
-        Estate_index = find_index_of_object(cards, {"card_tag": "Estate"})
-        if Copper_index is None or Estate_index is None or StartDeck_index is None:
+        # Find the individual cards that need changed in the cards list
+        copper = index.byCardTag("Copper")
+        estate = index.byCardTag("Estate")
+        if copper is None or estate is None or start_deck is None:
             # Something is wrong, can't find one or more of the cards that need to change
             logger.warning("Cannot create Start Decks")
 
             # Remove the Start Deck prototype if we can
-            if StartDeck_index is not None:
-                del cards[StartDeck_index]
+            if start_deck is not None:
+                remove_card(start_deck)
         else:
             # Start Deck Constants
             STARTDECK_COPPERS = 7
@@ -249,29 +436,23 @@ def read_card_data(options) -> list[Card]:
             STARTDECK_NUMBER = 4
 
             # Add correct card counts to Start Deck prototype.  This will be used to make copies.
-            cards[StartDeck_index].setCardCount(STARTDECK_COPPERS)
-            cards[StartDeck_index].mergeCardCount([int(STARTDECK_ESTATES)])
+            start_deck.setCardCount(STARTDECK_COPPERS)
+            start_deck.mergeCardCount([int(STARTDECK_ESTATES)])
 
             # Make new Start Deck Dividers and adjust the corresponding card counts
             for x in range(0, STARTDECK_NUMBER):
                 # Add extra copies of the Start Deck prototype.
                 # But don't need to add the first one again, since the prototype is already there.
                 if x > 0:
-                    cards.append(copy.deepcopy(cards[StartDeck_index]))
-                    # Note: By appending, it should not change any of the index values being used
+                    add_card(start_deck.variant())
 
                 # Remove Copper and Estate card counts from their dividers
-                cards[Copper_index].setCardCount(
-                    cards[Copper_index].getCardCount() - STARTDECK_COPPERS
-                )
-                cards[Estate_index].setCardCount(
-                    cards[Estate_index].getCardCount() - STARTDECK_ESTATES
-                )
+                copper.setCardCount(copper.getCardCount() - STARTDECK_COPPERS)
+                estate.setCardCount(estate.getCardCount() - STARTDECK_ESTATES)
     else:
         # Remove Start Deck prototype.  It is not needed.
-        StartDeck_index = find_index_of_object(cards, {"card_tag": "Start Deck"})
-        if StartDeck_index is not None:
-            del cards[StartDeck_index]
+        if start_deck is not None:
+            remove_card(start_deck)
 
     # Set cardset_tag and expand cards that are used in multiple sets
     new_cards = []
@@ -284,9 +465,7 @@ def read_card_data(options) -> list[Card]:
             for s in sets:
                 # for the rest, create a copy of the first
                 if s:
-                    new_card = copy.deepcopy(card)
-                    new_card.cardset_tag = s
-                    new_cards.append(new_card)
+                    new_cards.append(card.variant(cardset_tag=s))
     cards = new_cards
 
     # Make sure each card has the right image file.
@@ -1,22 +1,62 @@
+import collections
+import copy
 import functools
+import io
+import json
 import numbers
-import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 from loguru import logger
-from PIL import Image, ImageEnhance
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import cm
-from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.pdfmetrics import stringWidth
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Paragraph, XPreformatted
-
-from . import resource_handling
-from .cards import Card
+from reportlab.platypus import XPreformatted
+
+from . import (
+    fonts,
+    images,
+    markup,
+    output_cache,
+    page_cache,
+    profiling,
+    resource_handling,
+    textfit,
+)
+from .artwork import get_artwork
+
+try:
+    from pypdf import PdfReader, PdfWriter
+
+    have_pypdf = True
+except ImportError:
+    have_pypdf = False
+
+# The worker processes of DividerDrawer.encodeInParallel, kept for the next drawing
+# so they don't have to load the card database, fonts and images again
+pool = None
+poolSize = 0
+poolLock = threading.Lock()
+
+
+def getPool(jobs):
+    # The process pool, started (again) if it has fewer than jobs processes
+    global pool, poolSize
+    with poolLock:
+        if pool is None or poolSize < jobs:
+            if pool is not None:
+                pool.shutdown()
+            pool = ProcessPoolExecutor(max_workers=jobs)
+            poolSize = jobs
+        return pool
+
+
+def stringWidth(text, fontName, fontSize):
+    # pdfmetrics.stringWidth, counted in the profile
+    profiling.count("string_widths")
+    return pdfmetrics.stringWidth(text, fontName, fontSize)
 
 
 def split(seq, n):
@@ -43,82 +83,37 @@ class CardPlot(object):
     # This object contains information needed to print a divider on a page.
     # It goes beyond information about the general card/divider to include page specific drawing information.
     # It also includes helpful methods used in manipulating the object and keeping up with tab locations.
+    # There is one of these for every divider, so they keep their attributes in slots.
 
     LEFT, CENTRE, RIGHT, TOP, BOTTOM = range(
         100, 105
     )  # location & directional constants
 
-    tabNumber = 1  # Number of different tab locations
-    tabIncrement = 0  # Either 1, 0, or -1.  Used to select next tab. This can change if tabSerpentine.
-    tabIncrementStart = 0  # Starting value of tabIncrement
-    tabStart = 1  # The starting tab location.
-    tabStartSide = LEFT  # The starting side for the tabs
-    tabSerpentine = False  # What to do at the end of a line of tabs.  False = start over.  True = reverses direction.
-    lineType = "line"  # Type of outline to use: line, dot, none
-    cardWidth = (
-        0  # Width of just the divider, with no extra padding/spacing. NEEDS TO BE SET.
+    __slots__ = (
+        "card",
+        "layout",
+        "x",
+        "y",
+        "rotation",
+        "stackHeight",
+        "tabIndex",
+        "tabIndexBack",
+        "tabNumber",
+        "tabWidth",
+        "tabOffset",
+        "tabOffsetBack",
+        "closestSide",
+        "page",
+        "textTypeFront",
+        "textTypeBack",
+        "cropOnTop",
+        "cropOnBottom",
+        "cropOnLeft",
+        "cropOnRight",
+        "notchWidth",
+        "notchHeight",
+        "options",
     )
-    cardHeight = 0  # Height of just the divider, with no extra padding/spacing or tab. NEEDS TO BE SET.
-    tabWidth = 0  # Width of the tab.  NEEDS TO BE SET.
-    tabHeight = 0  # Height of the tab. NEEDS TO BE SET.
-    wrapper = False  # If the divider is a sleeve/wrapper.
-
-    @staticmethod
-    def tabSetup(
-        tabNumber=None,
-        cardWidth=None,
-        cardHeight=None,
-        tabWidth=None,
-        tabHeight=None,
-        lineType=None,
-        start=None,
-        serpentine=None,
-        wrapper=None,
-    ):
-        # Set up the basic tab information used in calculations when a new CardPlot object is created.
-        # This needs to be called at least once before the first CardPlot object is created and then it
-        # needs to be called any time one of the above parameters needs to change.
-        CardPlot.tabNumber = tabNumber if tabNumber is not None else CardPlot.tabNumber
-        CardPlot.cardWidth = cardWidth if cardWidth is not None else CardPlot.cardWidth
-        CardPlot.cardHeight = (
-            cardHeight if cardHeight is not None else CardPlot.cardHeight
-        )
-        CardPlot.tabWidth = tabWidth if tabWidth is not None else CardPlot.tabWidth
-        CardPlot.tabHeight = tabHeight if tabHeight is not None else CardPlot.tabHeight
-        CardPlot.lineType = lineType if lineType is not None else CardPlot.lineType
-        CardPlot.tabStartSide = start if start is not None else CardPlot.tabStartSide
-        CardPlot.tabSerpentine = (
-            serpentine if serpentine is not None else CardPlot.tabSerpentine
-        )
-        CardPlot.wrapper = wrapper if wrapper is not None else CardPlot.wrapper
-        # LEFT        tabs        RIGHT
-        # +---+ +---+ +---+ +---+ +---+
-        # | 1 | | 2 | | 3 | |...| | N |   Note: tabNumber = N, N >=1, 0 is for centred tabs
-        # +   +-+   +-+   +-+   +-+   +
-
-        # Setup first tab as well as starting point and direction of increment for tabs.
-        if CardPlot.tabStartSide == CardPlot.RIGHT:
-            CardPlot.tabStart = CardPlot.tabNumber
-            CardPlot.tabIncrementStart = -1
-        elif CardPlot.tabStartSide == CardPlot.CENTRE:
-            # Get as close to centre as possible
-            CardPlot.tabStart = (CardPlot.tabNumber + 1) // 2
-            CardPlot.tabIncrementStart = 1
-        else:
-            # LEFT and anything else
-            CardPlot.tabStartSide = CardPlot.LEFT
-            CardPlot.tabStart = 1
-            CardPlot.tabIncrementStart = 1
-
-        if CardPlot.tabNumber == 1:
-            CardPlot.tabIncrementStart = 0
-        CardPlot.tabIncrement = CardPlot.tabIncrementStart
-
-    @staticmethod
-    def tabRestart():
-        # Resets the tabIncrement to the starting value and returns the starting tabIndex number.
-        CardPlot.tabIncrement = CardPlot.tabIncrementStart
-        return CardPlot.tabStart
 
     def __init__(
         self,
@@ -136,15 +131,19 @@ class CardPlot(object):
         cropOnLeft=False,
         cropOnRight=False,
         options=None,
+        layout=None,
     ):
         self.card = card
+        self.layout = layout if layout is not None else TabLayout()  # the tab setup
         self.x = x  # x location of the lower left corner of the card on the page
         self.y = y  # y location of the lower left corner of the card on the page
         self.rotation = rotation  # of the card. 0, 90, 180, 270
         self.stackHeight = (
             stackHeight  # The height of a stack of these cards. Used for interleaving.
         )
-        self.tabIndex = tabIndex  # Tab location index.  Starts at 1 and goes up to CardPlot.tabNumber
+        self.tabIndex = (
+            tabIndex  # Tab location index.  Starts at 1 and goes up to layout.tabNumber
+        )
         self.page = page  # holds page number of this printed card
         self.textTypeFront = (
             textTypeFront  # What card text to put on the front of the divider
@@ -157,18 +156,24 @@ class CardPlot(object):
         self.cropOnLeft = cropOnLeft  # When true, cropmarks needed along LEFT *printed* edge of the card
         self.cropOnRight = cropOnRight  # When true, cropmarks needed along RIGHT *printed* edge of the card
         self.options = options  # other script options
+        # The tab size and count of the layout, unless this divider has a tab of its own
+        layout = self.layout
+        self.tabNumber = layout.tabNumber
+        self.tabWidth = layout.tabWidth
+        # Set while drawing
+        self.notchWidth = self.notchHeight = 0
 
         # And figure out the backside index
         if self.tabIndex == 0:
             self.tabIndexBack = (
                 0  # Exact Centre special case, so swapping is still exact centre
             )
-        elif CardPlot.tabNumber == 1:
+        elif layout.tabNumber == 1:
             self.tabIndex = self.tabIndexBack = (
                 1  # There is only one tab, so can only use 1 for both sides
             )
-        elif 1 <= self.tabIndex <= CardPlot.tabNumber:
-            self.tabIndexBack = CardPlot.tabNumber + 1 - self.tabIndex
+        elif 1 <= self.tabIndex <= layout.tabNumber:
+            self.tabIndexBack = layout.tabNumber + 1 - self.tabIndex
         else:
             # For anything else, just start at 1
             self.tabIndex = self.tabIndexBack = 1
@@ -177,39 +182,79 @@ class CardPlot(object):
         if self.tabIndex == 0:
             # Special case for centred tabs
             self.tabOffset = self.tabOffsetBack = (
-                CardPlot.cardWidth - CardPlot.tabWidth
+                layout.cardWidth - layout.tabWidth
             ) / 2
             self.closestSide = CardPlot.CENTRE
-        elif CardPlot.tabNumber <= 1:
+        elif layout.tabNumber <= 1:
             # If just one tab, then can be right, centre, or left
-            self.closestSide = CardPlot.tabStartSide
-            if CardPlot.tabStartSide == CardPlot.RIGHT:
-                self.tabOffset = CardPlot.cardWidth - CardPlot.tabWidth
+            self.closestSide = layout.tabStartSide
+            if layout.tabStartSide == CardPlot.RIGHT:
+                self.tabOffset = layout.cardWidth - layout.tabWidth
                 self.tabOffsetBack = 0
-            elif CardPlot.tabStartSide == CardPlot.CENTRE:
-                self.tabOffset = (CardPlot.cardWidth - CardPlot.tabWidth) / 2
-                self.tabOffsetBack = (CardPlot.cardWidth - CardPlot.tabWidth) / 2
+            elif layout.tabStartSide == CardPlot.CENTRE:
+                self.tabOffset = (layout.cardWidth - layout.tabWidth) / 2
+                self.tabOffsetBack = (layout.cardWidth - layout.tabWidth) / 2
             else:
                 # LEFT and anything else
                 self.tabOffset = 0
-                self.tabOffsetBack = CardPlot.cardWidth - CardPlot.tabWidth
+                self.tabOffsetBack = layout.cardWidth - layout.tabWidth
         else:
             # More than 1 tabs
             self.tabOffset = (self.tabIndex - 1) * (
-                (CardPlot.cardWidth - CardPlot.tabWidth) / (CardPlot.tabNumber - 1)
+                (layout.cardWidth - layout.tabWidth) / (layout.tabNumber - 1)
             )
-            self.tabOffsetBack = CardPlot.cardWidth - CardPlot.tabWidth - self.tabOffset
+            self.tabOffsetBack = layout.cardWidth - layout.tabWidth - self.tabOffset
 
             # Set  which edge is closest to the tab
-            if self.tabIndex <= CardPlot.tabNumber / 2:
+            if self.tabIndex <= layout.tabNumber / 2:
                 self.closestSide = CardPlot.LEFT
             else:
                 self.closestSide = (
                     CardPlot.RIGHT
-                    if self.tabIndex > (CardPlot.tabNumber + 1) / 2
+                    if self.tabIndex > (layout.tabNumber + 1) / 2
                     else CardPlot.CENTRE
                 )
 
+    # The divider size, outline and kind are the same for the whole layout
+    @property
+    def cardWidth(self):
+        return self.layout.cardWidth
+
+    @property
+    def cardHeight(self):
+        return self.layout.cardHeight
+
+    @property
+    def tabHeight(self):
+        return self.layout.tabHeight
+
+    @property
+    def lineType(self):
+        return self.layout.lineType
+
+    @property
+    def wrapper(self):
+        return self.layout.wrapper
+
+    # The attributes that don't change how the divider is drawn: the page number,
+    # the TabLayout (whose tab sequence state is only used while laying out), the
+    # options, which are the same for the whole document, and the notch sizes,
+    # which drawing the outline works out from the rest
+    UNDRAWN_ATTRIBUTES = ("page", "layout", "options", "notchWidth", "notchHeight")
+
+    def getDrawnAttributes(self):
+        # {name: value} of everything drawing the divider depends on, besides the options:
+        # its card, tab, text types, place and cropmarks, and the size, outline and
+        # kind of divider from its layout
+        values = {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in self.UNDRAWN_ATTRIBUTES and hasattr(self, name)
+        }
+        for name in ["cardWidth", "cardHeight", "tabHeight", "lineType", "wrapper"]:
+            values[name] = getattr(self, name)
+        return values
+
     def setXY(self, x, y, rotation=None):
         # set the card to the given x,y and optional rotation
         self.x = x
@@ -230,25 +275,7 @@ class CardPlot(object):
 
     def nextTab(self, tab=None):
         # For a given tab, calculate the next tab in the sequence
-        tab = tab if tab is not None else self.tabIndex
-        if CardPlot.tabNumber == 1:
-            return 1  # it is the same, nothing else to do
-
-        # Increment if in range
-        if 1 <= tab <= CardPlot.tabNumber:
-            tab += CardPlot.tabIncrement
-
-        # Now check for wrap around
-        if tab > CardPlot.tabNumber:
-            tab = 1
-        elif tab < 1:
-            tab = CardPlot.tabNumber
-
-        if CardPlot.tabSerpentine and CardPlot.tabNumber > 2:
-            if (tab == 1) or (tab == CardPlot.tabNumber):
-                # reverse direction for next tab
-                CardPlot.tabIncrement *= -1
-        return tab
+        return self.layout.nextTab(tab if tab is not None else self.tabIndex)
 
     def getClosestSide(self, backside=False):
         # Get the closest side for this tab.
@@ -362,6 +389,107 @@ class CardPlot(object):
             return False  # just in case
 
 
+class TabLayout(object):
+    # The tab setup of a layout, shared by its CardPlots: the number of tab locations,
+    # where they start and which way the next tab goes, and the size of the dividers
+    # and their tabs.  Each layout has its own, so any number of them can be
+    # calculated at the same time.
+
+    __slots__ = (
+        "tabNumber",
+        "tabIncrement",
+        "tabIncrementStart",
+        "tabStart",
+        "tabStartSide",
+        "tabSerpentine",
+        "lineType",
+        "cardWidth",
+        "cardHeight",
+        "tabWidth",
+        "tabHeight",
+        "wrapper",
+    )
+
+    def __init__(
+        self,
+        tabNumber=1,
+        cardWidth=0,
+        cardHeight=0,
+        tabWidth=0,
+        tabHeight=0,
+        lineType="line",
+        start=CardPlot.LEFT,
+        serpentine=False,
+        wrapper=False,
+    ):
+        self.tabNumber = tabNumber  # Number of different tab locations
+        self.cardWidth = (
+            cardWidth  # Width of just the divider, with no extra padding/spacing.
+        )
+        self.cardHeight = cardHeight  # Height of just the divider, with no extra padding/spacing or tab.
+        self.tabWidth = tabWidth  # Width of the tab.
+        self.tabHeight = tabHeight  # Height of the tab.
+        self.lineType = lineType  # Type of outline to use: line, dot, none
+        self.tabStartSide = start  # The starting side for the tabs
+        self.tabSerpentine = serpentine  # What to do at the end of a line of tabs.  False = start over.  True = reverses direction.
+        self.wrapper = wrapper  # If the divider is a sleeve/wrapper.
+        self.setup()
+
+    def setup(self, tabNumber=None):
+        # Set up the starting tab and the direction of increment for the tabs.
+        # Needs to be called again whenever the number of tabs changes.
+        if tabNumber is not None:
+            self.tabNumber = tabNumber
+        # LEFT        tabs        RIGHT
+        # +---+ +---+ +---+ +---+ +---+
+        # | 1 | | 2 | | 3 | |...| | N |   Note: tabNumber = N, N >=1, 0 is for centred tabs
+        # +   +-+   +-+   +-+   +-+   +
+
+        # Setup first tab as well as starting point and direction of increment for tabs.
+        if self.tabStartSide == CardPlot.RIGHT:
+            self.tabStart = self.tabNumber
+            self.tabIncrementStart = -1
+        elif self.tabStartSide == CardPlot.CENTRE:
+            # Get as close to centre as possible
+            self.tabStart = (self.tabNumber + 1) // 2
+            self.tabIncrementStart = 1
+        else:
+            # LEFT and anything else
+            self.tabStartSide = CardPlot.LEFT
+            self.tabStart = 1
+            self.tabIncrementStart = 1
+
+        if self.tabNumber == 1:
+            self.tabIncrementStart = 0
+        self.tabIncrement = self.tabIncrementStart
+
+    def restart(self):
+        # Resets the tabIncrement to the starting value and returns the starting tabIndex number.
+        self.tabIncrement = self.tabIncrementStart
+        return self.tabStart
+
+    def nextTab(self, tab):
+        # For a given tab, calculate the next tab in the sequence
+        if self.tabNumber == 1:
+            return 1  # it is the same, nothing else to do
+
+        # Increment if in range
+        if 1 <= tab <= self.tabNumber:
+            tab += self.tabIncrement
+
+        # Now check for wrap around
+        if tab > self.tabNumber:
+            tab = 1
+        elif tab < 1:
+            tab = self.tabNumber
+
+        if self.tabSerpentine and self.tabNumber > 2:
+            if (tab == 1) or (tab == self.tabNumber):
+                # reverse direction for next tab
+                self.tabIncrement *= -1
+        return tab
+
+
 class Plotter(object):
     # Creates a simple plotting object that goes from point to point.
     # This makes outline drawing easier since calculations only need to be the delta from
@@ -475,10 +603,18 @@ class DividerDrawer(object):
     LABEL_HEIGHT = 0.9 * cm
     SET_ICON_SIZE = 10
 
-    def __init__(self, options=None):
+    def __init__(self, options=None, card_db=None):
         self.canvas = None
         self.pages = None
+        # With --divider-forms: (item, isBack) -> fingerprint of the sides that come up
+        # more than once, and fingerprint -> name of the form drawn for it
+        self.dividerKeys = None
+        self.dividerForms = None
+        # and outline shape -> name of the form drawn for the outlines that come up
+        # more than once
+        self.outlineForms = None
         self.options = options
+        self.card_db = card_db  # the database view the cards were read with
 
     def draw(self, cards=None, options=None):
         if cards is None:
@@ -486,226 +622,43 @@ class DividerDrawer(object):
         if options is not None:
             self.options = options
 
-        self.registerFonts()
-        self.canvas = canvas.Canvas(
+        if self.options.jobs > 1 and not self.options.preview:
+            self.encodeInParallel(cards)
+        if self.options.incremental and not self.options.preview:
+            if have_pypdf:
+                self.drawIncremental(cards)
+                return
+            logger.warning(
+                "The pypdf package is needed for --incremental, drawing every page"
+            )
+
+        with profiling.phase("register_fonts"):
+            self.registerFonts()
+        self.canvas = self.createCanvas()
+        with profiling.phase("draw_dividers"):
+            self.drawDividers(cards)
+        # The preview only shows the first page, never the info pages
+        if (self.options.info or self.options.info_all) and not self.options.preview:
+            with profiling.phase("draw_info"):
+                self.drawInfo()
+        with profiling.phase("save"):
+            self.canvas.save()
+
+    def createCanvas(self):
+        canvas = images.ImageCachingCanvas(
             self.options.outfile,
             pagesize=(self.options.paperwidth, self.options.paperheight),
+            cache_dir=self.options.image_cache_dir,
         )
-        self.drawDividers(cards)
-        if self.options.info or self.options.info_all:
-            self.drawInfo()
-        self.canvas.save()
+        if self.options.font_subset_cache:
+            fonts.use_subset_cache(canvas)
+        return canvas
 
     def registerFonts(self):
-        # Fonts used in Dominion:
-        # TrajanPro-Bold        card titles and types
-        # MinionStd-Black       numbers on base cards & icons
-        # Times-Roman           rules text*
-        # Times-Bold            bold rules text
-        # Times-Italic          italic rules text
-        # Helvetica-Bold        superscript + in some card costs
-        # CharlemagneStd-Bold   expansion names on box art
-        # Capitals              player mat banners
-        # Barbedor-Bold         player mat rules
-
-        # * the cards mostly use Times New Roman rather than Times Roman, but they're
-        #   not totally consistent, and the differences are very subtle
-
-        # Common filenames used by Adobe Reader and Creative Cloud, as well as
-        # alternatives available from free sites like fontsgeek:
-        fontfilenames = {
-            "TrajanPro-Bold": [
-                "TrajanPro-Bold.ttf",
-                "TrajanPro3-Semibold.ttf",
-                "Trajan Pro Bold.ttf",
-            ],
-            "MinionStd-Black": [
-                "MinionStd-Black.ttf",
-                "Minion Std Black.ttf",
-            ],
-            "CharlemagneStd-Bold": [
-                "CharlemagneStd-Bold.ttf",
-                "Charlemagne Std Bold.ttf",
-            ],
-            "MinionPro-Regular": [
-                "MinionPro-Regular.ttf",
-                "Minion Pro Regular.ttf",
-            ],
-            "MinionPro-Bold": [
-                "MinionPro-Bold.ttf",
-                "Minion Pro Bold.ttf",
-            ],
-            "MinionPro-Italic": [
-                "MinionPro-Italic.ttf",
-                "MinionPro-It.ttf",
-                "Minion Pro Italic.ttf",
-            ],
-            # Built-in fonts
-            "Times-Roman": None,
-            "Times-Bold": None,
-            "Times-Italic": None,
-            "Helvetica-Bold": None,
-            "Courier": None,
-        }
-
-        # ReportLab only supports ISO-8859-1 (Latin1) encoding. Only certain languages are supported. For other
-        # languages TTF fonts must be loaded instead. Not great, consider switching to TTF fonts for all languages...
-        langlatin1 = True
-        if self.options.language not in ("de", "en_us", "es", "fr", "it", "nl_du"):
-            langlatin1 = False
-            fontfilenames.update(
-                {"Times-Roman-TTF": ["Times-Roman.ttf", "Times Roman.ttf"]}
-            )
-            fontfilenames.update(
-                {"Times-Bold-TTF": ["Times-Roman-Bold.ttf", "Times Roman Bold.ttf"]}
-            )
-            fontfilenames.update(
-                {
-                    "Times-Italic-TTF": [
-                        "Times-Roman-Italic.ttf",
-                        "Times Roman Italic.ttf",
-                    ]
-                }
-            )
-
-        # Locate the files in package data, if present
-        fontpaths = {}
-        for font, filenames in fontfilenames.items():
-            if filenames is None:  # built-ins
-                fontpaths[font] = None
-                continue
-            for fname in filenames:
-                if self.options is not None and self.options.font_dir:
-                    fpath = os.path.join(self.options.font_dir, fname)
-                    if os.path.exists(fpath):
-                        fontpaths[font] = (fpath, True)
-                        break
-                fpath = os.path.join("fonts", fname)
-                if resource_handling.resource_exists(fpath):
-                    fontpaths[font] = (fpath, False)
-                    break
-        logger.trace(fontpaths)
-        # Mark the built-in files as pre-registered
-        registered = {
-            font: None for font, fontpath in fontpaths.items() if fontpath is None
-        }
-
-        # Check if *all three* Times Roman TTF fonts have been found and register them. If not -> remove all three
-        # from the paths list
-        timesTTFs = set(["Times-Roman-TTF", "Times-Bold-TTF", "Times-Italic-TTF"])
-        timesTTF_not_found = timesTTFs - set(fontpaths)
-
-        if not langlatin1 and not timesTTF_not_found:
-            # Register Times Roman TTF as font family. Necessary for <b> and <i> attributes to work in Platypus!
-            pdfmetrics.registerFontFamily(
-                "Times-Roman-TTF",
-                normal="Times-Roman-TTF",
-                bold="Times-Bold-TTF",
-                italic="Times-Italic-TTF",
-            )
-        else:
-            if not langlatin1:
-                logger.warning(
-                    f"Non-Latin1 language requested ({self.options.language}) "
-                    "but Times TTF font files not provided (black boxes may appear). "
-                    f"missing fonts: {timesTTF_not_found}"
-                )
-            for fontname in timesTTFs:
-                fontpaths.pop(fontname, None)
-
-        # Determine the best matching fonts for each font type.
-        fontprefs = {
-            "Name": [  # card names & types
-                "TrajanPro-Bold",
-                "MinionPro-Regular",
-                (
-                    "Times-Roman"
-                    if langlatin1 or timesTTF_not_found
-                    else "Times-Roman-TTF"
-                ),
-            ],
-            "Expansion": [  # expansion names
-                "CharlemagneStd-Bold",
-                "TrajanPro-Bold",
-                "MinionPro-Regular",
-                (
-                    "Times-Roman"
-                    if langlatin1 or timesTTF_not_found
-                    else "Times-Roman-TTF"
-                ),
-            ],
-            "Cost": [  # card costs (coins, debt, etc)
-                "MinionStd-Black",
-                "MinionPro-Bold",
-                "Times-Bold" if langlatin1 or timesTTF_not_found else "Times-Bold-TTF",
-            ],
-            "PlusCost": [  # card cost superscript "+" modifiers
-                "Helvetica-Bold",
-            ],
-            "Regular": [  # regular text
-                "MinionPro-Regular",
-                (
-                    "Times-Roman"
-                    if langlatin1 or timesTTF_not_found
-                    else "Times-Roman-TTF"
-                ),
-            ],
-            "Bold": [  # miscellaneous bold text
-                "MinionPro-Bold",
-                "Times-Bold" if langlatin1 or timesTTF_not_found else "Times-Bold-TTF",
-            ],
-            "Italic": [  # for --use-set-text-icon
-                "MinionPro-Italic",
-                (
-                    "Times-Italic"
-                    if langlatin1 or timesTTF_not_found
-                    else "Times-Italic-TTF"
-                ),
-            ],
-            "Rules": [
-                (
-                    "Times-Roman"
-                    if langlatin1 or timesTTF_not_found
-                    else "Times-Roman-TTF"
-                ),
-            ],
-            "Monospaced": [
-                "Courier",
-            ],
-            "Arrow": [  # The custom fonts don't have the → character used for e.g. traveller card groups
-                (
-                    "Times-Bold"
-                    if langlatin1 or timesTTF_not_found
-                    else "Times-Bold-TTF"
-                ),
-            ],
-        }
-        self.fontStyle = {
-            # select the first matching preference for each font type
-            style: [font for font in prefs if font in fontpaths][0]
-            for style, prefs in fontprefs.items()
-        }
-        for style, font in self.fontStyle.items():
-            best = fontprefs[style][0]
-            if font != best:
-                logger.warning(
-                    f"Font {best} missing from font dirs; using {font} instead."
-                )
-            if font in registered:
-                continue
-            fontpath, is_local = fontpaths[font]
-            logger.trace(f"Registering {font} = {fontpath}")
-            pdfmetrics.registerFont(
-                TTFont(
-                    font,
-                    (
-                        fontpath
-                        if is_local
-                        else resource_handling.get_resource_filepath(fontpath)
-                    ),
-                )
-            )
-            registered[font] = fontpath
+        # The fonts are found and parsed once per process, see fonts.py
+        self.fontStyle = fonts.get_font_style(
+            self.options.font_dir, self.options.language
+        )
 
     def drawTextPages(self, pages, margin=1.0, fontsize=10, leading=10, spacer=0.05):
         s = getSampleStyleSheet()["BodyText"]
@@ -729,6 +682,7 @@ class DividerDrawer(object):
                 h = (len(text) - 1) * spacerHeight
                 for line in text:
                     p = XPreformatted(line, s)
+                    profiling.count("paragraphs")
                     h += p.wrap(textBoxWidth, textBoxHeight)[1]
                     paragraphs.append(p)
 
@@ -745,6 +699,89 @@ class DividerDrawer(object):
                 p.drawOn(self.canvas, textHorizontalMargin, h)
                 h -= spacerHeight
             self.canvas.showPage()
+            profiling.count("pages_shown")
+
+    def getPages(self, cards):
+        # The pages to draw, as limited by --num-pages
+        if not self.pages:
+            with profiling.phase("calculate_pages"):
+                self.calculatePages(cards)
+        if self.options.num_pages > 0:
+            return self.pages[: self.options.num_pages]
+        return self.pages
+
+    def splitPages(self, cards, chunkSize):
+        # Split the pages into chunks of chunkSize sheets that can each be drawn into a PDF
+        # of their own. Returns a list of (options, pages) for drawPages, one for each chunk.
+        # The info pages are drawn with the last chunk.
+        pages = self.getPages(cards)
+        chunks = [
+            pages[i : i + chunkSize] for i in range(0, len(pages), chunkSize)
+        ] or [[]]
+
+        parts = []
+        for i, chunk in enumerate(chunks):
+            options = copy.copy(self.options)
+            options.outfile = None
+            options.num_pages = -1
+            options.jobs = 1
+            options.incremental = False
+            if i + 1 < len(chunks):
+                options.info = options.info_all = False
+            parts.append((options, chunk))
+        return parts
+
+    def drawChunks(self, cards, chunkSize):
+        # Draw the pages chunkSize sheets at a time, yielding each chunk as a PDF of its own
+        # as soon as it is drawn, so only one chunk is held in memory at a time.
+        for options, pages in self.splitPages(cards, chunkSize):
+            with profiling.phase("draw_chunk"):
+                chunk = drawPages(options, self.card_db, pages)
+            yield chunk
+
+    def encodeInParallel(self, cards):
+        # Encode the images of the pages in worker processes, one chunk of pages each,
+        # and add them to images.image_cache for drawing the pages here. Encoding the
+        # images takes most of the time of drawing them. The pages themselves are drawn
+        # into the one document in this process, since reportlab names the fonts and
+        # their subsets in the order they are first used in a document, so the file
+        # comes out the same as with one job.
+        pages = self.getPages(cards)
+        jobs = max(1, min(self.options.jobs, len(pages)))
+        chunkSize = max(1, -(-len(pages) // jobs))
+        chunkOptions, chunks = zip(*self.splitPages(cards, chunkSize))
+
+        with profiling.phase("encode_images"):
+            for records in getPool(jobs).map(
+                encodeImages, chunkOptions, [self.card_db] * len(chunks), chunks
+            ):
+                for key, record in records.items():
+                    images.image_cache.put(key, record)
+
+    def drawIncremental(self, cards):
+        # Draw each sheet into a PDF of its own, reusing the ones drawn before (in this
+        # process or in --cache-dir) with the same fingerprint, and join them.
+        # The info pages are drawn with the last sheet.
+        diskCache = output_cache.get_output_cache(self.options)
+        parts = []
+        with profiling.phase("draw_pages"):
+            for options, pages in self.splitPages(cards, 1):
+                key = page_cache.get_page_key(options, pages)
+                part = page_cache.page_cache.get(key)
+                if part is None and diskCache is not None:
+                    part = diskCache.get(key)
+                if part is None:
+                    part = drawPages(options, self.card_db, pages)
+                    if diskCache is not None:
+                        diskCache.put(key, part)
+                page_cache.page_cache.put(key, part)
+                parts.append(part)
+
+        with profiling.phase("merge_pages"):
+            writer = PdfWriter()
+            for part in parts:
+                writer.append(PdfReader(io.BytesIO(part)))
+            writer.write(self.options.outfile)
 
     def drawInfo(self, printIt=True):
         # Keep track of the number of pages
@@ -1054,19 +1091,31 @@ class DividerDrawer(object):
 
         self.canvas.restoreState()
 
-    def drawOutline(self, item, isBack=False):
+    def hasOutline(self, isBack=False):
         # bail out if there's nothing to draw
         if self.options.linewidth <= 0.0:
-            return
+            return False
         # only the front gets an outline, unless cropmarks are set
-        if isBack and not self.options.cropmarks:
+        return not isBack or self.options.cropmarks
+
+    def drawOutline(self, item, isBack=False):
+        if not self.hasOutline(isBack):
             return
+        geometry = self.getOutlineGeometry(item)
+        # remember notch dimensions for later steps
+        item.notchWidth, item.notchHeight = geometry[-2:]
+        name = None
+        if self.outlineForms:
+            name = self.outlineForms.get(self.getOutlineKey(item, isBack, geometry))
+        if name is None:
+            self.drawOutlineShape(item, isBack, geometry)
+        else:
+            self.canvas.doForm(name)
 
-        # canvas setup
-        self.canvas.saveState()
-        if isBack:  # flip the back side horizontally
-            self.canvas.translate(item.cardWidth, 0)
-            self.canvas.scale(-1, 1)
+    def getOutlineGeometry(self, item):
+        # The sizes of the panels, tabs and notches of the outline:
+        # (body, headHeight, tailHeight, headFold, tailFold, tabLeft, headTab, tailTab,
+        #  notchWidth, notchHeight)
 
         # certain sizes smaller than this round to zero to avoid rounding errors
         epsilon = 0.1 * cm
@@ -1125,9 +1174,48 @@ class DividerDrawer(object):
         else:  # no room
             notchWidth = notchHeight = 0
 
-        # remember notch dimensions for later steps
-        item.notchWidth = notchWidth
-        item.notchHeight = notchHeight
+        return (
+            body,
+            headHeight,
+            tailHeight,
+            headFold,
+            tailFold,
+            tabLeft,
+            headTab,
+            tailTab,
+            notchWidth,
+            notchHeight,
+        )
+
+    def getOutlineKey(self, item, isBack, geometry):
+        # The outline's shape: its geometry, line style and cropmarks
+        key = (isBack, geometry, item.lineType)
+        if self.options.cropmarks:
+            key += tuple(
+                item.translateCropmarkEnable(side)
+                for side in [item.TOP, item.BOTTOM, item.LEFT, item.RIGHT]
+            )
+        return key
+
+    def drawOutlineShape(self, item, isBack, geometry):
+        (
+            body,
+            headHeight,
+            tailHeight,
+            headFold,
+            tailFold,
+            tabLeft,
+            headTab,
+            tailTab,
+            _,
+            _,
+        ) = geometry
+
+        # canvas setup
+        self.canvas.saveState()
+        if isBack:  # flip the back side horizontally
+            self.canvas.translate(item.cardWidth, 0)
+            self.canvas.scale(-1, 1)
 
         # draw panels:
         # tail
@@ -1145,105 +1233,14 @@ class DividerDrawer(object):
         self.canvas.restoreState()
 
     def add_inline_images(self, text, fontsize):
-        def replace_image_tag(
-            text,
-            fontsize,
-            tag_pattern,
-            fname_replace,
-            fontsize_multiplier,
-            height_percent,
-            text_fontsize_multiplier=None,
-        ):
-            replace_template = '<img src="{fpath}" width={width} height="{height_percent}%" valign="middle" />'
-            offset = 0
-            for match in re.finditer(tag_pattern, text):
-                replace = replace_template
-                tag = match.group(0)
-                fname = re.sub(tag_pattern, fname_replace, tag)
-                if text_fontsize_multiplier is not None:
-                    font_replace = re.sub(
-                        tag_pattern,
-                        f"<font size={fontsize * text_fontsize_multiplier}>\\1</font>",
-                        tag,
-                    )
-                    replace = font_replace + replace
-                replace = replace.format(
-                    fpath=resource_handling.get_image_filepath(fname),
-                    width=fontsize * fontsize_multiplier,
-                    height_percent=height_percent,
-                )
-                text = (
-                    text[: match.start() + offset]
-                    + replace
-                    + text[match.end() + offset :]
-                )
-                offset += len(replace) - len(match.group(0))
-            return text
-
-        # Coins
-        replace_specs = [
-            # Coins
-            # TODO: coin text baseline should align with surrounding text
-            (r"(\d+)\s\<\*COIN\*\>", "coin_small_\\1.png", 2.4, 200),
-            (r"(\d+)\s(c|C)oin(s)?", "coin_small_\\1.png", 1.2, 100),
-            (r"([Xx])\s(c|C)oin(s)?", "coin_small_x.png", 1.2, 100),
-            (r"\?\s(c|C)oin(s)?", "coin_small_question.png", 1.2, 100),
-            (r"(empty|\_)\s(c|C)oin(s)?", "coin_small_empty.png", 1.2, 100),
-            # VP
-            (r"(?:\s+|\<)VP(?:\s+|\>|\.|$)", "victory_emblem.png", 1.25, 100),
-            (r"(\d+)\s*\<\*VP\*\>", "victory_emblem.png", 2, 160, 1.3),
-            # Debt
-            (r"(\d+)\sDebt", "debt_\\1.png", 1.2, 105),
-            (r"Debt", "debt.png", 1.2, 105),
-            # Potion
-            (r"(\d+)\s*\<\*POTION\*\>", "potion_small.png", 2, 140, 1.5),
-            (r"Potion", "potion_small.png", 1.2, 100),
-            # Sun
-            (r"SunToken", "sun.png", 1.2, 120),
-        ]
-        for args in replace_specs:
-            text = replace_image_tag(text, fontsize, *args)
-
-        return text.strip()
+        return markup.add_inline_images(text, fontsize)
 
     def add_inline_text(self, card, text, emWidth):
-        # Bonuses
-        text = card.getBonusBoldText(text)
-
-        # <line>: 11 em dashes, but not wider than the text box
-        line = "<center>{}</center>\n".format("&mdash;" * min(11, int(emWidth)))
-        text = re.sub(r"\<line\>", line, text)
-        #  <tab> and \t
-        text = re.sub(r"\<tab\>", "\t", text)
-        text = re.sub(r"\<t\>", "\t", text)
-        text = re.sub(r"\t", "&nbsp;" * 4, text)
-
-        # various breaks
-        text = re.sub(r"\<br\>", "<br />", text)
-        text = re.sub(r"\<n\>", "\n", text)
-
-        # alignments
-        text = re.sub(r"\<c\>", "<center>", text)
-        text = re.sub(r"\<center\>", "\n<para alignment='center'>", text)
-        text = re.sub(r"\</c\>", "</center>", text)
-        text = re.sub(r"\</center\>", "</para>", text)
-
-        text = re.sub(r"\<l\>", "<left>", text)
-        text = re.sub(r"\<left\>", "\n<para alignment='left'>", text)
-        text = re.sub(r"\</l\>", "</left>", text)
-        text = re.sub(r"\</left\>", "</para>", text)
-
-        text = re.sub(r"\<r\>", "<right>", text)
-        text = re.sub(r"\<right\>", "\n<para alignment='right'>", text)
-        text = re.sub(r"\</r\>", "</right>", text)
-        text = re.sub(r"\</right\>", "</para>", text)
-
-        text = re.sub(r"\<j\>", "<justify>", text)
-        text = re.sub(r"\<justify\>", "\n<para alignment='justify'>", text)
-        text = re.sub(r"\</j\>", "</justify>", text)
-        text = re.sub(r"\</justify\>", "</para>", text)
-
-        return text.strip().strip("\n")
+        # Bonuses, then the rest of the markup.
+        # <line> is 11 em dashes, but not wider than the text box
+        return markup.add_inline_text(
+            card.getBonusBoldText(text), min(11, int(emWidth))
+        )
 
     def drawCardCount(self, card, x, y) -> int:
         """Draw the card counts for this card. (x, y) is the bottom right corner of the images,
@@ -1348,12 +1345,10 @@ class DividerDrawer(object):
                         modSpacing += -0.5 * scale
                 if not cost:  # lonely star or plus
                     modSpacing = 0
-                modWidth = pdfmetrics.stringWidth(mod, modFont, modSize)
+                modWidth = stringWidth(mod, modFont, modSize)
 
             # get text width metrics
-            costWidth = [
-                pdfmetrics.stringWidth(digit, font, fontSize) for digit in cost
-            ]
+            costWidth = [stringWidth(digit, font, fontSize) for digit in cost]
             spacing = -2.0  # compress multi-digit costs
             totalWidth = (
                 sum(costWidth)
@@ -1379,8 +1374,7 @@ class DividerDrawer(object):
 
         def scaleImage(name, x, y, h, mask="auto"):
             path = resource_handling.get_image_filepath(name)
-            with Image.open(path) as img:
-                w0, h0 = img.size
+            w0, h0 = resource_handling.get_image_size(name)
             scale = h / h0
             w = w0 * scale
             self.canvas.drawImage(path, x, y, w, h, mask)
@@ -1449,61 +1443,50 @@ class DividerDrawer(object):
 
     def nameWidth(self, name, fontSize, style="Name"):
         name, caps, small, font = self.smallCapsConfig(name, fontSize, style)
+        return self.measureName(
+            name, fontSize, caps, small, font, self.fontStyle["Arrow"]
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=textfit.FIT_CACHE_SIZE)
+    def measureName(name, fontSize, caps, small, font, arrowFont):
+        # Cached, since labels are measured over and over while fitting them
         w = 0
         name_parts = name.split()
         for i, part in enumerate(name_parts):
             if i != 0:
-                w += pdfmetrics.stringWidth(" ", font, caps)
+                w += stringWidth(" ", font, caps)
             # Render arrows in Times Bold, because the other Name fonts don't support it.
             if part == "→":
-                w += pdfmetrics.stringWidth(part, self.fontStyle["Arrow"], fontSize)
+                w += stringWidth(part, arrowFont, fontSize)
             elif small == caps:
-                w += pdfmetrics.stringWidth(part, font, caps)
+                w += stringWidth(part, font, caps)
             else:
-                w += pdfmetrics.stringWidth(part[0], font, caps)
-                w += pdfmetrics.stringWidth(part[1:], font, small)
+                w += stringWidth(part[0], font, caps)
+                w += stringWidth(part[1:], font, small)
         return w
 
-    @staticmethod
-    @functools.lru_cache(maxsize=None)
-    def prepArtwork(image, w, h, resolution, opacity):
-        # This method is factored out to cache the image processing.
-        # Otherwise, it overwhelms the runtime with unnecessary,
-        # repeated work.
-
-        from io import BytesIO
-
-        # Get the original image.
-        artwork = resource_handling.get_image_filepath(image)
-
-        # Make any optional adjustments.
-        if resolution != 0 or opacity != 1.0:
-            imgObj = Image.open(artwork)
-            if resolution:
-                # Limit artwork resolution.
-                wmax = round(w * resolution / 72)
-                hmax = round(h * resolution / 72)
-                wnew = min(imgObj.width, wmax)
-                hnew = min(imgObj.height, hmax)
-                imgObj = imgObj.resize((wnew, hnew), Image.Resampling.LANCZOS)
-            if opacity != 1.0:
-                # Set image opacity.
-                if imgObj.mode != "RGBA":
-                    imgObj = imgObj.convert("RGBA")
-                alpha = imgObj.getchannel("A")
-                alpha = ImageEnhance.Brightness(alpha).enhance(opacity)
-                imgObj.putalpha(alpha)
-            imageBytes = BytesIO()
-            imgObj.save(imageBytes, "PNG")
-            imageBytes.seek(0)
-            artwork = ImageReader(imageBytes)
-
-        return artwork
+    def fitName(self, name, fontSize, textWidth, minFontSize, style="Name"):
+        # Returns (fontSize, width) for the name shrunk 0.01pt at a time until it
+        # fits in textWidth, or until the font size gets down to minFontSize
+        return textfit.fit_font_size(
+            lambda size: self.nameWidth(name, size, style),
+            fontSize,
+            textWidth,
+            minFontSize,
+        )
 
     def drawArtwork(self, image, x, y, w, h):
         resolution = self.options.tab_artwork_resolution
         opacity = self.options.tab_artwork_opacity
-        artwork = self.prepArtwork(image, w, h, resolution, opacity)
+        artwork = get_artwork(
+            image,
+            w,
+            h,
+            resolution,
+            opacity,
+            cache_dir=self.options.tab_artwork_cache_dir,
+        )
         self.canvas.drawImage(
             artwork, x, y, w, h, preserveAspectRatio=False, anchor="n", mask="auto"
         )
@@ -1683,7 +1666,7 @@ class DividerDrawer(object):
                 setText = card.setTextIcon()
                 if setText:
                     self.canvas.setFont(italic, setTextSize)
-                    setTextWidth = pdfmetrics.stringWidth(setText, italic, setTextSize)
+                    setTextWidth = stringWidth(setText, italic, setTextSize)
                     textInsetRight += setTextWidth
                     self.canvas.drawString(
                         tabWidth - textInsetRight, setTextHeight, setText
@@ -1695,10 +1678,10 @@ class DividerDrawer(object):
                     self.options.expansion_dividers_multiple_icons
                     and card.isExpansion()
                 ):
-                    expansion = Card.sets[card.cardset_tag]
+                    expansion = self.card_db.sets[card.cardset_tag]
                     set_images = expansion.get("all_images", set_images)
                     # reverse sort so that they're in the original order after being drawn right to left
-                    set_images.reverse()
+                    set_images = list(reversed(set_images))
 
                 for image in set_images:
                     textInsetRight += self.SET_ICON_SIZE  # they're all square
@@ -1716,10 +1699,7 @@ class DividerDrawer(object):
 
         name = card.name
         style = "Expansion" if card.isExpansion() else "Name"
-        width = self.nameWidth(name, fontSize, style)
-        while width > textWidth and fontSize > minFontSize:
-            fontSize -= 0.01
-            width = self.nameWidth(name, fontSize, style)
+        fontSize, width = self.fitName(name, fontSize, textWidth, minFontSize, style)
         tooLong = width > textWidth
         delimiterText = ""
         if tooLong:
@@ -1824,7 +1804,7 @@ class DividerDrawer(object):
             if text != " ":
                 self.canvas.drawString(x, y, text)
             self.canvas.setFont(font, fontSize)
-            return pdfmetrics.stringWidth(text, this_font, fontSize)
+            return stringWidth(text, this_font, fontSize)
 
         # Improve typography
         text = text.replace("'", "’")
@@ -1880,10 +1860,7 @@ class DividerDrawer(object):
 
         # Determine text size
         style = "Expansion" if card.isExpansion() else "Name"
-        width = self.nameWidth(text, fontSize, style)
-        while width > textWidth and fontSize > 6:
-            fontSize -= 0.01
-            width = self.nameWidth(text, fontSize, style)
+        fontSize, width = self.fitName(text, fontSize, textWidth, 6, style)
         # self.canvas.setFont(self.fontStyle["Name"], fontSize)
 
         font = pdfmetrics.getFont(self.fontStyle["Name"])
@@ -1972,19 +1949,12 @@ class DividerDrawer(object):
             #  Calculate font size that will fit in the area
             #  Start with centering type.  But if the fontSize gets too small
             #  use all the available space, even if it is not centered on the card
-            fontSize = 8
-            failover = False
             types_name = card.types_name
-            width = self.nameWidth(types_name, fontSize)
-            while width > textWidth:
-                fontSize -= 0.01
-                if fontSize < 6 and not failover:
-                    # Start over using all available space left on line
-                    textWidth = textWidth2
-                    w = left_margin + (textWidth2 / 2)
-                    fontSize = 8
-                    failover = True
-                width = self.nameWidth(types_name, fontSize)
+            fontSize, width = self.fitName(types_name, 8, textWidth, 6)
+            if fontSize < 6:
+                # Start over using all available space left on line
+                w = left_margin + (textWidth2 / 2)
+                fontSize, width = self.fitName(types_name, 8, textWidth2, 0)
 
             #  Print out the text in the right spot
             h = totalHeight - usedHeight - 0.5 * cm
@@ -2009,12 +1979,10 @@ class DividerDrawer(object):
             self.canvas.restoreState()
             return
 
-        s = getSampleStyleSheet()["BodyText"]
-        s.fontName = self.fontStyle["Rules"]
         if divider_text == "card" and not card.isExpansion():
-            s.alignment = TA_CENTER
+            alignment = TA_CENTER
         else:
-            s.alignment = TA_JUSTIFY
+            alignment = TA_JUSTIFY
 
         textHorizontalMargin = 0.5 * cm
         textVerticalMargin = 0.3 * cm
@@ -2024,46 +1992,28 @@ class DividerDrawer(object):
         minSpacerHeight = 0.05 * cm
 
         if not card.isExpansion():
-            emWidth = textBoxWidth / s.fontSize
+            emWidth = textBoxWidth / textfit.get_body_style().fontSize
             descriptions = self.add_inline_text(card, descriptions, emWidth)
         descriptions = re.split("\n", descriptions)
-        while True:
-            paragraphs: list[Paragraph] = []
-            # this accounts for the spacers we insert between paragraphs
-            h = (len(descriptions) - 1) * spacerHeight
-            w = 0
-            for d in descriptions:
-                if card.isExpansion():
-                    dmod = d
-                else:
-                    dmod = self.add_inline_images(d, s.fontSize)
-                try:
-                    p = Paragraph(dmod, s)
-                except ValueError as e:
-                    raise ValueError(
-                        f'Error rendering text from "{card.name}": {e} ("{dmod}")'
-                    )
-                width, height = p.wrapOn(self.canvas, textBoxWidth, textBoxHeight)
-                h += height
-                w = max(w, width)
-                paragraphs.append(p)
-
-            if (
-                (h <= textBoxHeight and w <= textBoxWidth)
-                or s.fontSize <= 1
-                or s.leading <= 1
-            ):
-                break
-            else:
-                s.fontSize -= 1
-                s.leading -= 1
-                spacerHeight = max(spacerHeight - 1, minSpacerHeight)
+        try:
+            fit = textfit.fit_paragraphs(
+                descriptions,
+                textBoxWidth,
+                textBoxHeight,
+                self.fontStyle["Rules"],
+                alignment,
+                spacerHeight,
+                minSpacerHeight,
+                inlineImages=not card.isExpansion(),
+            )
+        except ValueError as e:
+            raise ValueError(f'Error rendering text from "{card.name}": {e}')
 
-        h = totalHeight - usedHeight - textVerticalMargin
-        for p in paragraphs:
-            h -= p.height
-            p.drawOn(self.canvas, textHorizontalMargin, h)
-            h -= spacerHeight
+        fit.drawOn(
+            self.canvas,
+            textHorizontalMargin,
+            totalHeight - usedHeight - textVerticalMargin,
+        )
 
         self.canvas.restoreState()
 
@@ -2093,7 +2043,17 @@ class DividerDrawer(object):
 
         item.translate(self.canvas, pageWidth, isBack)
 
-        # actual drawing
+        key = self.dividerKeys.get((item, isBack)) if self.dividerKeys else None
+        if key is None:
+            self.drawDividerSide(item, isBack)
+        else:
+            self.canvas.doForm(self.getDividerForm(key, item, isBack))
+
+        # retore the canvas state to the way we found it
+        self.canvas.restoreState()
+
+    def drawDividerSide(self, item, isBack=False):
+        # Draws the side of the divider, with (0,0) at its lower left corner
         if not self.options.tabs_only:
             self.drawOutline(item, isBack)
 
@@ -2108,8 +2068,92 @@ class DividerDrawer(object):
             if self.options.tail in ["cover", "folder"]:
                 self.drawText(item, self.TAIL, self.options.tail_text)
 
-        # retore the canvas state to the way we found it
-        self.canvas.restoreState()
+    # The drawn CardPlot attributes that only say where the divider goes.  The
+    # rotation and the cropOn* attributes only decide which cropmarks are drawn.
+    PLACEMENT_ATTRIBUTES = [
+        "x",
+        "y",
+        "rotation",
+        "cropOnTop",
+        "cropOnBottom",
+        "cropOnLeft",
+        "cropOnRight",
+    ]
+
+    def getDividerKey(self, item, isBack=False):
+        # The fingerprint of drawing the side of the divider: its card, shape, tab
+        # and cropmarks, but not where on the page it goes.  The options are the same
+        # for everything drawn on the canvas.
+        values = item.getDrawnAttributes()
+        for name in self.PLACEMENT_ATTRIBUTES:
+            values.pop(name, None)
+        if self.options.cropmarks:
+            values["cropmarks"] = [
+                item.translateCropmarkEnable(side)
+                for side in [item.TOP, item.BOTTOM, item.LEFT, item.RIGHT]
+            ]
+        return json.dumps([isBack, values], sort_keys=True, default=page_cache.encode)
+
+    def findRepeatedDividers(self, pages, backSides):
+        # Fingerprint the sides that will be drawn, keeping those that come up more
+        # than once: only they are worth drawing into a form
+        keys = {}
+        counts = collections.Counter()
+        for _, _, page in pages:
+            for item in page:
+                for isBack in backSides:
+                    key = keys[item, isBack] = self.getDividerKey(item, isBack)
+                    counts[key] += 1
+        self.dividerKeys = {side: key for side, key in keys.items() if counts[key] > 1}
+        self.dividerForms = {}
+
+    def getDividerForm(self, key, item, isBack=False):
+        # The name of the form with the side of the divider on it, drawing it the first
+        # time a side with the same fingerprint comes up
+        name = self.dividerForms.get(key)
+        if name is None:
+            name = self.dividerForms[key] = f"divider{len(self.dividerForms)}"
+            self.beginSideForm(name)
+            self.drawDividerSide(item, isBack)
+            self.canvas.endForm()
+        return name
+
+    def beginSideForm(self, name):
+        # cropmarks and tabs can stick out of the divider
+        width, height = self.options.paperwidth, self.options.paperheight
+        self.canvas.beginForm(name, -width, -height, 2 * width, 2 * height)
+
+    def findRepeatedOutlines(self, pages, backSides):
+        # Only a few outline shapes (tab offset, stack height, cropmarks) come up
+        # in a job.  Draw those that come up more than once into a form up front;
+        # the sides drawn into a divider form count once, in that form.
+        self.outlineForms = {}
+        if self.options.tabs_only:
+            return
+        counts = collections.Counter()
+        first = {}
+        dividerKeys = set()
+        for _, _, page in pages:
+            for item in page:
+                for isBack in backSides:
+                    if not self.hasOutline(isBack):
+                        continue
+                    dividerKey = self.dividerKeys.get((item, isBack))
+                    if dividerKey is not None:
+                        if dividerKey in dividerKeys:
+                            continue
+                        dividerKeys.add(dividerKey)
+                    geometry = self.getOutlineGeometry(item)
+                    key = self.getOutlineKey(item, isBack, geometry)
+                    counts[key] += 1
+                    first.setdefault(key, (item, isBack, geometry))
+        for key, (item, isBack, geometry) in first.items():
+            if counts[key] > 1:
+                name = self.outlineForms[key] = f"outline{len(self.outlineForms)}"
+                item.notchWidth, item.notchHeight = geometry[-2:]
+                self.beginSideForm(name)
+                self.drawOutlineShape(item, isBack, geometry)
+                self.canvas.endForm()
 
     def drawSetNames(self, pageItems, backside=False):
         # print sets for this page
@@ -2189,6 +2233,9 @@ class DividerDrawer(object):
 
     def calculatePages(self, cards):
         options = self.options
+        if self.card_db is None and cards:
+            # Use the database view the cards were read with
+            self.card_db = cards[0].card_db
 
         # Adjust for Vertical vs Horizontal
         if options.orientation == "vertical":
@@ -2454,8 +2501,8 @@ class DividerDrawer(object):
         if options.orientation == "vertical":
             cardWidth, cardHeight = cardHeight, cardWidth
 
-        # Initialized CardPlot tabs
-        CardPlot.tabSetup(
+        # The tab setup of the CardPlots
+        layout = TabLayout(
             tabNumber=options.tab_number,
             cardWidth=cardWidth,
             cardHeight=cardHeight,
@@ -2469,7 +2516,7 @@ class DividerDrawer(object):
 
         # Now go through all the cards and create their plotter information record...
         items = []
-        nextTabIndex = CardPlot.tabRestart()
+        nextTabIndex = layout.restart()
         lastCardSet = None
 
         for card in cards:
@@ -2477,16 +2524,16 @@ class DividerDrawer(object):
             if options.expansion_reset_tabs and not card.isExpansion():
                 if lastCardSet != card.cardset_tag:
                     # In a new expansion, so reset the tabs to start over
-                    nextTabIndex = CardPlot.tabRestart()
-                    cardset_count = Card.sets[card.cardset_tag].get("count", 0)
+                    nextTabIndex = layout.restart()
+                    cardset_count = self.card_db.sets[card.cardset_tag].get("count", 0)
                     if options.tab_number > cardset_count and cardset_count > 0:
                         #  Limit to the number of tabs to the number of dividers in the expansion
-                        CardPlot.tabSetup(
-                            tabNumber=Card.sets[card.cardset_tag]["count"]
+                        layout.setup(
+                            tabNumber=self.card_db.sets[card.cardset_tag]["count"]
                         )
-                    elif CardPlot.tabNumber != options.tab_number:
+                    elif layout.tabNumber != options.tab_number:
                         # Make sure tabs are set back to the original
-                        CardPlot.tabSetup(tabNumber=options.tab_number)
+                        layout.setup(tabNumber=options.tab_number)
             lastCardSet = card.cardset_tag
 
             if self.wantCentreTab(card):
@@ -2503,6 +2550,7 @@ class DividerDrawer(object):
                 textTypeBack=options.text_back,
                 stackHeight=card.getStackHeight(options.thickness),
                 options=options,
+                layout=layout,
             )
 
             if card.isExpansion() and options.full_expansion_dividers:
@@ -2514,7 +2562,7 @@ class DividerDrawer(object):
             if (
                 options.flip
                 and (options.tab_number == 2)
-                and (thisTabIndex != CardPlot.tabStart)
+                and (thisTabIndex != layout.tabStart)
             ):
                 item.flipFront2Back()  # Instead of flipping the tab, flip the whole divider front to back
 
@@ -2581,41 +2629,75 @@ class DividerDrawer(object):
         if cards is None:
             cards = []
         if not self.pages:
-            self.calculatePages(cards)
+            with profiling.phase("calculate_pages"):
+                self.calculatePages(cards)
+
+        drawFooter = not self.options.no_page_footer and (
+            not self.options.tabs_only and self.options.order != "global"
+        )
+
+        if (
+            self.options.tabs_only
+            or self.options.text_back == "none"
+            or self.options.wrapper
+            or self.options.preview
+        ):
+            # Don't print the sheets with the back of the dividers
+            backSides = [False]
+        else:
+            backSides = [False, True]
+
+        if self.options.divider_forms:
+            pages = self.pages
+            if self.options.num_pages > 0:
+                pages = pages[: self.options.num_pages]
+            self.findRepeatedDividers(pages, backSides)
+            self.findRepeatedOutlines(pages, backSides)
 
         # Now go page by page and print the dividers
         for pageNum, pageInfo in enumerate(self.pages):
             hMargin, vMargin, page = pageInfo
 
-            drawFooter = not self.options.no_page_footer and (
-                not self.options.tabs_only and self.options.order != "global"
-            )
-
-            if (
-                self.options.tabs_only
-                or self.options.text_back == "none"
-                or self.options.wrapper
-            ):
-                # Don't print the sheets with the back of the dividers
-                backSides = [False]
-            else:
-                backSides = [False, True]
-
             for isBack in backSides:
-                # Page footer
-                if drawFooter:
-                    self.drawSetNames(page, isBack)
-
-                # Page
-                for item in page:
-                    # print the dividor
-                    self.drawDivider(
-                        item,
-                        isBack=isBack,
-                        horizontalMargin=hMargin,
-                        verticalMargin=vMargin,
-                    )
-                self.canvas.showPage()
+                with profiling.page(pageNum + 1, back=isBack):
+                    # Page footer
+                    if drawFooter:
+                        self.drawSetNames(page, isBack)
+
+                    # Page
+                    for item in page:
+                        # print the dividor
+                        self.drawDivider(
+                            item,
+                            isBack=isBack,
+                            horizontalMargin=hMargin,
+                            verticalMargin=vMargin,
+                        )
+                    self.canvas.showPage()
+                    profiling.count("pages_shown")
 
             if pageNum + 1 == self.options.num_pages:
                 break
+
+
+def encodeImages(options, card_db, pages):
+    # Draws the given pages without saving them and returns the images they embed,
+    # as image_cache key -> ImageRecord.
+    # Runs in the worker processes of DividerDrawer.encodeInParallel.
+    options.outfile = io.BytesIO()
+    dd = DividerDrawer(options, card_db)
+    dd.pages = pages
+    dd.registerFonts()
+    dd.canvas = dd.createCanvas()
+    dd.drawDividers()
+    return dd.canvas.image_records
+
+
+def drawPages(options, card_db, pages):
+    # Draws the given pages into a PDF of their own and returns it.
+    # The tab layout comes along with the CardPlots on the pages.
+    options.outfile = io.BytesIO()
+    dd = DividerDrawer(options, card_db)
+    dd.pages = pages
+    dd.draw()
+    return options.outfile.getvalue()
@@ -0,0 +1,389 @@
+###########################################################################
+# The fonts of the dividers.
+#
+# Which font is used for each kind of text (the font style) depends on the
+# font files found in --font-dir and in the package, and on whether the
+# language can be written with reportlab's built-in fonts.  The FontRegistry
+# works that out once per process for each font dir and script, and parses
+# each font file only once, so later generations don't touch the font files
+# at all.  Only the fonts the style picks are parsed and registered.
+#
+# Font names are global to reportlab, so generations with different font dirs
+# holding different files for the same font shouldn't draw at the same time.
+# The DividerService makes sure of that by only drawing with its own font dir.
+#
+# When a PDF is saved, reportlab cuts a subset with just the characters used
+# out of each TrueType font and embeds it, compressed.  The same few subsets
+# (say the card names of one language) come up in document after document, so
+# with --font-subset-cache the embedded font programs are kept in a
+# FontSubsetCache, by the font file and the characters in the subset, and
+# reused by the following documents.
+###########################################################################
+
+import collections
+import hashlib
+import os
+import threading
+import zlib
+
+from loguru import logger
+from reportlab.pdfbase import pdfdoc, pdfmetrics
+from reportlab.pdfbase.ttfonts import (
+    FF_NONSYMBOLIC,
+    FF_SYMBOLIC,
+    TTFont,
+    TTFontFace,
+)
+
+from . import resource_handling
+
+# How much of the embedded font programs to keep
+FONT_SUBSET_CACHE_BYTES = 32 * 2**20
+
+# Fonts used in Dominion:
+# TrajanPro-Bold        card titles and types
+# MinionStd-Black       numbers on base cards & icons
+# Times-Roman           rules text*
+# Times-Bold            bold rules text
+# Times-Italic          italic rules text
+# Helvetica-Bold        superscript + in some card costs
+# CharlemagneStd-Bold   expansion names on box art
+# Capitals              player mat banners
+# Barbedor-Bold         player mat rules
+
+# * the cards mostly use Times New Roman rather than Times Roman, but they're
+#   not totally consistent, and the differences are very subtle
+
+# Common filenames used by Adobe Reader and Creative Cloud, as well as
+# alternatives available from free sites like fontsgeek:
+FONT_FILENAMES = {
+    "TrajanPro-Bold": [
+        "TrajanPro-Bold.ttf",
+        "TrajanPro3-Semibold.ttf",
+        "Trajan Pro Bold.ttf",
+    ],
+    "MinionStd-Black": [
+        "MinionStd-Black.ttf",
+        "Minion Std Black.ttf",
+    ],
+    "CharlemagneStd-Bold": [
+        "CharlemagneStd-Bold.ttf",
+        "Charlemagne Std Bold.ttf",
+    ],
+    "MinionPro-Regular": [
+        "MinionPro-Regular.ttf",
+        "Minion Pro Regular.ttf",
+    ],
+    "MinionPro-Bold": [
+        "MinionPro-Bold.ttf",
+        "Minion Pro Bold.ttf",
+    ],
+    "MinionPro-Italic": [
+        "MinionPro-Italic.ttf",
+        "MinionPro-It.ttf",
+        "Minion Pro Italic.ttf",
+    ],
+    # Built-in fonts
+    "Times-Roman": None,
+    "Times-Bold": None,
+    "Times-Italic": None,
+    "Helvetica-Bold": None,
+    "Courier": None,
+}
+
+# ReportLab only supports ISO-8859-1 (Latin1) encoding. Only certain languages are supported. For other
+# languages TTF fonts must be loaded instead. Not great, consider switching to TTF fonts for all languages...
+LATIN1_LANGUAGES = ("de", "en_us", "es", "fr", "it", "nl_du")
+TIMES_TTF_FILENAMES = {
+    "Times-Roman-TTF": ["Times-Roman.ttf", "Times Roman.ttf"],
+    "Times-Bold-TTF": ["Times-Roman-Bold.ttf", "Times Roman Bold.ttf"],
+    "Times-Italic-TTF": ["Times-Roman-Italic.ttf", "Times Roman Italic.ttf"],
+}
+
+
+def get_script(language):
+    # The kind of fonts the language needs
+    return "latin1" if language in LATIN1_LANGUAGES else "unicode"
+
+
+def find_font_paths(font_dir, script):
+    # Returns {font: path} of the fonts found, with None for the built-in ones
+    fontfilenames = dict(FONT_FILENAMES)
+    if script != "latin1":
+        fontfilenames.update(TIMES_TTF_FILENAMES)
+
+    # Locate the files in package data, if present
+    fontpaths = {}
+    for font, filenames in fontfilenames.items():
+        if filenames is None:  # built-ins
+            fontpaths[font] = None
+            continue
+        for fname in filenames:
+            if font_dir:
+                fpath = os.path.join(font_dir, fname)
+                if os.path.exists(fpath):
+                    fontpaths[font] = fpath
+                    break
+            fpath = os.path.join("fonts", fname)
+            if resource_handling.resource_exists(fpath):
+                fontpaths[font] = resource_handling.get_resource_filepath(fpath)
+                break
+    logger.trace(fontpaths)
+    return fontpaths
+
+
+def find_font_style(font_dir, script, language):
+    # Returns ({text style: font}, {font: path}) for the fonts found.
+    # The language is only used in the warnings.
+    fontpaths = find_font_paths(font_dir, script)
+
+    # Check if *all three* Times Roman TTF fonts have been found and use them. If not -> remove all three
+    # from the paths list
+    timesTTFs = set(TIMES_TTF_FILENAMES)
+    timesTTF_not_found = timesTTFs - set(fontpaths)
+    useTimesTTF = script != "latin1" and not timesTTF_not_found
+    if useTimesTTF:
+        # Register Times Roman TTF as font family. Necessary for <b> and <i> attributes to work in Platypus!
+        pdfmetrics.registerFontFamily(
+            "Times-Roman-TTF",
+            normal="Times-Roman-TTF",
+            bold="Times-Bold-TTF",
+            italic="Times-Italic-TTF",
+        )
+    else:
+        if script != "latin1":
+            logger.warning(
+                f"Non-Latin1 language requested ({language}) "
+                "but Times TTF font files not provided (black boxes may appear). "
+                f"missing fonts: {timesTTF_not_found}"
+            )
+        for fontname in timesTTFs:
+            fontpaths.pop(fontname, None)
+    roman = "Times-Roman-TTF" if useTimesTTF else "Times-Roman"
+    bold = "Times-Bold-TTF" if useTimesTTF else "Times-Bold"
+    italic = "Times-Italic-TTF" if useTimesTTF else "Times-Italic"
+
+    # Determine the best matching fonts for each font type.
+    fontprefs = {
+        "Name": ["TrajanPro-Bold", "MinionPro-Regular", roman],  # card names & types
+        "Expansion": [  # expansion names
+            "CharlemagneStd-Bold",
+            "TrajanPro-Bold",
+            "MinionPro-Regular",
+            roman,
+        ],
+        "Cost": [  # card costs (coins, debt, etc)
+            "MinionStd-Black",
+            "MinionPro-Bold",
+            bold,
+        ],
+        "PlusCost": ["Helvetica-Bold"],  # card cost superscript "+" modifiers
+        "Regular": ["MinionPro-Regular", roman],  # regular text
+        "Bold": ["MinionPro-Bold", bold],  # miscellaneous bold text
+        "Italic": ["MinionPro-Italic", italic],  # for --use-set-text-icon
+        "Rules": [roman],
+        "Monospaced": ["Courier"],
+        # The custom fonts don't have the → character used for e.g. traveller card groups
+        "Arrow": [bold],
+    }
+    fontStyle = {
+        # select the first matching preference for each font type
+        style: [font for font in prefs if font in fontpaths][0]
+        for style, prefs in fontprefs.items()
+    }
+    for style, font in fontStyle.items():
+        best = fontprefs[style][0]
+        if font != best:
+            logger.warning(f"Font {best} missing from font dirs; using {font} instead.")
+    return fontStyle, {font: fontpaths[font] for font in fontStyle.values()}
+
+
+class FontSubsetCache(object):
+    # The most recently used font programs, up to max_bytes, by
+    # (font file digest, characters, compressed)
+    def __init__(self, max_bytes=FONT_SUBSET_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, make):
+        # The (font program, uncompressed length) for the key, made by make() if needed
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry
+            self.misses += 1
+        entry = make()
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = entry
+                self.bytes += len(entry[0])
+                # always keep the newest entry
+                while self.bytes > self.max_bytes and len(self.entries) > 1:
+                    _, (old, _) = self.entries.popitem(last=False)
+                    self.bytes -= len(old)
+                    self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+font_subset_cache = FontSubsetCache()
+
+
+class SubsetCachingTTFontFace(TTFontFace):
+    # A TTFontFace that takes its embedded subsets from the document's fontSubsetCache,
+    # if it has one
+
+    def getDigest(self):
+        digest = self.__dict__.get("digest")
+        if digest is None:
+            digest = self.digest = hashlib.sha256(self._ttf_data).hexdigest()
+        return digest
+
+    def addSubsetObjects(self, doc, fontname, subset):
+        cache = getattr(doc, "fontSubsetCache", None)
+        if cache is None:
+            return TTFontFace.addSubsetObjects(self, doc, fontname, subset)
+
+        def make():
+            content = self.makeSubset(subset)
+            if doc.compression:
+                # like pdfdoc.PDFZCompress does when the document is saved
+                return zlib.compress(content), len(content)
+            return content, len(content)
+
+        key = (self.getDigest(), tuple(subset), bool(doc.compression))
+        content, length = cache.get(key, make)
+        # The same stream as TTFontFace.addSubsetObjects makes, with the filters
+        # already applied
+        fontFile = pdfdoc.PDFStream()
+        fontFile.content = content
+        fontFile.dictionary["Length1"] = length
+        if doc.compression:
+            fontFile.dictionary["Filter"] = pdfdoc.PDFArray(
+                [pdfdoc.PDFName(pdfdoc.PDFZCompress.pdfname)]
+            )
+        fontFileRef = doc.Reference(
+            fontFile, "fontFile:%s(%s)" % (self.filename, fontname)
+        )
+        return self.addFontDescriptor(doc, fontname, fontFileRef)
+
+    def addFontDescriptor(self, doc, fontname, fontFileRef):
+        # The FontDescriptor of the subset, as TTFontFace.addSubsetObjects makes it
+        flags = self.flags & ~FF_NONSYMBOLIC | FF_SYMBOLIC
+        fontDescriptor = pdfdoc.PDFDictionary(
+            {
+                "Type": "/FontDescriptor",
+                "Ascent": self.ascent,
+                "CapHeight": self.capHeight,
+                "Descent": self.descent,
+                "Flags": flags,
+                "FontBBox": pdfdoc.PDFArray(self.bbox),
+                "FontName": pdfdoc.PDFName(fontname),
+                "ItalicAngle": self.italicAngle,
+                "StemV": self.stemV,
+                "FontFile2": fontFileRef,
+                "MissingWidth": self.defaultWidth,
+            }
+        )
+        return doc.Reference(fontDescriptor, "fontDescriptor:" + fontname)
+
+
+class SubsetCachingTTFont(TTFont):
+    # A TTFont whose subsets can come from a FontSubsetCache
+    def __init__(self, name, filename):
+        TTFont.__init__(self, name, filename)
+        # reportlab makes the face itself, so only the class can be swapped in
+        self.face.__class__ = SubsetCachingTTFontFace
+
+
+class FontRegistry(object):
+    # The font style for each (font dir, script), and the fonts parsed so far
+    def __init__(self):
+        self.font_styles = {}  # map from (font dir, script) to (font style, font paths)
+        self.fonts = {}  # map from (font, path) to the parsed TTFont
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_font_style(self, font_dir, language):
+        # The {text style: font name} to draw with, with all of its fonts registered
+        key = (font_dir, get_script(language))
+        with self.lock:
+            if key in self.font_styles:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.font_styles[key] = find_font_style(font_dir, key[1], language)
+            fontStyle, fontpaths = self.font_styles[key]
+            for font, fontpath in fontpaths.items():
+                if fontpath is not None:
+                    self.register(font, fontpath)
+        return fontStyle
+
+    def register(self, font, fontpath):
+        # Register the font with reportlab, unless it already is
+        ttf = self.fonts.get((font, fontpath))
+        if ttf is None:
+            logger.trace(f"Registering {font} = {fontpath}")
+            ttf = self.fonts[(font, fontpath)] = SubsetCachingTTFont(font, fontpath)
+        # another font dir may have registered another file under the same name
+        if (
+            font not in pdfmetrics.getRegisteredFontNames()
+            or pdfmetrics.getFont(font) is not ttf
+        ):
+            pdfmetrics.registerFont(ttf)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "styles": len(self.font_styles),
+                "fonts": len(self.fonts),
+            }
+
+    def clear(self):
+        with self.lock:
+            self.font_styles.clear()
+            self.fonts.clear()
+            self.hits = self.misses = 0
+
+
+font_registry = FontRegistry()
+
+
+def get_font_style(font_dir, language):
+    return font_registry.get_font_style(font_dir, language)
+
+
+def use_subset_cache(canvas):
+    # Make the fonts embedded in the canvas' document come from font_subset_cache
+    canvas._doc.fontSubsetCache = font_subset_cache
+
+
+def get_cache_stats():
+    return font_registry.stats()
+
+
+def get_subset_cache_stats():
+    return font_subset_cache.stats()
@@ -0,0 +1,358 @@
+###########################################################################
+# The images embedded in the PDFs.
+#
+# reportlab reads, compresses and (with rl_config.useA85, the default)
+# ASCII85 encodes every image again for every document, which takes most of
+# the time of a whole generation without the C accelerators.  The same coins,
+# set icons, card.png and tab artwork go into document after document, so the
+# ImageCachingCanvas takes the encoded image XObjects from an ImageCache
+# instead, keyed by a digest of the image file (or, for prepared artwork, of
+# the original file and how it was prepared) and by the mask.  Given a cache
+# directory, the encoded images are also kept on disk for other processes.
+#
+# Within a document each image is embedded once, however it is drawn: as a
+# file, or as an ImageReader of the same file like the inline images of the
+# card texts.
+###########################################################################
+
+import collections
+import hashlib
+import json
+import os
+import threading
+
+import reportlab
+from loguru import logger
+from reportlab import rl_config
+from reportlab.lib.boxstuff import aspectRatioFix
+from reportlab.lib.utils import ImageReader, _digester
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen import canvas
+
+from . import profiling
+
+# Bump to drop the images cached on disk by older versions of this module
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".xobj"
+
+# How many encoded images to keep in memory
+IMAGE_CACHE_BYTES = 64 * 2**20
+
+# An encoded image: the name reportlab gives it (None for files, whose name
+# depends on their path), the attributes of its PDFImageXObject and its soft
+# mask, another ImageRecord or None.  The stream is kept as the bytes written
+# to the PDF, which saves encoding the ASCII85 text again with every save.
+ImageRecord = collections.namedtuple("ImageRecord", ["name", "attrs", "smask"])
+
+
+def get_file_name(image, mask):
+    # The name reportlab gives an image drawn from a file
+    return _digester("%s%s" % (image, mask))
+
+
+def encode_image(image, mask):
+    # Encodes the image the way Canvas.drawImage does
+    name = None
+    if isinstance(image, ImageReader):
+        rawdata = image.getRGBData()
+        smask = image._dataA
+        if mask == "auto" and smask:
+            mdata = smask.getRGBData()
+        else:
+            mdata = str(mask)
+        if isinstance(mdata, str):
+            mdata = mdata.encode("utf8")
+        name = _digester(rawdata + mdata)
+    xobject = pdfdoc.PDFImageXObject(name, image, mask=mask)
+    smask = getattr(xobject, "_smask", None)
+    if smask is not None:
+        smask = ImageRecord(smask.name, get_attrs(smask), None)
+    return ImageRecord(name, get_attrs(xobject), smask)
+
+
+def get_attrs(xobject):
+    attrs = {
+        name: value
+        for name, value in vars(xobject).items()
+        if name not in ("name", "_smask")
+    }
+    attrs["streamContent"] = pdfdoc.pdfdocEnc(attrs["streamContent"])
+    return attrs
+
+
+def make_xobject(name, attrs):
+    xobject = pdfdoc.PDFImageXObject(name)
+    xobject.__dict__.update(attrs)
+    return xobject
+
+
+def get_footprint(record):
+    footprint = len(record.attrs["streamContent"])
+    if record.smask:
+        footprint += get_footprint(record.smask)
+    return footprint
+
+
+def dump_record(record):
+    # The record as a line of JSON followed by its streams
+    streams = []
+
+    def describe(record):
+        attrs = dict(record.attrs)
+        streams.append(attrs.pop("streamContent"))
+        return {
+            "name": record.name,
+            "attrs": attrs,
+            "length": len(streams[-1]),
+            "smask": describe(record.smask) if record.smask else None,
+        }
+
+    header = json.dumps(describe(record)).encode("utf-8")
+    return b"\n".join([header] + streams)
+
+
+def load_record(data):
+    header, _, data = data.partition(b"\n")
+    offset = 0
+
+    def build(description):
+        nonlocal offset
+        stream = data[offset : offset + description["length"]]
+        offset += description["length"] + 1
+        attrs = dict(description["attrs"], streamContent=stream)
+        smask = description["smask"]
+        return ImageRecord(description["name"], attrs, build(smask) if smask else None)
+
+    return build(json.loads(header))
+
+
+class ImageCache(object):
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        # key -> (ImageRecord, footprint in bytes), least recently used first
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        # image file -> digest of its contents
+        self.digests = {}
+        self.stats_counter = collections.Counter()
+        self.lock = threading.Lock()
+
+    def get_file_digest(self, fname):
+        fname = os.fspath(fname)
+        with self.lock:
+            digest = self.digests.get(fname)
+        if digest is None:
+            try:
+                with open(fname, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                return None
+            with self.lock:
+                self.digests[fname] = digest
+        return digest
+
+    def get_asset_key(self, image):
+        # What the image shows: the digest of its file, or for prepared artwork
+        # the asset_key it was given.  None if we can't tell.
+        if isinstance(image, (str, os.PathLike)):
+            return self.get_file_digest(image)
+        if isinstance(image, ImageReader):
+            asset_key = getattr(image, "asset_key", None)
+            if asset_key is None and isinstance(image.fileName, str):
+                asset_key = self.get_file_digest(image.fileName)
+            return asset_key
+        return None
+
+    def get(self, key, image, mask, cache_dir=None):
+        # The ImageRecord of the image for the key, encoded if needed
+        with self.lock:
+            if key in self.entries:
+                self.stats_counter["hits"] += 1
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            self.stats_counter["misses"] += 1
+
+        record = self.load(key, image, mask, cache_dir)
+        self.put(key, record)
+        return record
+
+    def put(self, key, record):
+        # Adds a record encoded elsewhere, like in the worker processes of --jobs
+        footprint = get_footprint(record)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = record, footprint
+                self.bytes += footprint
+                self.evict()
+
+    def load(self, key, image, mask, cache_dir):
+        # The record for the key, from the cache directory if it is there
+        fname = None
+        if cache_dir:
+            fname = os.path.join(cache_dir, self.get_cache_filename(key))
+            if os.path.exists(fname):
+                try:
+                    with open(fname, "rb") as f:
+                        record = load_record(f.read())
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Could not read cached image {fname}: {e}")
+                else:
+                    with self.lock:
+                        self.stats_counter["disk_hits"] += 1
+                    return record
+
+        record = encode_image(image, mask)
+
+        if fname:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                # write to a temporary file first, so other processes never see half a file
+                tmpname = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmpname, "wb") as f:
+                    f.write(dump_record(record))
+                os.replace(tmpname, fname)
+                with self.lock:
+                    self.stats_counter["disk_writes"] += 1
+            except OSError as e:
+                logger.warning(f"Could not save image to {cache_dir}: {e}")
+        return record
+
+    @staticmethod
+    def get_cache_filename(key):
+        # tie the file to the reportlab version too, in case the encoding changes
+        text = repr((CACHE_VERSION, reportlab.Version, key))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32] + CACHE_SUFFIX
+
+    def evict(self):
+        # Drop the least recently used images until we're within max_bytes,
+        # always keeping the newest entry
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, footprint) = self.entries.popitem(last=False)
+            self.bytes -= footprint
+            self.stats_counter["evictions"] += 1
+
+    def stats(self):
+        # Hits, misses, disk_hits, disk_writes, evictions, entries, bytes and max_bytes
+        with self.lock:
+            stats = {
+                name: self.stats_counter[name]
+                for name in ["hits", "misses", "disk_hits", "disk_writes", "evictions"]
+            }
+            stats.update(
+                entries=len(self.entries), bytes=self.bytes, max_bytes=self.max_bytes
+            )
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.digests.clear()
+            self.stats_counter.clear()
+
+
+image_cache = ImageCache()
+
+
+class ImageCachingCanvas(canvas.Canvas):
+    # A Canvas that embeds the images drawn from image_cache, each one once
+
+    def __init__(self, *args, cache_dir=None, **kwargs):
+        canvas.Canvas.__init__(self, *args, **kwargs)
+        self.image_cache_dir = cache_dir
+        # (asset key, mask) -> (XObject name, name, width, height) of the images embedded
+        self.embedded_images = {}
+        # and image_cache key -> ImageRecord
+        self.image_records = {}
+
+    def drawImage(
+        self,
+        image,
+        x,
+        y,
+        width=None,
+        height=None,
+        mask=None,
+        preserveAspectRatio=False,
+        anchor="c",
+        anchorAtXY=False,
+        showBoundary=False,
+        extraReturn=None,
+    ):
+        profiling.count("images_drawn")
+        asset_key = None
+        if not (showBoundary or extraReturn):
+            asset_key = image_cache.get_asset_key(image)
+        if asset_key is None:
+            return canvas.Canvas.drawImage(
+                self,
+                image,
+                x,
+                y,
+                width,
+                height,
+                mask,
+                preserveAspectRatio,
+                anchor,
+                anchorAtXY,
+                showBoundary,
+                extraReturn,
+            )
+
+        self._currentPageHasImages = 1
+        key = (asset_key, repr(mask))
+        embedded = self.embedded_images.get(key)
+        if embedded is None:
+            embedded = self.embedded_images[key] = self.embedImage(
+                image, asset_key, mask
+            )
+        regName, name, imageWidth, imageHeight = embedded
+
+        # the rest is as in Canvas.drawImage
+        x, y, width, height, _ = aspectRatioFix(
+            preserveAspectRatio,
+            anchor,
+            x,
+            y,
+            width,
+            height,
+            imageWidth,
+            imageHeight,
+            anchorAtXY,
+        )
+        self.saveState()
+        self.translate(x, y)
+        self.scale(width, height)
+        self._code.append("/%s Do" % regName)
+        self.restoreState()
+        self._formsinuse.append(name)
+        return imageWidth, imageHeight
+
+    def embedImage(self, image, asset_key, mask):
+        # Adds the image to the document, unless it is there already
+        kind = "reader" if isinstance(image, ImageReader) else "file"
+        key = (kind, asset_key, repr(mask), rl_config.useA85)
+        record = self.image_records[key] = image_cache.get(
+            key, image, mask, self.image_cache_dir
+        )
+        name = record.name or get_file_name(image, mask)
+        regName = self._doc.getXObjectName(name)
+        if regName not in self._doc.idToObject:
+            # as Canvas.drawImage registers a new image
+            xobject = make_xobject(name, record.attrs)
+            self._setXObjects(xobject)
+            self._doc.Reference(xobject, regName)
+            self._doc.addForm(name, xobject)
+            if record.smask:
+                mRegName = self._doc.getXObjectName(record.smask.name)
+                if mRegName not in self._doc.idToObject:
+                    smask = make_xobject(record.smask.name, record.smask.attrs)
+                    self._setXObjects(smask)
+                    xobject.smask = self._doc.Reference(smask, mRegName)
+                else:
+                    xobject.smask = pdfdoc.PDFObjectReference(mRegName)
+        return regName, name, record.attrs["width"], record.attrs["height"]
+
+
+def get_cache_stats():
+    return image_cache.stats()
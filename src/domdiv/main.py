@@ -1,15 +1,29 @@
 import fnmatch
 import json
 import os
+import shlex
 import sys
+import time
 import unicodedata
 from collections import Counter, defaultdict
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 
 from loguru import logger
 from reportlab.lib.units import cm
 
-from . import config_options, db, resource_handling
+from . import (
+    artwork,
+    config_options,
+    db,
+    fonts,
+    images,
+    output_cache,
+    page_cache,
+    preview,
+    profiling,
+    resource_handling,
+)
 from .cards import Card
 from .draw import DividerDrawer
 
@@ -21,25 +35,34 @@ except ImportError:
     have_icu = False
 
 
-def generate_sample(options):
-    from io import BytesIO
+def generate_sample(options, card_db=None):
+    # Returns the preview png of the front of the first page, cached by the options
+    fingerprint = preview.get_fingerprint(options)
 
-    from wand.image import Image
+    def render():
+        cache = output_cache.get_output_cache(options)
+        if cache is not None:
+            key = output_cache.get_cache_key(options, "png")
+            png = cache.get(key)
+            if png is not None:
+                return png
+        buf = BytesIO()
+        options.num_pages = 1
+        options.outfile = buf
+        _generate(options, card_db)
+        with profiling.phase("render_preview"):
+            png = preview.render_png(buf.getvalue(), options.preview_resolution)
+        if cache is not None:
+            cache.put(key, png)
+        return png
 
-    buf = BytesIO()
-    options.num_pages = 1
-    options.outfile = buf
-    generate(options)
-    sample_out = BytesIO()
-    with Image(blob=buf.getvalue(), resolution=options.preview_resolution) as sample:
-        sample.format = "png"
-        sample.save(sample_out)
-        return sample_out.getvalue()
+    return preview.preview_cache.get(fingerprint, render)
 
 
 class CardSorter(object):
-    def __init__(self, order, lang, baseCards):
+    def __init__(self, order, lang, baseCards, card_db=None):
         self.order = order
+        self.card_db = card_db
 
         # If PyICU has been successfully imported
         if have_icu:
@@ -86,19 +109,20 @@ class CardSorter(object):
         # now pick up those that have not been specified
         for tag in baseCards:
             self.baseCards.append(baseCards[tag])
+        # map from base card name to its place, the first one for repeated names
+        self.baseIndexes = {}
+        for i, name in enumerate(self.baseCards):
+            self.baseIndexes.setdefault(name, i)
 
     # When sorting cards, want to always put "base" cards after all
     # kingdom cards, and order the base cards in a particular order
     # (ie, all normal treasures by worth, then potion, then all
     # normal VP cards by worth, then Trash)
     def baseIndex(self, name):
-        try:
-            return self.baseCards.index(name)
-        except Exception:
-            return -1
+        return self.baseIndexes.get(name, -1)
 
     def isBaseExpansionCard(self, card):
-        return card.cardset_tag.lower() != "base" and card.name in self.baseCards
+        return card.cardset_tag.lower() != "base" and card.name in self.baseIndexes
 
     def by_global_sort_key(self, card):
         return (
@@ -125,7 +149,11 @@ class CardSorter(object):
         )
 
     def by_colour_sort_key(self, card):
-        return card.getType().getTypeNames(), self.get_card_name_sort_key(card.name)
+        if self.card_db is not None:
+            card_type = self.card_db.types[tuple(card.types)]
+        else:
+            card_type = card.getType()
+        return card_type.getTypeNames(), self.get_card_name_sort_key(card.name)
 
     def by_cost_sort_key(self, card):
         return (
@@ -153,14 +181,12 @@ class CardSorter(object):
         return self.sort_key(card)
 
 
-def add_card_text(cards, language="en_us"):
+def add_card_text(cards, language="en_us", card_db=None):
+    if card_db is None:
+        card_db = db.get_card_database()
     language = language.lower()
     # Read in the card text file
-    card_text_filepath = os.path.join(
-        "card_db", language, "cards_" + language.lower() + ".json.gz"
-    )
-    with resource_handling.get_resource_stream(card_text_filepath) as card_text_file:
-        card_text = json.loads(card_text_file.read().decode("utf-8"))
+    card_text = card_db.get_language_text("cards", language)
     assert language, "Could not load card text for %r" % language
 
     # Now apply to all the cards
@@ -175,12 +201,12 @@ def add_card_text(cards, language="en_us"):
     return cards
 
 
-def add_set_text(options, sets, language="en_us"):
+def add_set_text(options, sets, language="en_us", card_db=None):
+    if card_db is None:
+        card_db = db.get_card_database()
     language = language.lower()
     # Read in the set text and store for later
-    set_text_filepath = os.path.join("card_db", language, f"sets_{language}.json.gz")
-    with resource_handling.get_resource_stream(set_text_filepath) as set_text_file:
-        set_text = json.loads(set_text_file.read().decode("utf-8"))
+    set_text = card_db.get_language_text("sets", language)
     assert set_text, "Could not load set text for %r" % language
 
     # Now apply to all the sets
@@ -191,14 +217,14 @@ def add_set_text(options, sets, language="en_us"):
     return sets
 
 
-def add_type_text(types=None, language="en_us"):
+def add_type_text(types=None, language="en_us", card_db=None):
     if types is None:
         types = {}
+    if card_db is None:
+        card_db = db.get_card_database()
     language = language.lower()
     # Read in the type text and store for later
-    type_text_filepath = os.path.join("card_db", language, f"types_{language}.json.gz")
-    with resource_handling.get_resource_stream(type_text_filepath) as type_text_file:
-        type_text = json.loads(type_text_file.read().decode("utf-8"))
+    type_text = card_db.get_language_text("types", language)
     assert type_text, "Could not load type text for %r" % language
 
     # Now apply to all the types
@@ -215,25 +241,11 @@ def add_type_text(types=None, language="en_us"):
     return types
 
 
-def add_bonus_regex(options, language="en_us"):
-    language = language.lower()
-    # Read in the bonus regex terms
-    bonus_regex_filepath = os.path.join(
-        "card_db", language, f"bonuses_{language}.json.gz"
-    )
-    with resource_handling.get_resource_stream(
-        bonus_regex_filepath
-    ) as bonus_regex_file:
-        bonus_regex = json.loads(bonus_regex_file.read().decode("utf-8"))
-    assert bonus_regex, "Could not load bonus keywords for %r" % language
-
-    if not bonus_regex:
-        bonus_regex = {}
-
-    return bonus_regex
-
-
-def combine_cards(cards, old_card_type, new_card_tag, new_cardset_tag, new_type):
+def combine_cards(
+    cards, old_card_type, new_card_tag, new_cardset_tag, new_type, card_db=None
+):
+    if card_db is None:
+        card_db = db.get_card_database()
     holder = Card(
         name="*Replace Later*",
         card_tag=new_card_tag,
@@ -241,6 +253,7 @@ def combine_cards(cards, old_card_type, new_card_tag, new_cardset_tag, new_type)
         cardset_tag=new_cardset_tag,
         types=(new_type,),
         count=0,
+        card_db=card_db,
     )
     holder.image = holder.setImage()
 
@@ -259,12 +272,21 @@ def combine_cards(cards, old_card_type, new_card_tag, new_cardset_tag, new_type)
     return filteredCards
 
 
-def filter_sort_cards(cards: list[Card], options) -> list[Card]:
+def filter_sort_cards(cards: list[Card], options, card_db=None) -> list[Card]:
+    # card_db is the database view the cards were read with.  It gets the set and
+    # type text of the requested language and the expansion divider counts.
+    if card_db is None:
+        card_db = (
+            cards[0].card_db
+            if cards
+            else db.get_card_database(language=options.language).view()
+        )
+
     # Filter out cards by edition
     if options.edition and options.edition != "all":
         keep_sets = {
             set_tag
-            for set_tag, set_data in Card.sets.items()
+            for set_tag, set_data in card_db.sets.items()
             if options.edition in set_data["edition"]
         }
 
@@ -277,22 +299,22 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
         else:
             options.exclude_expansions = set(options.exclude_expansions)
         for card in cards:
-            if Card.sets[card.cardset_tag]["upgrades"]:
+            if card_db.sets[card.cardset_tag]["upgrades"]:
                 options.exclude_expansions.add(card.cardset_tag.lower())
-                card.cardset_tag = Card.sets[card.cardset_tag]["upgrades"]
+                card.cardset_tag = card_db.sets[card.cardset_tag]["upgrades"]
     if options.removed_with_expansion:
         for card in cards:
-            if Card.sets[card.cardset_tag].get("removed", False):
+            if card_db.sets[card.cardset_tag].get("removed", False):
                 options.exclude_expansions.add(card.cardset_tag.lower())
-                card.cardset_tag = Card.sets[card.cardset_tag]["removed"]
+                card.cardset_tag = card_db.sets[card.cardset_tag]["removed"]
 
     # Combine globally all cards of the given types
     # For example, Events, Landmarks, Projects, Ways, Traits
     if options.group_global:
         # First find all possible types to group that match options.group_global
         types_to_group = {}
-        for t in Card.types:
-            group_global_type = Card.types[t].getGroupGlobalType()
+        for t in card_db.types:
+            group_global_type = card_db.types[t].getGroupGlobalType()
             if group_global_type:
                 theType = "-".join(t)
                 # Save if either the old or the new type matches the option
@@ -310,6 +332,7 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
                 new_type=types_to_group[t],
                 new_card_tag=types_to_group[t].lower(),
                 new_cardset_tag=config_options.EXPANSION_GLOBAL_GROUP,
+                card_db=card_db,
             )
         if options.expansions:
             options.expansions.add(config_options.EXPANSION_GLOBAL_GROUP)
@@ -332,7 +355,7 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
                 if (card.group_tag, card.cardset_tag) not in group_holders:
                     # This is the first card in this group
                     # clone the card to be the group holder, so that the original can remain unchanged.
-                    group_holder = deepcopy(card)
+                    group_holder = card.variant()
                     group_holder.setCardCount(0)
                     group_holder.card_tag = card.group_tag
                     # These text fields should be updated later if there is a translation for this group_tag.
@@ -348,7 +371,6 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
                     if group_holder.get_GroupCost():
                         group_holder.cost = card.get_GroupCost()
                         group_holder.debtcost = 0
-                        group_holder.potioncost = 0
                     # now save the card
                     group_holders[(card.group_tag, card.cardset_tag)] = group_holder
                     keep_cards.append(group_holder)
@@ -387,23 +409,24 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
         cards = keep_cards
 
     # Get the final type names in the requested language
-    Card.type_names = add_type_text(Card.type_names, db.LANGUAGE_DEFAULT)
+    card_db.type_names = add_type_text(card_db.type_names, db.LANGUAGE_DEFAULT, card_db)
     if options.language != db.LANGUAGE_DEFAULT:
-        Card.type_names = add_type_text(Card.type_names, options.language)
+        card_db.type_names = add_type_text(
+            card_db.type_names, options.language, card_db
+        )
     for card in cards:
-        card.types_name = " - ".join([Card.type_names[t] for t in card.types])
+        card.types_name = " - ".join([card_db.type_names[t] for t in card.types])
 
     # Get the card bonus keywords in the requested language
-    bonus = add_bonus_regex(options, db.LANGUAGE_DEFAULT)
-    Card.addBonusRegex(bonus)
+    languages = [db.LANGUAGE_DEFAULT]
     if options.language != db.LANGUAGE_DEFAULT:
-        bonus = add_bonus_regex(options, options.language)
-        Card.addBonusRegex(bonus)
+        languages.append(options.language)
+    card_db.bonus_highlighter = card_db.get_bonus_highlighter(languages)
 
     # Fix up cardset text.  Waited as long as possible.
-    Card.sets = add_set_text(options, Card.sets, db.LANGUAGE_DEFAULT)
+    card_db.sets = add_set_text(options, card_db.sets, db.LANGUAGE_DEFAULT, card_db)
     if options.language != db.LANGUAGE_DEFAULT:
-        Card.sets = add_set_text(options, Card.sets, options.language)
+        card_db.sets = add_set_text(options, card_db.sets, options.language, card_db)
 
     # Split out Official and Fan set information
     Official_sets = set()  # Will hold official sets
@@ -413,10 +436,10 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
     wantedSets = set()  # Will hold all the sets requested for printing
 
     All_search = []  # Will hold all sets for searching, both set key and set_name
-    for s in Card.sets:
-        search_items = [s.lower(), Card.sets[s].get("set_name", None).lower()]
+    for s in card_db.sets:
+        search_items = [s.lower(), card_db.sets[s].get("set_name", None).lower()]
         All_search.extend(search_items)
-        if Card.sets[s].get("fan", False):
+        if card_db.sets[s].get("fan", False):
             # Fan Expansion
             Fan_sets.add(s)
             Fan_search.extend(search_items)
@@ -444,7 +467,7 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
         knownExpansions = set()
         for e in options.expansions:
             for s in Official_sets:
-                if s.lower() == e or Card.sets[s].get("set_name", "").lower() == e:
+                if s.lower() == e or card_db.sets[s].get("set_name", "").lower() == e:
                     wantedSets.add(s)
                     knownExpansions.add(e)
         # Give indication if an imput did not match anything
@@ -470,7 +493,7 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
         knownExpansions = set()
         for e in options.fan:
             for s in Fan_sets:
-                if s.lower() == e or Card.sets[s].get("set_name", "").lower() == e:
+                if s.lower() == e or card_db.sets[s].get("set_name", "").lower() == e:
                     wantedSets.add(s)
                     knownExpansions.add(e)
         # Give indication if an imput did not match anything
@@ -494,8 +517,8 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
         options.exclude_expansions = expanded_expansions
         knownExpansions = set()
         for e in options.exclude_expansions:
-            for s in Card.sets:
-                if s.lower() == e or Card.sets[s].get("set_name", "").lower() == e:
+            for s in card_db.sets:
+                if s.lower() == e or card_db.sets[s].get("set_name", "").lower() == e:
                     wantedSets.discard(s)
                     knownExpansions.add(e)
         # Give indication if an input did not match anything
@@ -511,15 +534,15 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
         if c.cardset_tag in wantedSets:
             if options.group_kingdom:
                 # Separate non-Kingdom cards (without Randomizer) into new "Extras" set
-                if not c.randomizer and Card.sets[c.cardset_tag]["has_extras"]:
+                if not c.randomizer and card_db.sets[c.cardset_tag]["has_extras"]:
                     c.cardset_tag += db.EXPANSION_EXTRA_POSTFIX
             # Add the cardset informaiton to the card and add it to the list of cards to use
-            c.cardset = Card.sets[c.cardset_tag].get("set_name", c.cardset_tag)
+            c.cardset = card_db.sets[c.cardset_tag].get("set_name", c.cardset_tag)
             keep_cards.append(c)
     cards = keep_cards
 
     # Now add text to the cards.  Waited as long as possible to catch all groupings
-    cards = add_card_text(cards, options.language)
+    cards = add_card_text(cards, options.language, card_db)
 
     # Get list of cards from a file
     if options.cardlist:
@@ -548,6 +571,7 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
             for card in cards
             if "base" in [set_name.lower() for set_name in card.cardset_tags]
         },
+        card_db,
     )
 
     # Optionally remove base cards from expansions that have them
@@ -587,13 +611,13 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
                     ),
                 }
 
-        for set_tag, set_values in Card.sets.items():
+        for set_tag, set_values in card_db.sets.items():
             exp = set_values["set_name"]
             if exp in cardnamesByExpansion:
                 exp_name = exp
 
                 count = randomizerCountByExpansion[exp]
-                Card.sets[set_tag]["count"] = count
+                card_db.sets[set_tag]["count"] = count
                 if "no_randomizer" in set_values:
                     if set_values["no_randomizer"]:
                         count = 0
@@ -624,6 +648,7 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
                     extra=set_values.get("set_text", ""),
                     count=count,
                     card_tag=set_tag,
+                    card_db=card_db,
                 )
                 cards.append(c)
 
@@ -633,9 +658,9 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
         # The index in each case is lower case for easier matching
         # The value in each case is the type index as used in types_en_us.json
         types_lookup = defaultdict(dict)
-        for x in Card.type_names:
+        for x in card_db.type_names:
             types_lookup[x.lower()] = x
-            types_lookup[Card.type_names[x].lower()] = x
+            types_lookup[card_db.type_names[x].lower()] = x
 
         # Start the valid lists
         type_unknown = []
@@ -680,7 +705,7 @@ def filter_sort_cards(cards: list[Card], options) -> list[Card]:
     return cards
 
 
-def calculate_layout(options, cards=None):
+def calculate_layout(options, cards=None, card_db=None):
     if cards is None:
         cards = []
     options.dominionCardWidth, options.dominionCardHeight = (
@@ -693,18 +718,29 @@ def calculate_layout(options, cards=None):
         options.minmargin
     )
 
-    dd = DividerDrawer(options)
+    dd = DividerDrawer(options, card_db)
     dd.calculatePages(cards)
     return dd
 
 
-def generate(options):
-    cards = db.read_card_data(options)
+def prepare_generation(options, card_db=None):
+    # Read, filter and sort the cards and lay them out.
+    # Returns the DividerDrawer, ready to draw, and the cards.
+    # Each generation works on its own view of the (shared) card database
+    with profiling.phase("load_card_database"):
+        if card_db is None:
+            card_db = db.get_card_database(language=options.language)
+        card_db = card_db.view()
+
+    with profiling.phase("read_card_data"):
+        cards = db.read_card_data(options, card_db)
     assert cards, "No cards after reading"
-    cards = filter_sort_cards(cards, options)
+    with profiling.phase("filter_sort_cards"):
+        cards = filter_sort_cards(cards, options, card_db)
     assert cards, "No cards after filtering/sorting"
 
-    dd = calculate_layout(options, cards)
+    with profiling.phase("calculate_layout"):
+        dd = calculate_layout(options, cards, card_db)
 
     logger.info(
         f"Paper dimensions: {options.paperwidth / cm:.2f}cm (w) x {options.paperheight / cm:.2f}cm (h)"
@@ -719,8 +755,130 @@ def generate(options):
     logger.info(
         f"Margins: {options.horizontalMargin / cm:.2f}cm h, {options.verticalMargin / cm:.2f}cm v"
     )
+    return dd, cards
+
+
+def generate(options, card_db=None):
+    # With --cache-dir, the same dividers are only drawn once and then copied from the cache
+    cache = output_cache.get_output_cache(options)
+    if cache is None:
+        _generate(options, card_db)
+        return
+    key = output_cache.get_cache_key(options)
+    data = cache.get(key)
+    if data is None:
+        outfile = options.outfile
+        options.outfile = BytesIO()
+        try:
+            _generate(options, card_db)
+            data = options.outfile.getvalue()
+        finally:
+            options.outfile = outfile
+        cache.put(key, data)
+    if hasattr(options.outfile, "write"):
+        options.outfile.write(data)
+    else:
+        with open(options.outfile, "wb") as f:
+            f.write(data)
 
+
+def _generate(options, card_db=None):
+    dd, cards = prepare_generation(options, card_db)
     dd.draw(cards)
+    log_cache_stats()
+
+
+def generate_chunks(options, chunk_pages, card_db=None):
+    # Like generate, but yields the dividers chunk_pages sheets at a time, each chunk as
+    # the bytes of a PDF of its own, as soon as it is drawn.
+    # Only one chunk is kept in memory at a time, however many pages there are.
+    dd, cards = prepare_generation(options, card_db)
+    yield from dd.drawChunks(cards, chunk_pages)
+    log_cache_stats()
+
+
+def log_cache_stats():
+    logger.debug(f"Resource cache: {resource_handling.get_cache_stats()}")
+    logger.debug(f"Artwork cache: {artwork.get_cache_stats()}")
+    logger.debug(f"Output cache: {output_cache.get_cache_stats()}")
+    logger.debug(f"Page cache: {page_cache.get_cache_stats()}")
+    logger.debug(f"Font registry: {fonts.get_cache_stats()}")
+    logger.debug(f"Font subset cache: {fonts.get_subset_cache_stats()}")
+    logger.debug(f"Image cache: {images.get_cache_stats()}")
+
+
+def get_chunk_filename(outfile, number):
+    # The file for chunk number (from 1) of the output, with --chunk-pages
+    base, ext = os.path.splitext(outfile)
+    return f"{base}-{number:03d}{ext or '.pdf'}"
+
+
+def generate_output(options):
+    # Generate the file the options ask for: the dividers, or the preview png next to where they would go.
+    # With --profile, a report on where the time went is written next to it.
+    if options.profile:
+        report = profiling.get_report_filename(options.outfile)
+        with profiling.Profile(trace_memory=options.profile == "memory") as profile:
+            fname = _generate_output(options)
+        profile.write(report)
+        logger.info(f"Profile written to {report}: {profile.wall_seconds:.2f}s")
+        return fname
+    return _generate_output(options)
+
+
+def _generate_output(options):
+    if options.preview:
+        fname = f"{os.path.splitext(options.outfile)[0]}.png"
+        sample = generate_sample(options)
+        with open(fname, "wb") as f:
+            f.write(sample)
+        return fname
+    if options.chunk_pages:
+        # Write each chunk as soon as it's done, returns the list of files written
+        fnames = []
+        for chunk in generate_chunks(options, options.chunk_pages):
+            fnames.append(get_chunk_filename(options.outfile, len(fnames) + 1))
+            with open(fnames[-1], "wb") as f:
+                f.write(chunk)
+        return fnames
+    generate(options)
+    return options.outfile
+
+
+def generate_job(options):
+    # Runs one job of generate_many. Returns the output file name and the time taken.
+    start = time.perf_counter()
+    fname = generate_output(options)
+    return {"outfile": fname, "seconds": time.perf_counter() - start}
+
+
+def generate_many(options_list, jobs=1):
+    # Generate the output for each of the (cleaned) options in the list.
+    # The jobs share the card database, fonts and everything else that is loaded once per process.
+    # With jobs > 1 they are spread over that many processes, each doing one job at a time.
+    # Returns a dict with the outfile and the seconds taken for each job, in the order given.
+    if jobs > 1 and len(options_list) > 1:
+        for options in options_list:
+            options.jobs = 1  # the pages of each job are drawn in its own process
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(generate_job, options_list))
+    return [generate_job(options) for options in options_list]
+
+
+def read_batch(fname):
+    # Each line of a batch file is a json object with the command line "args" for one job,
+    # either as a list or as a single string, like the requests of dominion_dividers_service.
+    options_list = []
+    with open(fname) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            args = json.loads(line).get("args", [])
+            if isinstance(args, str):
+                args = shlex.split(args)
+            options = config_options.parse_opts(args)
+            options_list.append(config_options.clean_opts(options))
+    return options_list
 
 
 def main():
@@ -728,9 +886,13 @@ def main():
     logger.remove()
     logger.add(sys.stderr, level=options.log_level)
 
+    if options.batch:
+        start = time.perf_counter()
+        results = generate_many(read_batch(options.batch), options.jobs)
+        for result in results:
+            print(f"{result['seconds']:8.2f}s  {result['outfile']}")
+        print(f"{time.perf_counter() - start:8.2f}s  total for {len(results)} job(s)")
+        return
+
     options = config_options.clean_opts(options)
-    if options.preview:
-        fname = f"{os.path.splitext(options.outfile)[0]}.png"
-        open(fname, "wb").write(generate_sample(options).getvalue())
-    else:
-        generate(options)
+    generate_output(options)
@@ -0,0 +1,118 @@
+###########################################################################
+# Turning the markup of the card database into reportlab paragraph markup.
+#
+# The card texts use their own tags (<line>, <c>...</c>, <tab>, <br>, ...)
+# and words that stand for images (2 Coins, <*COIN*>, Debt, VP, Potion,
+# SunToken, ...).  Each of the two steps below finds all of its tokens with
+# one combined regex and replaces each token with its final markup in a single
+# pass over the text, instead of one substitution per tag over the whole text.
+#
+# The results are cached, as the same texts come up on many dividers and the
+# images are redone at every font size tried while fitting the text.
+###########################################################################
+
+import functools
+import re
+
+from . import resource_handling
+
+# The number of converted texts to keep
+MARKUP_CACHE_SIZE = 4096
+
+PARA_TEMPLATE = "\n<para alignment='{}'>"
+PARA_END = "</para>"
+
+# The markup for each text tag (see add_inline_text for <line>)
+TEXT_TAGS = {
+    "<tab>": "&nbsp;" * 4,
+    "<t>": "&nbsp;" * 4,
+    "\t": "&nbsp;" * 4,
+    "<br>": "<br />",
+    "<n>": "\n",
+}
+for short, alignment in [
+    ("c", "center"),
+    ("l", "left"),
+    ("r", "right"),
+    ("j", "justify"),
+]:
+    for tag in [short, alignment]:
+        TEXT_TAGS[f"<{tag}>"] = PARA_TEMPLATE.format(alignment)
+        TEXT_TAGS[f"</{tag}>"] = PARA_END
+
+TEXT_TOKENS = re.compile(
+    "|".join(re.escape(tag) for tag in sorted(TEXT_TAGS, key=len, reverse=True))
+    + r"|\<line\>"
+)
+
+# (text every match contains, pattern, image file name, image width in font sizes,
+#  image height in percent of the line, size of the text shown with the image in
+#  font sizes or None)
+# Where tokens overlap, the earlier pattern wins.
+IMAGE_SPECS = [
+    # Coins
+    # TODO: coin text baseline should align with surrounding text
+    ("<*", r"(\d+)\s\<\*COIN\*\>", "coin_small_\\1.png", 2.4, 200, None),
+    ("oin", r"(\d+)\s(c|C)oin(s)?", "coin_small_\\1.png", 1.2, 100, None),
+    ("oin", r"([Xx])\s(c|C)oin(s)?", "coin_small_x.png", 1.2, 100, None),
+    ("oin", r"\?\s(c|C)oin(s)?", "coin_small_question.png", 1.2, 100, None),
+    ("oin", r"(empty|\_)\s(c|C)oin(s)?", "coin_small_empty.png", 1.2, 100, None),
+    # VP
+    ("VP", r"(?:\s+|\<)VP(?:\s+|\>|\.|$)", "victory_emblem.png", 1.25, 100, None),
+    ("<*", r"(\d+)\s*\<\*VP\*\>", "victory_emblem.png", 2, 160, 1.3),
+    # Debt
+    ("Debt", r"(\d+)\sDebt", "debt_\\1.png", 1.2, 105, None),
+    ("Debt", r"Debt", "debt.png", 1.2, 105, None),
+    # Potion
+    ("<*", r"(\d+)\s*\<\*POTION\*\>", "potion_small.png", 2, 140, 1.5),
+    ("Potion", r"Potion", "potion_small.png", 1.2, 100, None),
+    # Sun
+    ("SunToken", r"SunToken", "sun.png", 1.2, 120, None),
+]
+IMAGE_PATTERNS = [re.compile(spec[1]) for spec in IMAGE_SPECS]
+IMAGE_TEMPLATE = (
+    '<img src="{fpath}" width={width} height="{height_percent}%" valign="middle" />'
+)
+
+
+@functools.lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def add_inline_text(text, dashes):
+    # Replace the text tags with paragraph markup; <line> is a centred line of dashes em dashes
+    line = PARA_TEMPLATE.format("center") + "&mdash;" * dashes + PARA_END + "\n"
+
+    def replace(match):
+        token = match.group(0)
+        return line if token == "<line>" else TEXT_TAGS[token]
+
+    return TEXT_TOKENS.sub(replace, text).strip().strip("\n")
+
+
+@functools.lru_cache(maxsize=None)
+def get_image_tokens(indexes):
+    # The regex matching the images with the given indexes into IMAGE_SPECS.
+    # A regex with many alternatives has to try them all at every character, so
+    # each text is only searched for the images it could contain.
+    return re.compile("|".join(f"(?P<image{i}>{IMAGE_SPECS[i][1]})" for i in indexes))
+
+
+@functools.lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def add_inline_images(text, fontsize):
+    # Replace the coin, VP, debt, potion and sun markup with inline images sized for fontsize
+    indexes = tuple(i for i, spec in enumerate(IMAGE_SPECS) if spec[0] in text)
+    if not indexes:
+        return text.strip()
+
+    def replace(match):
+        index = int(match.lastgroup[len("image") :])
+        _, _, fname, width, height_percent, text_size = IMAGE_SPECS[index]
+        token = IMAGE_PATTERNS[index].fullmatch(match.group(0))
+        image = IMAGE_TEMPLATE.format(
+            fpath=resource_handling.get_image_filepath(token.expand(fname)),
+            width=fontsize * width,
+            height_percent=height_percent,
+        )
+        if text_size is None:
+            return image
+        return token.expand(f"<font size={fontsize * text_size}>\\1</font>") + image
+
+    return get_image_tokens(indexes).sub(replace, text).strip()
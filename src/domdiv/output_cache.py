@@ -0,0 +1,244 @@
+###########################################################################
+# A disk cache of finished output.
+#
+# Many runs ask for exactly the same dividers (the defaults, sleeved, A4...),
+# so with --cache-dir the PDF (or preview PNG) made for a set of options is
+# kept on disk and handed out again for the same options instead of drawing
+# it again.  Entries are keyed by a hash of the cleaned options, put into a
+# canonical form so that equivalent command lines share an entry, together
+# with the package version and a digest of the card database.  Once the
+# directory grows over its size limit the least recently used entries go.
+#
+# Fonts are only keyed by --font-dir, so clear the cache after changing the
+# fonts in it.
+###########################################################################
+
+import collections
+import functools
+import hashlib
+import json
+import os
+import threading
+
+from loguru import logger
+
+import domdiv
+
+from . import db
+
+# Bump to drop everything cached by older versions of this module
+CACHE_VERSION = 1
+DEFAULT_CACHE_MEGABYTES = 512
+CACHE_SUFFIX = ".cache"
+
+# Options that don't change the output
+IGNORED_OPTIONS = [
+    "outfile",
+    "jobs",  # only changes where the images are encoded
+    "incremental",  # only changes how the same pages are embedded
+    "divider_forms",  # likewise
+    "chunk_pages",
+    "batch",
+    "profile",
+    "log_level",
+    "cache_dir",
+    "no_cache",
+    "cache_size",
+    "font_subset_cache",
+    "image_cache_dir",
+    "tab_artwork_cache_dir",
+    "c",
+    "w",
+]
+
+# Options only kept for compatibility, whose effect clean_opts has already
+# folded into the others
+FOLDED_OPTIONS = [
+    "sleeved",
+    "sleeved_thick",
+    "sleeved_thin",
+    "wrapper_meta",
+    "pull_tab_meta",
+    "tent_meta",
+    "exclude_events",
+    "exclude_landmarks",
+    "exclude_projects",
+    "exclude_ways",
+    "exclude_traits",
+]
+
+
+def canonical(value):
+    # value in a form that JSON keeps in a fixed order
+    if isinstance(value, (set, frozenset)):
+        return sorted(canonical(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    return value
+
+
+def get_file_digest(fname):
+    with open(fname, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_canonical_options(options):
+    # The cleaned options as a dict that is the same for equivalent command lines
+    values = {
+        key: canonical(value)
+        for key, value in vars(options).items()
+        if key not in IGNORED_OPTIONS + FOLDED_OPTIONS
+    }
+    # --sleeved is --size=sleeved, and names of sizes aren't case sensitive
+    size = "SLEEVED" if options.sleeved else (options.size or "").upper()
+    values["size"] = "NORMAL" if size == "UNSLEEVED" else size
+    if options.papersize:
+        values["papersize"] = options.papersize.upper()
+    if options.label_name:
+        values["label_name"] = options.label_name.upper()
+    if options.cardlist:
+        # what counts is what's in the list, not where it is
+        values["cardlist"] = get_file_digest(options.cardlist)
+    if options.preview:
+        # always the first page
+        values.pop("num_pages", None)
+    else:
+        values.pop("preview_resolution", None)
+    return values
+
+
+@functools.lru_cache(maxsize=None)
+def get_card_db_digest(language):
+    return db.get_sources_digest("card_db", language)
+
+
+def get_cache_key(options, kind="pdf"):
+    # The key of the output of the given kind for the cleaned options
+    key = {
+        "cache_version": CACHE_VERSION,
+        "version": getattr(domdiv, "__version__", None),
+        "card_db": get_card_db_digest(options.language),
+        "kind": kind,
+        "options": get_canonical_options(options),
+    }
+    text = json.dumps(key, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class OutputCache(object):
+    # The outputs in one directory, one file per key
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_MEGABYTES * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats_counter = collections.Counter()
+        self.lock = threading.Lock()
+
+    def get_filename(self, key):
+        return os.path.join(self.directory, f"{key}{CACHE_SUFFIX}")
+
+    def count(self, name):
+        with self.lock:
+            self.stats_counter[name] += 1
+
+    def get(self, key):
+        # The cached output for the key, or None
+        fname = self.get_filename(key)
+        try:
+            with open(fname, "rb") as f:
+                data = f.read()
+            # the modification time is when it was last used, for the eviction
+            os.utime(fname)
+        except OSError:
+            self.count("misses")
+            return None
+        self.count("hits")
+        return data
+
+    def put(self, key, data):
+        fname = self.get_filename(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write to a temporary file first, so other processes never see half a file
+            tmpname = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmpname, "wb") as f:
+                f.write(data)
+            os.replace(tmpname, fname)
+        except OSError as e:
+            logger.warning(f"Could not save output to {self.directory}: {e}")
+            return
+        self.count("writes")
+        self.evict()
+
+    def get_entries(self):
+        # [(last used, size, file name)] of the entries, oldest first
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(CACHE_SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return []
+        return sorted(entries)
+
+    def evict(self):
+        # Remove the least recently used entries until the directory is within
+        # max_bytes, always keeping the newest entry
+        entries = self.get_entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                # someone else got there first
+                continue
+            total -= size
+            self.count("evictions")
+
+    def stats(self):
+        entries = self.get_entries()
+        with self.lock:
+            stats = {
+                name: self.stats_counter[name]
+                for name in ["hits", "misses", "writes", "evictions"]
+            }
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def clear(self):
+        for _, _, fname in self.get_entries():
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+        with self.lock:
+            self.stats_counter.clear()
+
+
+# The caches used so far, by (directory, max_bytes)
+output_caches = {}
+output_caches_lock = threading.Lock()
+
+
+def get_output_cache(options):
+    # The cache the options ask for, or None
+    if options.no_cache or not options.cache_dir:
+        return None
+    key = (os.path.abspath(options.cache_dir), options.cache_size * 2**20)
+    with output_caches_lock:
+        if key not in output_caches:
+            output_caches[key] = OutputCache(*key)
+        return output_caches[key]
+
+
+def get_cache_stats():
+    with output_caches_lock:
+        caches = list(output_caches.values())
+    return {cache.directory: cache.stats() for cache in caches}
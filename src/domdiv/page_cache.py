@@ -0,0 +1,145 @@
+###########################################################################
+# Reusing pages between generations (--incremental).
+#
+# The pages are laid out before anything is drawn, so whether a page will
+# look the same as one drawn before is known up front: it does if the
+# dividers on it (their cards, tabs and where on the sheet they go) and the
+# options that change how dividers are drawn are the same.  Which sheet of the
+# document it is, and how the layout goes on after it, don't matter.  Options that only pick and group the
+# cards (like --expansions) are left out of a page's fingerprint, as their
+# effect is in the cards on the page, so adding an expansion only redraws
+# the pages its cards land on and the ones they push along.
+#
+# Each page is drawn as a PDF of its own and kept here (and in --cache-dir),
+# and the document is joined from them.
+###########################################################################
+
+import collections
+import hashlib
+import json
+import threading
+
+import domdiv
+
+from . import output_cache
+from .cards import Card
+
+PAGE_CACHE_BYTES = 128 * 2**20
+
+# Options that only decide which cards there are and what is on them,
+# none of which is read while drawing
+SELECTION_OPTIONS = [
+    "base_cards_with_expansion",
+    "cardlist",
+    "curse10",
+    "edition",
+    "exclude_expansions",
+    "expansion_dividers",
+    "expansion_dividers_long_name",
+    "expansions",
+    "fan",
+    "group_global",
+    "group_kingdom",
+    "group_special",
+    "include_blanks",
+    "no_single_card_groups",
+    "no_trash",
+    "only_type_all",
+    "only_type_any",
+    "removed_with_expansion",
+    "start_decks",
+    "upgrade_with_expansion",
+]
+
+IGNORED_OPTIONS = (
+    output_cache.IGNORED_OPTIONS + SELECTION_OPTIONS + ["num_pages", "incremental"]
+)
+
+
+def encode(obj):
+    # JSON for the objects on a page
+    if isinstance(obj, Card):
+        attributes = obj.getAttributes()
+        del attributes["card_db"]
+        return attributes
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    if hasattr(obj, "getDrawnAttributes"):
+        # CardPlot
+        return obj.getDrawnAttributes()
+    return repr(obj)
+
+
+def get_page_key(options, page):
+    # The fingerprint of drawing the page (hMargin, vMargin, items) with the options
+    values = {
+        key: value for key, value in vars(options).items() if key not in IGNORED_OPTIONS
+    }
+    if not (options.info or options.info_all):
+        # only printed on the info pages
+        values.pop("argv", None)
+        values.pop("help", None)
+    key = {
+        "cache_version": output_cache.CACHE_VERSION,
+        "version": getattr(domdiv, "__version__", None),
+        "card_db": output_cache.get_card_db_digest(options.language),
+        "options": values,
+        "page": page,
+    }
+    text = json.dumps(key, sort_keys=True, default=encode)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PageCache(object):
+    # The most recently used pages, each a PDF of its own, up to max_bytes
+    def __init__(self, max_bytes=PAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.pages = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.pages:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.pages.move_to_end(key)
+            return self.pages[key]
+
+    def put(self, key, data):
+        with self.lock:
+            if key in self.pages:
+                return
+            self.pages[key] = data
+            self.bytes += len(data)
+            # always keep the newest page
+            while self.bytes > self.max_bytes and len(self.pages) > 1:
+                _, old = self.pages.popitem(last=False)
+                self.bytes -= len(old)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.pages),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+page_cache = PageCache()
+
+
+def get_cache_stats():
+    return page_cache.stats()
@@ -0,0 +1,111 @@
+###########################################################################
+# Rendering the --preview image.
+#
+# The preview is the front of the first page, drawn as usual and rasterized
+# with pdfium (the optional pypdfium2 package) in this process.  Without it,
+# ImageMagick is used through wand, which is much slower since it hands the
+# PDF to Ghostscript.
+#
+# reportlab's renderPM only rasterizes graphics Drawings (and needs rlPyCairo),
+# not the canvas the dividers are drawn on, so the page still goes through a
+# PDF in memory.  With the images kept encoded (see images.py) saving it takes
+# a few milliseconds, and pdfium rasterizes it faster than drawing it again in
+# Python could; benchmarks/preview.py shows where the time goes.
+#
+# Previews are cached by the options they were made with, so asking for the
+# same preview again (which a web page tends to do) costs nothing.
+###########################################################################
+
+import collections
+import io
+import json
+import threading
+
+try:
+    import pypdfium2
+
+    have_pdfium = True
+except ImportError:
+    have_pdfium = False
+
+# How many previews to keep
+PREVIEW_CACHE_SIZE = 32
+
+# Options that don't change what the preview looks like
+IGNORED_OPTIONS = [
+    "outfile",
+    "num_pages",
+    "jobs",
+    "chunk_pages",
+    "batch",
+    "profile",
+    "log_level",
+]
+
+
+def get_fingerprint(options):
+    # A key for everything in the options that the preview depends on
+    values = {
+        key: value for key, value in vars(options).items() if key not in IGNORED_OPTIONS
+    }
+    return json.dumps(values, sort_keys=True, default=repr)
+
+
+def render_png(pdf, resolution):
+    # Returns the first page of the PDF as a PNG image at the given resolution in DPI
+    if have_pdfium:
+        document = pypdfium2.PdfDocument(pdf)
+        try:
+            image = document[0].render(scale=resolution / 72).to_pil()
+        finally:
+            document.close()
+        out = io.BytesIO()
+        image.save(out, "PNG")
+        return out.getvalue()
+
+    from wand.image import Image
+
+    out = io.BytesIO()
+    with Image(blob=pdf, resolution=resolution) as sample:
+        sample.format = "png"
+        sample.save(out)
+    return out.getvalue()
+
+
+class PreviewCache(object):
+    # The most recently used previews by fingerprint
+    def __init__(self, size=PREVIEW_CACHE_SIZE):
+        self.size = size
+        self.previews = collections.OrderedDict()
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, fingerprint, render):
+        # Returns the cached preview for the fingerprint, or the one render() makes
+        with self.lock:
+            if fingerprint in self.previews:
+                self.hits += 1
+                self.previews.move_to_end(fingerprint)
+                return self.previews[fingerprint]
+            self.misses += 1
+        png = render()
+        with self.lock:
+            self.previews[fingerprint] = png
+            while len(self.previews) > self.size:
+                self.previews.popitem(last=False)
+        return png
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.previews)}
+
+    def clear(self):
+        with self.lock:
+            self.previews.clear()
+            self.hits = self.misses = 0
+
+
+preview_cache = PreviewCache()
+
+
+def get_cache_stats():
+    return preview_cache.stats()
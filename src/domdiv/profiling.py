@@ -0,0 +1,224 @@
+###########################################################################
+# Profiling a generation.
+#
+# While a Profile is active (--profile, or "with Profile() as profile:" around
+# generate()), the phases of the generation (reading the cards, sorting them,
+# the layout, drawing and saving) and every page drawn are timed, with their
+# wall and CPU time.  It also counts some of the calls that tend to dominate
+# the time, where domdiv makes them, and reports how the hits and misses of the
+# caches changed meanwhile.  The caches are shared by the whole process, so
+# those also count any generations running at the same time (as in the service).
+#
+# By default only the peak resident size of the whole process is reported,
+# once, since it never goes down.  With trace_memory (--profile=memory) each
+# phase and page gets the peak of the memory Python allocated during it, but
+# that makes the generation many times slower.
+#
+# Outside of a Profile, phase() and page() do nothing.  Profiling slows the
+# generation down, so compare profiles with other profiles.
+###########################################################################
+
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+
+    have_resource = True
+except ImportError:
+    have_resource = False
+
+# The calls counted with count(), by name in the report
+COUNTED_CALLS = ["paragraphs", "string_widths", "images_drawn", "pages_shown"]
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+def count(name, calls=1):
+    # Counts calls in the profile running where they're made, if any
+    profile = current_profile.get()
+    if profile is not None:
+        profile.counters[name] += calls
+
+
+def get_cache_counts():
+    # The cache counters of the process, flattened to {name: count}.
+    # The modules with the caches count their calls here, so import them late.
+    from . import (
+        artwork,
+        fonts,
+        images,
+        output_cache,
+        page_cache,
+        resource_handling,
+        textfit,
+    )
+
+    counts = {}
+    fits = textfit._fit_paragraphs.cache_info()
+    counts["text_fit_hits"] = fits.hits
+    counts["text_fit_misses"] = fits.misses
+    for kind, stats in resource_handling.get_cache_stats().items():
+        counts[f"resource_{kind}_hits"] = stats["hits"]
+        counts[f"resource_{kind}_misses"] = stats["misses"]
+    for name, count in artwork.get_cache_stats().items():
+        if name not in ["entries", "bytes", "max_bytes"]:
+            counts[f"artwork_{name}"] = count
+    font_styles = fonts.get_cache_stats()
+    counts["font_style_hits"] = font_styles["hits"]
+    counts["font_style_misses"] = font_styles["misses"]
+    font_subsets = fonts.get_subset_cache_stats()
+    counts["font_subset_hits"] = font_subsets["hits"]
+    counts["font_subset_misses"] = font_subsets["misses"]
+    for name, count in images.get_cache_stats().items():
+        if name not in ["entries", "bytes", "max_bytes"]:
+            counts[f"image_{name}"] = count
+    pages = page_cache.get_cache_stats()
+    counts["page_hits"] = pages["hits"]
+    counts["page_misses"] = pages["misses"]
+    for stats in output_cache.get_cache_stats().values():
+        for name in ["hits", "misses"]:
+            counts[f"output_{name}"] = counts.get(f"output_{name}", 0) + stats[name]
+    return counts
+
+
+def get_peak_rss():
+    # The peak resident size of this process in bytes, if we can tell
+    if not have_resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Timing(object):
+    # Wall and CPU time, and with traceMemory the peak memory, of one phase or page
+    def __init__(self, name, traceMemory, **info):
+        self.name = name
+        self.traceMemory = traceMemory
+        self.info = info
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        if traceMemory:
+            self.memory = tracemalloc.get_traced_memory()[0]
+            self.peak = self.memory
+            tracemalloc.reset_peak()
+        else:
+            self.memory = self.peak = None
+
+    def update_peak(self):
+        if self.traceMemory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+
+    def finish(self):
+        allocated = None
+        if self.traceMemory:
+            self.update_peak()
+            allocated = tracemalloc.get_traced_memory()[0] - self.memory
+        return dict(
+            name=self.name,
+            **self.info,
+            wall_seconds=time.perf_counter() - self.wall,
+            cpu_seconds=time.process_time() - self.cpu,
+            peak_bytes=self.peak,
+            allocated_bytes=allocated,
+        )
+
+
+class Profile(object):
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.pages = []
+        self.counters = collections.Counter()
+        self.process_counters = {}
+        self.wall_seconds = self.cpu_seconds = 0
+        self.peak_bytes = 0
+        self.running = []
+
+    def __enter__(self):
+        if current_profile.get() is not None:
+            raise RuntimeError("A profile is already running")
+        for name in COUNTED_CALLS:
+            self.counters[name] = 0
+        self.token = current_profile.set(self)
+        self.started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        self.cache_counts = get_cache_counts()
+        self.total = Timing("total", self.trace_memory)
+        self.running = [self.total]
+        return self
+
+    def __exit__(self, *exc_info):
+        self.running = []
+        total = self.total.finish()
+        self.wall_seconds = total["wall_seconds"]
+        self.cpu_seconds = total["cpu_seconds"]
+        self.peak_bytes = total["peak_bytes"] if self.trace_memory else get_peak_rss()
+        self.process_counters = {
+            name: calls - self.cache_counts.get(name, 0)
+            for name, calls in get_cache_counts().items()
+        }
+        if self.started_tracing:
+            tracemalloc.stop()
+        current_profile.reset(self.token)
+
+    @contextlib.contextmanager
+    def timing(self, records, name, **info):
+        # The enclosing phases keep their own peak from before this one
+        for outer in self.running:
+            outer.update_peak()
+        timing = Timing(name, self.trace_memory, **info)
+        self.running.append(timing)
+        try:
+            yield
+        finally:
+            self.running.pop()
+            records.append(timing.finish())
+            if self.trace_memory:
+                for outer in self.running:
+                    outer.peak = max(outer.peak, timing.peak)
+
+    def report(self):
+        return {
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_bytes": self.peak_bytes,
+            "memory": "traced" if self.trace_memory else "rss",
+            "phases": self.phases,
+            "pages": self.pages,
+            "counters": dict(self.counters),
+            "process_counters": self.process_counters,
+        }
+
+    def write(self, fname):
+        with open(fname, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def phase(name):
+    # Times a phase of the generation, if it's being profiled
+    profile = current_profile.get()
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.timing(profile.phases, name)
+
+
+def page(number, back=False):
+    # Times drawing one side of a sheet, if the generation is being profiled
+    profile = current_profile.get()
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.timing(profile.pages, f"page {number}", page=number, back=back)
+
+
+def get_report_filename(outfile):
+    # The profile report goes next to the file it profiled
+    return f"{os.path.splitext(outfile)[0]}.profile.json"
@@ -1,9 +1,12 @@
 import atexit
+import collections
 import contextlib
 import gzip
 import importlib.resources
 import os
 
+from PIL import Image
+
 
 def iter_resource_dir(path):
     return importlib.resources.files(f"domdiv").joinpath(path).iterdir()
@@ -20,17 +23,95 @@ def get_resource_stream(path):
         yield gzip.GzipFile(fileobj=f)
 
 
+@contextlib.contextmanager
+def get_resource_bytestream(path):
+    ref = importlib.resources.files("domdiv").joinpath(path)
+    with ref.open("rb") as f:
+        yield f
+
+
+def get_resource_bytes(path):
+    return importlib.resources.files("domdiv").joinpath(path).read_bytes()
+
+
+class ResourceCache(object):
+    # Resolves each packaged resource to a file path once, and reads the pixel size
+    # of each image once, instead of doing it for every icon drawn.
+    # Counts hits and misses for each kind of lookup.
+    def __init__(self):
+        # One ExitStack for all the resolved paths, closed once at exit
+        self.file_manager = contextlib.ExitStack()
+        atexit.register(self.file_manager.close)
+        self.paths = {}
+        self.sizes = {}
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+
+    def lookup(self, kind, cache, key, load):
+        try:
+            value = cache[key]
+        except KeyError:
+            self.misses[kind] += 1
+            value = cache[key] = load(key)
+        else:
+            self.hits[kind] += 1
+        return value
+
+    def filepath(self, fpath):
+        return self.lookup("path", self.paths, fpath, self.resolve)
+
+    def resolve(self, fpath):
+        ref = importlib.resources.files("domdiv") / fpath
+        return self.file_manager.enter_context(importlib.resources.as_file(ref))
+
+    def image_size(self, fname):
+        return self.lookup("size", self.sizes, fname, self.read_image_size)
+
+    def read_image_size(self, fname):
+        # Only the header is read, and the file is closed again straight away
+        with Image.open(self.filepath(os.path.join("images", fname))) as image:
+            return image.size
+
+    def stats(self):
+        # {kind: {"hits": n, "misses": n, "entries": n}}
+        entries = {"path": self.paths, "size": self.sizes}
+        return {
+            kind: {
+                "hits": self.hits[kind],
+                "misses": self.misses[kind],
+                "entries": len(cache),
+            }
+            for kind, cache in entries.items()
+        }
+
+    def clear(self):
+        # Forget everything looked up so far.  Files extracted for the resolved
+        # paths stay around until exit, since something may still be using them.
+        self.paths.clear()
+        self.sizes.clear()
+        self.hits.clear()
+        self.misses.clear()
+
+
+resource_cache = ResourceCache()
+
+
 def get_resource_filepath(fpath):
-    file_manager = contextlib.ExitStack()
-    atexit.register(file_manager.close)
-    ref = importlib.resources.files("domdiv") / fpath
-    path = file_manager.enter_context(importlib.resources.as_file(ref))
-    return path
+    return resource_cache.filepath(fpath)
 
 
 def get_image_filepath(fname):
     return get_resource_filepath(os.path.join("images", fname))
 
 
+def get_image_size(fname):
+    # The (width, height) of an image in pixels
+    return resource_cache.image_size(fname)
+
+
+def get_cache_stats():
+    return resource_cache.stats()
+
+
 def resource_exists(fpath):
     return importlib.resources.files("domdiv").joinpath(fpath).is_file()
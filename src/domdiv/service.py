@@ -0,0 +1,322 @@
+###########################################################################
+# A long lived divider generator.
+#
+# A DividerService loads the card database, all the language files and the
+# fonts once and then serves any number of generate() calls against them, so
+# each request only pays for filtering, layout and drawing.  The same service
+# object can be shared by several worker threads.
+#
+# Running `dominion_dividers_service` starts a warm process that either
+# answers HTTP POST requests or reads JSON requests from stdin, one per line.
+# A request is a JSON object like
+#     {"id": 1, "args": ["--papersize", "A4", "--expansions", "base"]}
+# where "args" are the usual dominion_dividers command line options
+# (as a list or a single string) and "id" is optional and echoed back.
+#
+# With --chunk-pages in the args, the PDF is sent in parts of that many
+# sheets, each a PDF of its own, as soon as each is drawn: over HTTP as the
+# parts of a multipart/mixed reply, on stdout as one reply line per part
+# followed by a line with the number of "parts".
+###########################################################################
+
+import argparse
+import base64
+import io
+import itertools
+import json
+import shlex
+import sys
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+from . import config_options, db
+from .draw import DividerDrawer
+from .main import generate, generate_chunks, generate_sample
+
+PDF_CONTENT_TYPE = "application/pdf"
+PNG_CONTENT_TYPE = "image/png"
+
+# The options naming the directories the service reads and writes.  They are the
+# service's own: a request may leave them out or repeat them, but not change them.
+# The fonts are also registered for the whole process, so a request drawing with
+# other fonts under the same names would swap them under the other requests.
+SERVICE_OPTIONS = [
+    "font_dir",
+    "cache_dir",
+    "cache_size",
+    "image_cache_dir",
+    "tab_artwork_cache_dir",
+]
+
+# The options a request can't use: the reply is the file, and a request is a
+# single generation
+REQUEST_UNSUPPORTED_OPTIONS = ["outfile", "batch", "profile"]
+
+
+class DividerService(object):
+    def __init__(
+        self,
+        languages=None,
+        font_dir=None,
+        cache_dir=None,
+        cache_size=None,
+        image_cache_dir=None,
+        tab_artwork_cache_dir=None,
+    ):
+        self.defaults = vars(config_options.parse_opts([]))
+        self.service_options = {
+            "font_dir": font_dir,
+            "cache_dir": cache_dir,
+            "cache_size": cache_size or self.defaults["cache_size"],
+            "image_cache_dir": image_cache_dir,
+            "tab_artwork_cache_dir": tab_artwork_cache_dir,
+        }
+        self.languages = (
+            list(languages) if languages is not None else db.get_languages("card_db")
+        )
+        self.warm()
+
+    def warm(self):
+        # Load everything that does not depend on the request up front.
+        for language in self.languages:
+            db.get_card_database(language=language)
+            DividerDrawer(self.parse(["--language", language])).registerFonts()
+
+    def parse(self, args=None):
+        # Turn command line style arguments into cleaned options for generate()
+        if args is None:
+            args = []
+        elif isinstance(args, str):
+            args = shlex.split(args)
+        else:
+            args = list(args)
+        try:
+            options = config_options.parse_opts(args)
+        except SystemExit:
+            # argparse exits on bad options, which must not stop the service
+            raise ValueError(f"Invalid options: {' '.join(args)}")
+        for name in REQUEST_UNSUPPORTED_OPTIONS:
+            if getattr(options, name) != self.defaults[name]:
+                raise ValueError(
+                    f"Invalid options: --{name.replace('_', '-')} can't be used "
+                    "in a request"
+                )
+        for name in SERVICE_OPTIONS:
+            value = self.service_options[name]
+            given = getattr(options, name)
+            if given == self.defaults[name]:
+                setattr(options, name, value)
+            elif given != value:
+                raise ValueError(
+                    f"Invalid options: --{name.replace('_', '-')} must be the "
+                    f"service's ({value})"
+                )
+        options = config_options.clean_opts(options)
+        if options.argv is not None:
+            # the info page shows the request's options, not the service's
+            options.argv = ["dominion_dividers"] + args
+        return options
+
+    def generate(self, options) -> bytes:
+        # Returns the PDF (or the PNG for --preview) for the given cleaned options
+        if options.preview:
+            return generate_sample(options)
+        buf = io.BytesIO()
+        options.outfile = buf
+        generate(options)
+        return buf.getvalue()
+
+    def generate_chunks(self, options):
+        # Yields the PDF for the given cleaned options --chunk-pages sheets at a time,
+        # each part as a PDF of its own, as soon as it is drawn
+        options.outfile = None
+        yield from generate_chunks(options, options.chunk_pages)
+
+    def handle_request(self, request):
+        # Returns (content type, data) for a JSON style request.
+        # With --chunk-pages, data is an iterator over the parts instead.
+        options = self.parse(request.get("args"))
+        if options.preview:
+            return PNG_CONTENT_TYPE, self.generate(options)
+        if options.chunk_pages:
+            return PDF_CONTENT_TYPE, self.generate_chunks(options)
+        return PDF_CONTENT_TYPE, self.generate(options)
+
+
+def make_http_handler(service):
+    class DividerRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # Health check
+            self.send_reply(200, "text/plain", b"ok")
+
+        def do_POST(self):
+            chunks = None
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                content_type, data = service.handle_request(request)
+                if not isinstance(data, bytes):
+                    # Draw the first part before replying, so errors still get a 400
+                    chunks = data
+                    data = next(chunks, b"")
+            except Exception as e:
+                logger.exception("Request failed")
+                self.send_reply(400, "text/plain", str(e).encode("utf-8"))
+                return
+            if chunks is None:
+                self.send_reply(200, content_type, data)
+            else:
+                self.send_parts(content_type, itertools.chain([data], chunks))
+
+        def send_reply(self, status, content_type, data):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_parts(self, content_type, parts):
+            # Send each part of a multipart/mixed reply as soon as it is drawn.
+            # There is no Content-Length, the reply ends when the connection is closed.
+            boundary = f"domdiv-{uuid.uuid4().hex}"
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for data in parts:
+                    self.wfile.write(
+                        f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                        f"Content-Length: {len(data)}\r\n\r\n".encode("ascii")
+                    )
+                    self.wfile.write(data)
+                    self.wfile.write(b"\r\n")
+                    self.wfile.flush()
+            except Exception:
+                # Too late for an error status, the reply just has no closing boundary
+                logger.exception("Request failed")
+                return
+            self.wfile.write(f"--{boundary}--\r\n".encode("ascii"))
+
+        def log_message(self, format, *args):
+            logger.info(format % args)
+
+    return DividerRequestHandler
+
+
+def serve_http(service, host, port):
+    server = ThreadingHTTPServer((host, port), make_http_handler(service))
+    logger.info(f"Serving dividers on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve_stdin(service, infile=None, outfile=None):
+    # One JSON request per input line, one JSON reply per output line.
+    # The generated file is base64 encoded in the "data" field of the reply.
+    # With --chunk-pages there is a reply with the "part" number and its "data"
+    # for each part, and then one with the number of "parts".
+    infile = infile if infile is not None else sys.stdin
+    outfile = outfile if outfile is not None else sys.stdout
+    for line in infile:
+        if not line.strip():
+            continue
+        reply = {}
+        try:
+            request = json.loads(line)
+            reply["id"] = request.get("id")
+            content_type, data = service.handle_request(request)
+            reply["content_type"] = content_type
+            if not isinstance(data, bytes):
+                # one reply per part as soon as it's drawn, then one with the number of parts
+                parts = 0
+                for parts, part in enumerate(data, 1):
+                    encoded = base64.b64encode(part).decode("ascii")
+                    outfile.write(
+                        json.dumps({**reply, "part": parts, "data": encoded}) + "\n"
+                    )
+                    outfile.flush()
+                reply["parts"] = parts
+            else:
+                reply["data"] = base64.b64encode(data).decode("ascii")
+        except Exception as e:
+            logger.exception("Request failed")
+            reply = {"id": reply.get("id"), "error": str(e)}
+        outfile.write(json.dumps(reply) + "\n")
+        outfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve divider generation requests from a warm process."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="Serve HTTP POST requests on this port. "
+        "Without it, JSON requests are read from stdin, one per line.",
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="The interface to serve HTTP on."
+    )
+    parser.add_argument(
+        "--font-dir",
+        default=None,
+        help="Font directory used for all requests. Requests can't use another one.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Keep the finished output in this directory, as dominion_dividers "
+        "--cache-dir does, for all requests.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=None,
+        help="Size in MB that --cache-dir may grow to.",
+    )
+    parser.add_argument(
+        "--image-cache-dir",
+        default=None,
+        help="Keep the encoded images in this directory for all requests.",
+    )
+    parser.add_argument(
+        "--tab-artwork-cache-dir",
+        default=None,
+        help="Keep the prepared tab artwork in this directory for all requests.",
+    )
+    parser.add_argument(
+        "--language",
+        action="append",
+        dest="languages",
+        default=None,
+        help="Language to preload. Can be given more than once. Default is all languages.",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        help="Set the logging level.",
+        choices=["TRACE", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    )
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    service = DividerService(
+        languages=args.languages,
+        font_dir=args.font_dir,
+        cache_dir=args.cache_dir,
+        cache_size=args.cache_size,
+        image_cache_dir=args.image_cache_dir,
+        tab_artwork_cache_dir=args.tab_artwork_cache_dir,
+    )
+    if args.port is not None:
+        serve_http(service, args.host, args.port)
+    else:
+        serve_stdin(service)
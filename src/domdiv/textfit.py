@@ -0,0 +1,197 @@
+###########################################################################
+# Fitting the text of a divider into its text box.
+#
+# fit_paragraphs() looks for the largest font size at which a list of
+# paragraphs fits into a box.  Like drawText always did, it starts at the
+# style's font size and steps down 1pt at a time (together with the leading
+# and the space between paragraphs), but it searches over those steps instead
+# of trying each one in turn: it guesses the step from how much too big the
+# text is, checks the step next to it and bisects whatever range is left.
+# Smaller text never needs more room, so this finds the same size as trying
+# them in order.
+#
+# The results are cached, so the same text in the same box (the same card on
+# many dividers, on both sides, or in several generations in one process) is
+# only fitted once.
+#
+# fit_font_size() does the same for single line labels (tab names, spines and
+# the types line), which shrink 0.01pt at a time until they are narrow enough.
+###########################################################################
+
+import copy
+import functools
+import math
+
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph
+
+from . import profiling
+from .markup import add_inline_images
+
+# The number of fitted texts to keep
+FIT_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def get_body_style():
+    return getSampleStyleSheet()["BodyText"]
+
+
+class TextFit(object):
+    # The font size, leading and paragraph spacing that made a text fit, with the wrapped paragraphs
+    def __init__(self, fontSize, leading, spacerHeight, paragraphs):
+        self.fontSize = fontSize
+        self.leading = leading
+        self.spacerHeight = spacerHeight
+        self.paragraphs = paragraphs
+
+    def drawOn(self, canvas, x, y):
+        # Draw the paragraphs top down, starting with the top of the first one at y
+        for p in self.paragraphs:
+            y -= p.height
+            # Flowables keep the canvas on themselves while drawing, so draw a copy
+            # in case another thread is drawing the same (cached) paragraph
+            copy.copy(p).drawOn(canvas, x, y)
+            y -= self.spacerHeight
+
+
+def fit_paragraphs(
+    descriptions,
+    width,
+    height,
+    fontName,
+    alignment,
+    spacerHeight,
+    minSpacerHeight,
+    inlineImages=True,
+):
+    # Returns the TextFit for the paragraphs in descriptions in a box of width x height.
+    # With inlineImages the markup for coins etc. is replaced by images of the right size.
+    return _fit_paragraphs(
+        tuple(descriptions),
+        width,
+        height,
+        fontName,
+        alignment,
+        spacerHeight,
+        minSpacerHeight,
+        inlineImages,
+    )
+
+
+@functools.lru_cache(maxsize=FIT_CACHE_SIZE)
+def _fit_paragraphs(
+    descriptions,
+    width,
+    height,
+    fontName,
+    alignment,
+    spacerHeight,
+    minSpacerHeight,
+    inlineImages,
+):
+    style = copy.copy(get_body_style())
+    style.fontName = fontName
+    style.alignment = alignment
+
+    # Step n shrinks the font size, leading and spacing by n points.
+    # Subtract a point at a time, so the sizes come out exactly as they always have.
+    sizes = [(style.fontSize, style.leading, spacerHeight)]
+    while sizes[-1][0] > 1 and sizes[-1][1] > 1:
+        fontSize, leading, spacer = sizes[-1]
+        sizes.append((fontSize - 1, leading - 1, max(spacer - 1, minSpacerHeight)))
+
+    fits = {}
+
+    def fit(step):
+        # Returns whether the text fits at the given step, and the total height it took
+        fontSize, leading, spacer = sizes[step]
+        s = copy.copy(style)
+        s.fontSize = fontSize
+        s.leading = leading
+
+        paragraphs = []
+        # this accounts for the spacers we insert between paragraphs
+        h = (len(descriptions) - 1) * spacer
+        w = 0
+        for d in descriptions:
+            dmod = add_inline_images(d, fontSize) if inlineImages else d
+            try:
+                p = Paragraph(dmod, s)
+                profiling.count("paragraphs")
+            except ValueError as e:
+                raise ValueError(f'{e} ("{dmod}")')
+            pWidth, pHeight = p.wrap(width, height)
+            h += pHeight
+            w = max(w, pWidth)
+            paragraphs.append(p)
+        fits[step] = TextFit(fontSize, leading, spacer, paragraphs)
+        return h <= height and w <= width, h
+
+    # Most texts fit as they are
+    fitted, h = fit(0)
+    if fitted:
+        return fits[0]
+
+    # Search for the first step that fits, the last step is used if none does.
+    # The area text takes up goes with the square of its size, so start the search
+    # at the size that should just fit and then look right below it.
+    low, high = 1, len(sizes) - 1
+    if 0 < height < h:
+        step = math.ceil(sizes[0][0] * (1 - math.sqrt(height / h)))
+    else:
+        step = low
+    step = min(max(step, low), high)
+    if fit(step)[0]:
+        high = step
+        step -= 1
+    else:
+        low = step + 1
+        step += 1
+    while low < high:
+        if not low <= step < high:
+            step = (low + high) // 2
+        if fit(step)[0]:
+            high = step
+        else:
+            low = step + 1
+        step = (low + high) // 2
+    if high not in fits:
+        fit(high)
+    return fits[high]
+
+
+@functools.lru_cache(maxsize=FIT_CACHE_SIZE)
+def font_size_steps(fontSize, minFontSize):
+    # The sizes from fontSize down in 0.01pt steps, ending with the first one at or below minFontSize.
+    # Subtract a step at a time, so the sizes come out exactly as they always have.
+    sizes = [fontSize]
+    while sizes[-1] > minFontSize:
+        sizes.append(sizes[-1] - 0.01)
+    return tuple(sizes)
+
+
+def fit_font_size(measure, fontSize, maxWidth, minFontSize):
+    # Returns (fontSize, width) for the first size, stepping down 0.01pt from fontSize,
+    # where measure(fontSize) is at most maxWidth.  Stops at the first size at or below
+    # minFontSize, even if it is still too wide.
+    # Text gets narrower as it gets smaller, so bisect instead of trying every step.
+    sizes = font_size_steps(fontSize, minFontSize)
+    widths = {}
+
+    def fits(step):
+        widths[step] = measure(sizes[step])
+        return widths[step] <= maxWidth
+
+    low, high = 0, len(sizes) - 1
+    if fits(low):
+        high = low
+    while low < high:
+        step = (low + high) // 2
+        if fits(step):
+            high = step
+        else:
+            low = step + 1
+    if high not in widths:
+        widths[high] = measure(sizes[high])
+    return sizes[high], widths[high]
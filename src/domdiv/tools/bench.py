@@ -0,0 +1,256 @@
+###########################################################################
+# This file benchmarks the generation of dividers
+#
+# Each scenario is a list of command line argument sets that are generated
+# one after the other in a fresh process, so every scenario pays for loading
+# the card database and fonts once, like a normal run.  The runs are profiled
+# (see domdiv.profiling) and the time and peak memory of the whole scenario
+# and of each phase are reported.
+#
+# The results can be saved as a baseline and later runs compared against it:
+# a scenario that takes more than --threshold longer (or --memory-threshold
+# more memory) than its baseline is a regression, and the exit status is 1.
+#
+#   domdiv_bench --save-baseline                 # record benchmarks/baseline.json
+#   domdiv_bench --scenario default --scenario label --repeat 3
+###########################################################################
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import shlex
+import sys
+import tempfile
+
+from loguru import logger
+
+import domdiv
+import domdiv.config_options
+import domdiv.db
+import domdiv.main
+import domdiv.profiling
+from domdiv.tools import bgg_release
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+DEFAULT_THRESHOLD = 0.2
+
+
+def get_scenarios():
+    # {name: [command line args for each generation]}
+    languages = [
+        language for language in domdiv.db.get_languages("card_db") if language != "xx"
+    ]
+    return {
+        "default": [[]],
+        # the same expansion in every language, for the language loading and text
+        "all_languages": [
+            [f"--language={language}", "--expansions=dominion2ndEdition"]
+            for language in languages
+        ],
+        "expansion_artwork": [["--expansion-dividers", "--tab-artwork-resolution=300"]],
+        "wrapper_folder": [["--wrapper", "--head=folder"]],
+        "label": [["--label=8867"]],
+        "preview": [["--preview"]],
+        "bgg_release": [
+            shlex.split(args) + bgg_release.additional
+            for args, _ in bgg_release.argsets
+        ],
+    }
+
+
+def run_scenario(argsets, outdir):
+    # Generate each of the argsets and return the combined profile:
+    # the time and peak memory of all of them and the time of each phase.
+    result = {"wall_seconds": 0, "cpu_seconds": 0, "peak_bytes": 0, "phases": {}}
+    for i, args in enumerate(argsets):
+        outfile = os.path.join(outdir, f"bench_{i}.pdf")
+        options = domdiv.config_options.parse_opts(args + [f"--outfile={outfile}"])
+        options = domdiv.config_options.clean_opts(options)
+        logger.remove()
+        logger.add(sys.stderr, level=options.log_level)
+        try:
+            with domdiv.profiling.Profile() as profile:
+                domdiv.main.generate_output(options)
+        except ImportError as e:
+            # e.g. --preview without pypdfium2 or wand
+            return {"skipped": str(e)}
+        report = profile.report()
+        result["wall_seconds"] += report["wall_seconds"]
+        result["cpu_seconds"] += report["cpu_seconds"]
+        result["peak_bytes"] = max(result["peak_bytes"], report["peak_bytes"] or 0)
+        for phase in report["phases"]:
+            phases = result["phases"]
+            phases[phase["name"]] = phases.get(phase["name"], 0) + phase["wall_seconds"]
+    return result
+
+
+def run_scenario_in_process(argsets):
+    # Runs the scenario in a new process, so it starts cold and its peak memory is its own
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as outdir:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=context
+        ) as executor:
+            return executor.submit(run_scenario, argsets, outdir).result()
+
+
+def run_benchmarks(names=None, repeat=1):
+    # Returns {name: result}, keeping the fastest of the repeats of each scenario
+    scenarios = get_scenarios()
+    results = {}
+    for name in names or scenarios:
+        if name not in scenarios:
+            raise ValueError(
+                f"Unknown scenario {name}, choose from {', '.join(scenarios)}"
+            )
+        best = None
+        for _ in range(repeat):
+            result = run_scenario_in_process(scenarios[name])
+            if "skipped" in result:
+                best = result
+                break
+            if best is None or result["wall_seconds"] < best["wall_seconds"]:
+                best = result
+        results[name] = best
+        print(format_result(name, best))
+    return results
+
+
+def format_result(name, result):
+    if "skipped" in result:
+        return f"{name:20s} skipped: {result['skipped']}"
+    return (
+        f"{name:20s} {result['wall_seconds']:8.2f}s wall {result['cpu_seconds']:8.2f}s cpu "
+        f"{result['peak_bytes'] / 2**20:8.1f}MB peak"
+    )
+
+
+def compare_results(results, baseline, threshold, memory_threshold):
+    # Returns the regressions of results against the baseline, as messages
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or "skipped" in result or "skipped" in base:
+            continue
+        for key, limit, unit in [
+            ("wall_seconds", threshold, "s"),
+            ("peak_bytes", memory_threshold, "B"),
+        ]:
+            if base[key] and result[key] > base[key] * (1 + limit):
+                regressions.append(
+                    f"{name}: {key} {result[key]:.2f}{unit} is more than "
+                    f"{limit:.0%} over the baseline {base[key]:.2f}{unit}"
+                )
+    return regressions
+
+
+def make_report(results):
+    return {
+        "version": domdiv.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": results,
+    }
+
+
+def main(
+    names=None,
+    repeat=1,
+    baseline=DEFAULT_BASELINE,
+    threshold=DEFAULT_THRESHOLD,
+    memory_threshold=DEFAULT_THRESHOLD,
+    output=None,
+    save_baseline=False,
+):
+    # Runs the benchmarks, returns the number of regressions against the baseline
+    results = run_benchmarks(names, repeat)
+    report = make_report(results)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if save_baseline:
+        if os.path.exists(baseline):
+            # keep the scenarios that weren't run this time
+            with open(baseline) as f:
+                old = json.load(f)
+            report["scenarios"] = {**old["scenarios"], **results}
+        os.makedirs(os.path.dirname(baseline) or ".", exist_ok=True)
+        with open(baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {baseline}")
+        return 0
+    if not os.path.exists(baseline):
+        print(f"No baseline at {baseline} to compare with")
+        return 0
+    with open(baseline) as f:
+        regressions = compare_results(
+            results, json.load(f)["scenarios"], threshold, memory_threshold
+        )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return len(regressions)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Time the generation of dividers in a few typical scenarios"
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        dest="names",
+        help=f"scenario to run, can be given more than once (default: all of "
+        f"{', '.join(get_scenarios())})",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="run each scenario this many times and keep the fastest",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=DEFAULT_BASELINE,
+        help="baseline results to compare with (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save the results as the baseline instead of comparing with it",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="fraction by which a scenario may be slower than the baseline "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="fraction by which a scenario may use more memory than the baseline "
+        "(default: %(default)s)",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    sys.exit(
+        1
+        if main(
+            args.names,
+            args.repeat,
+            args.baseline,
+            args.threshold,
+            args.memory_threshold,
+            args.output,
+            args.save_baseline,
+        )
+        else 0
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -19,26 +19,27 @@ argsets = [
 additional = ["--expansion-dividers", "--tab-artwork-resolution=300"]
 
 
-def run_generator(args, main):
+def get_generator_options(args, main):
     args = f"{args} --font-dir local_fonts --outfile {prefix}{main}{postfix}"
     args = args.split()
-    fname = args[-1]
     print(args)
-    print(":::Generating " + fname)
     options = domdiv.config_options.parse_opts(args)
-    options = domdiv.config_options.clean_opts(options)
-    domdiv.main.generate(options)
-    return fname
+    return domdiv.config_options.clean_opts(options)
 
 
-def make_bgg_release():
+def make_bgg_release(jobs=1):
     if not os.path.exists(gen_dir):
         print(f"Making dir '{gen_dir}'")
         os.mkdir(gen_dir)
 
-    fnames = [
-        run_generator(args[0] + " " + " ".join(additional), args[1]) for args in argsets
+    options_list = [
+        get_generator_options(args[0] + " " + " ".join(additional), args[1])
+        for args in argsets
     ]
+    results = domdiv.main.generate_many(options_list, jobs)
+    for result in results:
+        print(f":::Generated {result['outfile']} in {result['seconds']:.2f}s")
+    fnames = [result["outfile"] for result in results]
     print(fnames)
 
     with ZipFile(
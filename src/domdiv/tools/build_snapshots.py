@@ -0,0 +1,46 @@
+###########################################################################
+# This file builds the card database snapshots
+#
+# For each language, the card, set and type databases and the text of the
+# default language and of the language itself are parsed from the gzipped
+# json files and written into a single pickle file "xx/card_db_xx.pickle".
+# domdiv loads the snapshot instead of the json files when it is present and
+# up to date (see db.read_snapshot).
+#
+# The json files are read from the installed domdiv package, so run this
+# from a development (editable) install after updating the languages.
+###########################################################################
+
+import argparse
+import os
+
+from domdiv import db
+
+
+def main(output_dir, languages=None):
+    if not languages:
+        languages = db.get_languages("card_db")
+    for language in languages:
+        fname = os.path.join(output_dir, language, f"card_db_{language}.pickle")
+        with open(fname, "wb") as f:
+            db.write_snapshot(f, db.make_snapshot("card_db", language))
+        print(f"Wrote {fname}")
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "output_dir", help="directory for output data (usually src/domdiv/card_db)"
+    )
+    parser.add_argument(
+        "--language",
+        action="append",
+        dest="languages",
+        help="language to build a snapshot for, can be given more than once (default: all)",
+    )
+    args = parser.parse_args()
+    main(args.output_dir, args.languages)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,50 @@
+import os
+
+from reportlab.lib.units import cm
+
+from domdiv import artwork, resource_handling
+
+
+def test_artwork_unchanged():
+    cache = artwork.ArtworkCache()
+    path = cache.get("action.png", 5 * cm, 1 * cm)
+    assert path == resource_handling.get_image_filepath("action.png")
+    assert cache.stats()["misses"] == 0
+
+
+def test_artwork_keyed_on_pixels():
+    cache = artwork.ArtworkCache()
+    reader = cache.get("action.png", 5 * cm, 1 * cm, resolution=72)
+    # a slightly different tab ends up with the same number of pixels
+    assert cache.get("action.png", 5 * cm + 0.01, 1 * cm, resolution=72) is reader
+    assert cache.get("action.png", 5 * cm, 1 * cm, resolution=150) is not reader
+    assert reader.getSize() == (round(5 * cm), round(1 * cm))
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    assert stats["bytes"] > 0
+
+
+def test_artwork_evicts_least_recently_used():
+    cache = artwork.ArtworkCache(max_bytes=1)
+    cache.get("action.png", 5 * cm, 1 * cm, resolution=72)
+    cache.get("action.png", 5 * cm, 1 * cm, resolution=100)
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"]) == (1, 1)
+    key = artwork.get_artwork_key("action.png", 5 * cm, 1 * cm, 100, 1.0)
+    assert list(cache.entries) == [key]
+
+
+def test_artwork_cache_dir(tmp_path):
+    args = ("action.png", 5 * cm, 1 * cm, 100, 0.5)
+    first = artwork.ArtworkCache()
+    first.get(*args, cache_dir=str(tmp_path))
+    assert first.stats()["disk_writes"] == 1
+    (fname,) = os.listdir(tmp_path)
+
+    second = artwork.ArtworkCache()
+    reader = second.get(*args, cache_dir=str(tmp_path))
+    assert second.stats()["disk_hits"] == 1
+    key = artwork.get_artwork_key(*args)
+    with open(tmp_path / fname, "rb") as f:
+        assert f.read() == artwork.prepare_artwork(*key)
+    assert reader.getSize() == key[1:3]
@@ -0,0 +1,43 @@
+from domdiv.tools import bench
+
+
+def test_compare_results():
+    baseline = {
+        "default": {"wall_seconds": 10.0, "peak_bytes": 100},
+        "label": {"wall_seconds": 5.0, "peak_bytes": 100},
+        "preview": {"skipped": "No module named 'wand'"},
+    }
+    results = {
+        "default": {"wall_seconds": 11.9, "peak_bytes": 130},
+        "label": {"wall_seconds": 6.1, "peak_bytes": 100},
+        "preview": {"wall_seconds": 1.0, "peak_bytes": 100},
+        "new": {"wall_seconds": 1.0, "peak_bytes": 100},
+    }
+    regressions = bench.compare_results(results, baseline, 0.2, 0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("default: peak_bytes")
+    assert regressions[1].startswith("label: wall_seconds")
+    assert bench.compare_results(results, baseline, 0.5, 0.5) == []
+
+
+def test_run_scenario(tmp_path):
+    result = bench.run_scenario(
+        [
+            ["--expansions=alchemy", "--no-tab-artwork"],
+            ["--expansions=alchemy", "--label=8867"],
+        ],
+        tmp_path,
+    )
+    assert result["wall_seconds"] > 0
+    assert result["peak_bytes"] > 0
+    assert {"read_card_data", "draw_dividers", "save"} <= set(result["phases"])
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "bench_0.pdf",
+        "bench_1.pdf",
+    ]
+
+
+def test_scenarios():
+    scenarios = bench.get_scenarios()
+    assert len(scenarios["bgg_release"]) == 6
+    assert len(scenarios["all_languages"]) > 1
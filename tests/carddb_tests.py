@@ -1,5 +1,7 @@
 from __future__ import print_function
 
+import io
+import json
 import os
 import shutil
 import unicodedata
@@ -416,6 +418,106 @@ def test_grouped_card_count_by_set(expected):
     expected.assert_total_card_count(selected_cards)
 
 
+def test_card_database_views():
+    card_db = db.get_card_database()
+    options = parse_and_clean_args(
+        ["--expansions", "alchemy", "--expansion-dividers", "--language", "de"]
+    )
+
+    view = card_db.view()
+    cards = main.filter_sort_cards(db.read_card_data(options, view), options, view)
+    assert all(c.card_db is view for c in cards)
+    assert view.sets["alchemy"]["set_name"] == "Die Alchemisten"
+    assert view.sets["alchemy"]["count"] == 12
+    assert view.bonus_highlighter
+    assert (
+        cards[0].getBonusBoldText("+2 Karten und +1 Aktion")
+        == "<b>+2 Karten</b> und <b>+1 Aktion</b>"
+    )
+
+    # the shared database is left untouched
+    assert card_db.sets["alchemy"]["set_name"] != "Die Alchemisten"
+    assert "count" not in card_db.sets["alchemy"]
+    assert card_db.bonus_highlighter is None
+
+    # and another generation sees the same thing as the first one
+    options = parse_and_clean_args(
+        ["--expansions", "alchemy", "--expansion-dividers", "--language", "de"]
+    )
+    other = card_db.view()
+    main.filter_sort_cards(db.read_card_data(options, other), options, other)
+    # the highlighter is only compiled once
+    assert other.bonus_highlighter is view.bonus_highlighter
+    assert other.sets == view.sets
+
+
+def test_card_variant():
+    card = Card(name="Test", cardset_tags=["a", "b"], types=["Action"], count=3)
+    variant = card.variant(cardset_tag="b")
+    assert (variant.name, variant.cardset_tag, variant.getCardCounts()) == (
+        "Test",
+        "b",
+        [3],
+    )
+    assert variant.types is card.types
+    # the counts are the only thing changed in place
+    card.mergeCardCount([4])
+    assert card.getCardCounts() == [3, 4]
+    assert variant.getCardCounts() == [3]
+
+
+def test_card_index():
+    options = parse_and_clean_args(["--start-decks", "--curse10"])
+    cards = db.read_card_data(options, db.get_card_database().view())
+    index = db.CardIndex(cards)
+    for tag in ["Start Deck", "Curse"]:
+        assert index.find(tag) == [c for c in cards if c.card_tag == tag]
+    assert len(index.find("Start Deck")) % 4 == 0
+    assert index.byCardTag("Vineyard").card_tag == "Vineyard"
+    assert index.byCardTag("Not A Card") is None
+
+    card = index.byCardTag("Vineyard")
+    index.remove(card)
+    assert index.byCardTag("Vineyard") is None
+    index.add(card)
+    assert index.byCardTag("Vineyard") is card
+
+
+@pytest.mark.parametrize("lang", ["en_us", "de", "fr", "cs"])
+def test_card_database_snapshot(lang, monkeypatch):
+    # the cards read through a snapshot are the same as those parsed from the json files
+    snapshot = db.read_snapshot("card_db", lang)
+    if snapshot is None:
+        # the snapshots are built, not checked in; write one the same way
+        f = io.BytesIO()
+        db.write_snapshot(f, db.make_snapshot("card_db", lang))
+        f.seek(0)
+        snapshot = db.load_snapshot(f, "card_db", lang)
+    assert snapshot is not None
+    from_snapshot = db.CardDatabase.from_snapshot(snapshot)
+    monkeypatch.setattr(db, "read_snapshot", lambda path, language: None)
+    from_json = db.CardDatabase.load("card_db", lang)
+
+    results = []
+    for card_db in (from_snapshot, from_json):
+        options = parse_and_clean_args(["--language", lang, "--expansion-dividers"])
+        card_db = card_db.view()
+        cards = db.read_card_data(options, card_db)
+        read = json.dumps(cards, cls=Card.CardJSONEncoder)
+        cards = main.filter_sort_cards(cards, options, card_db)
+        results.append((read, json.dumps(cards, cls=Card.CardJSONEncoder)))
+    assert results[0] == results[1]
+
+
+def test_card_database_snapshot_out_of_date():
+    # snapshots that don't match the json files are ignored
+    snapshot = db.make_snapshot("card_db", "de")
+    f = io.BytesIO()
+    db.write_snapshot(f, dict(snapshot, digest="0"))
+    f.seek(0)
+    assert db.load_snapshot(f, "card_db", "de") is None
+
+
 @pytest.mark.parametrize("lang", db.get_languages("card_db"))
 def test_languages_db(lang):
     print("checking " + lang)
@@ -0,0 +1,65 @@
+import io
+import os
+import shutil
+
+import reportlab
+from reportlab import rl_config
+from reportlab.pdfbase import pdfmetrics
+
+from domdiv import fonts, main
+from tests import parse_and_clean_args
+
+VERA = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+
+
+def test_builtin_fonts():
+    registry = fonts.FontRegistry()
+    style = registry.get_font_style(None, "en_us")
+    assert style["Rules"] == "Times-Roman"
+    assert style["PlusCost"] == "Helvetica-Bold"
+    # the same fonts work for every Latin-1 language
+    assert registry.get_font_style(None, "de") is style
+    assert registry.stats() == {"hits": 1, "misses": 1, "styles": 1, "fonts": 0}
+
+
+def test_font_files_parsed_once(tmp_path, monkeypatch):
+    shutil.copy(VERA, tmp_path / "TrajanPro-Bold.ttf")
+    registry = fonts.FontRegistry()
+    style = registry.get_font_style(str(tmp_path), "en_us")
+    assert style["Name"] == style["Expansion"] == "TrajanPro-Bold"
+    assert pdfmetrics.getFont("TrajanPro-Bold").face.filename == str(
+        tmp_path / "TrajanPro-Bold.ttf"
+    )
+
+    # later generations neither look for the font files nor parse them again
+    def fail(*args, **kwargs):
+        raise AssertionError("font files used again")
+
+    monkeypatch.setattr(fonts, "TTFont", fail)
+    monkeypatch.setattr(fonts, "find_font_paths", fail)
+    assert registry.get_font_style(str(tmp_path), "fr") is style
+    assert registry.stats()["fonts"] == 1
+
+
+def test_font_subset_cache(tmp_path, monkeypatch):
+    # The Vera font under the names of the fonts for names and costs
+    for fname in ["TrajanPro-Bold.ttf", "MinionStd-Black.ttf"]:
+        shutil.copy(VERA, tmp_path / fname)
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    monkeypatch.setattr(fonts, "font_subset_cache", fonts.FontSubsetCache())
+    args = ["--expansions=alchemy", f"--font-dir={tmp_path}"]
+
+    def generate(extra_args):
+        options = parse_and_clean_args(args + extra_args)
+        options.outfile = io.BytesIO()
+        main.generate(options)
+        return options.outfile.getvalue()
+
+    expected = generate([])
+    assert generate(["--font-subset-cache"]) == expected
+    stats = fonts.get_subset_cache_stats()
+    assert stats["hits"] == 0 and stats["misses"] > 0
+    # the next document embeds the same subsets without making them again
+    monkeypatch.setattr(fonts.TTFontFace, "makeSubset", None)
+    assert generate(["--font-subset-cache"]) == expected
+    assert fonts.get_subset_cache_stats()["hits"] == stats["misses"]
@@ -1,8 +1,22 @@
 from __future__ import print_function
 
+import io
+import json
+
 import pytest
+from reportlab import rl_config
+from reportlab.pdfbase import pdfmetrics
 
-from domdiv import config_options, db, main
+from domdiv import (
+    config_options,
+    db,
+    draw,
+    images,
+    main,
+    page_cache,
+    preview,
+    profiling,
+)
 
 
 def get_clean_opts(opts):
@@ -36,6 +50,267 @@ def test_resolution():
     main.generate(options)
 
 
+def test_jobs(monkeypatch):
+    # Leave the timestamps and the document ID out, which are all that would differ
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    outputs = []
+    for jobs in (1, 3, 3):
+        # the images are encoded again in the workers, not taken from the first run
+        images.image_cache.clear()
+        options = get_clean_opts(["--expansions=alchemy", "--info", f"--jobs={jobs}"])
+        options.outfile = io.BytesIO()
+        main.generate(options)
+        outputs.append(options.outfile.getvalue())
+        if jobs > 1:
+            assert images.get_cache_stats()["misses"] == 0
+    assert outputs[0] == outputs[1] == outputs[2]
+    # the worker processes are kept for the next drawing
+    assert draw.getPool(1) is draw.getPool(2)
+
+
+def test_chunk_pages(tmp_path):
+    pypdf = pytest.importorskip("pypdf")
+    args = ["--expansions=alchemy", "--no-tab-artwork", "--info"]
+    options = get_clean_opts(args)
+    options.outfile = io.BytesIO()
+    main.generate(options)
+    reader = pypdf.PdfReader(io.BytesIO(options.outfile.getvalue()))
+    expected = [page.extract_text() for page in reader.pages]
+
+    outfile = tmp_path / "alchemy.pdf"
+    options = get_clean_opts(args + ["--chunk-pages=1", f"--outfile={outfile}"])
+    fnames = main.generate_output(options)
+    assert fnames == [
+        str(tmp_path / "alchemy-001.pdf"),
+        str(tmp_path / "alchemy-002.pdf"),
+    ]
+    pages = []
+    for fname in fnames:
+        pages.append([page.extract_text() for page in pypdf.PdfReader(fname).pages])
+    # the front and back of a sheet in each, the info page with the last
+    assert [len(chunk) for chunk in pages] == [2, 3]
+    assert sum(pages, []) == expected
+
+
+def test_incremental():
+    pypdf = pytest.importorskip("pypdf")
+
+    def generate(args):
+        options = get_clean_opts(args + ["--no-tab-artwork", "--info"])
+        options.outfile = io.BytesIO()
+        main.generate(options)
+        reader = pypdf.PdfReader(io.BytesIO(options.outfile.getvalue()))
+        return [page.extract_text() for page in reader.pages]
+
+    page_cache.page_cache.clear()
+    args = ["--expansions", "alchemy", "--incremental"]
+    expected = generate(args[:2])
+    assert generate(args) == expected
+    stats = page_cache.get_cache_stats()
+    # a part for each sheet, with the info page on the last
+    assert (stats["hits"], stats["misses"]) == (0, 2)
+    assert generate(args) == expected
+    assert page_cache.get_cache_stats()["hits"] == 2
+
+    # menagerie comes after alchemy, so the first alchemy sheet stays the same
+    args = ["--expansions", "alchemy", "menagerie", "--incremental"]
+    assert generate(args) == generate(args[:3])
+    assert page_cache.get_cache_stats()["hits"] == 3
+
+    # with serpentine tabs the tab sequence goes on differently after the first
+    # sheet once menagerie is added, which doesn't change how that sheet is drawn
+    page_cache.page_cache.clear()
+    tabs = ["--tab-side=left", "--tab-number=4", "--tab-serpentine", "--incremental"]
+    generate(["--expansions", "alchemy"] + tabs)
+    args = ["--expansions", "alchemy", "menagerie"] + tabs
+    assert generate(args) == generate(args[:-1])
+    assert page_cache.get_cache_stats()["hits"] == 1
+
+
+def test_divider_forms():
+    pypdf = pytest.importorskip("pypdf")
+
+    def generate(args):
+        options = get_clean_opts(args)
+        options.outfile = io.BytesIO()
+        main.generate(options)
+        return options.outfile.getvalue()
+
+    args = ["--expansions=base", "--curse10", "--tab-side=full", "--no-tab-artwork"]
+    expected = pypdf.PdfReader(io.BytesIO(generate(args))).pages
+    pages = pypdf.PdfReader(io.BytesIO(generate(args + ["--divider-forms"]))).pages
+    assert [page.extract_text() for page in pages] == [
+        page.extract_text() for page in expected
+    ]
+    # only the three Curses come up more than once, each side is drawn into a form
+    forms = set()
+    placed = 0
+    for page in pages:
+        placed += page.get_contents().get_data().count(b"/FormXob.divider")
+        xobjects = page["/Resources"].get("/XObject", {})
+        forms.update(name for name in xobjects if name.startswith("/FormXob.divider"))
+    assert (len(forms), placed) == (2, 2 * 3)
+
+
+def test_divider_keys_after_drawing():
+    # The sides are fingerprinted the same once they've been drawn
+    args = ["--expansions=base", "--curse10", "--notch-length=1", "--divider-forms"]
+    options = get_clean_opts(args + ["--no-tab-artwork"])
+    options.outfile = io.BytesIO()
+    dd, cards = main.prepare_generation(options)
+    dd.draw(cards)
+    assert any(item.notchWidth for _, _, page in dd.pages for item in page)
+    keys = dict(dd.dividerKeys)
+    assert keys
+    dd.findRepeatedDividers(dd.pages, [False, True])
+    assert dd.dividerKeys == keys
+
+
+def test_outline_forms():
+    pypdf = pytest.importorskip("pypdf")
+
+    def generate(args):
+        options = get_clean_opts(args)
+        options.outfile = io.BytesIO()
+        main.generate(options)
+        return pypdf.PdfReader(io.BytesIO(options.outfile.getvalue())).pages
+
+    args = [
+        "--expansions=base",
+        "--cropmarks",
+        "--linetype=dot",
+        "--tab-side=left-alternate",
+        "--no-tab-artwork",
+    ]
+    expected = generate(args)
+    pages = generate(args + ["--divider-forms"])
+    assert [page.extract_text() for page in pages] == [
+        page.extract_text() for page in expected
+    ]
+    # the outlines of the 16 divider sides come in 8 shapes: front or back, the tab
+    # on the left or right, and which of the cropmarks are drawn
+    forms = set()
+    placed = 0
+    for page in pages:
+        placed += page.get_contents().get_data().count(b"/FormXob.outline")
+        xobjects = page["/Resources"].get("/XObject", {})
+        forms.update(name for name in xobjects if name.startswith("/FormXob.outline"))
+    assert (len(forms), placed) == (8, 16)
+
+    def content_size(pages):
+        return sum(len(page.get_contents().get_data()) for page in pages)
+
+    assert content_size(pages) < content_size(expected)
+
+
+def test_preview(tmp_path):
+    pytest.importorskip("pypdfium2")
+    from PIL import Image
+
+    preview.preview_cache.clear()
+    outfile = tmp_path / "alchemy.pdf"
+    args = ["--expansions=alchemy", "--info", "--preview", "--preview-resolution=72"]
+    options = get_clean_opts(args + [f"--outfile={outfile}"])
+    fname = main.generate_output(options)
+    assert fname == str(tmp_path / "alchemy.png")
+    with Image.open(fname) as image:
+        # the front of the first letter sized page
+        assert image.size == (612, 792)
+    assert preview.get_cache_stats()["misses"] == 1
+
+    # the same options again come from the cache, whatever the output file
+    options = get_clean_opts(args + [f"--outfile={tmp_path / 'other.pdf'}"])
+    with open(fname, "rb") as f:
+        assert main.generate_sample(options) == f.read()
+    assert preview.get_cache_stats()["hits"] == 1
+    options = get_clean_opts(args + ["--papersize=A4"])
+    assert main.generate_sample(options) != main.generate_sample(get_clean_opts(args))
+    assert preview.get_cache_stats()["misses"] == 2
+
+
+def test_profile(tmp_path):
+    outfile = tmp_path / "alchemy.pdf"
+    options = get_clean_opts(
+        ["--expansions=alchemy", "--info", "--profile", f"--outfile={outfile}"]
+    )
+    assert main.generate_output(options) == str(outfile)
+    with open(tmp_path / "alchemy.profile.json") as f:
+        report = json.load(f)
+    phases = [phase["name"] for phase in report["phases"]]
+    for name in ["read_card_data", "filter_sort_cards", "calculate_layout"]:
+        assert name in phases
+    assert phases[-3:] == ["draw_dividers", "draw_info", "save"]
+    assert [(page["page"], page["back"]) for page in report["pages"]] == [
+        (1, False),
+        (1, True),
+        (2, False),
+        (2, True),
+    ]
+    for timing in report["phases"] + report["pages"]:
+        assert timing["wall_seconds"] >= 0
+        # only the peak size of the whole process, once
+        assert timing["peak_bytes"] is None
+    assert report["peak_bytes"] > 0
+    counters = report["counters"]
+    assert counters["pages_shown"] == 5
+    # the card text may have been fitted (and cached) by an earlier test
+    process_counters = report["process_counters"]
+    assert counters["paragraphs"] > 0 or process_counters["text_fit_hits"] > 0
+    assert counters["string_widths"] > 0
+    assert counters["images_drawn"] > 0
+    assert process_counters["artwork_misses"] + process_counters["artwork_hits"] == 0
+
+
+def test_profile_hook():
+    options = get_clean_opts(["--expansions=alchemy", "--no-tab-artwork"])
+    options.outfile = io.BytesIO()
+    with profiling.Profile(trace_memory=True) as profile:
+        main.generate(options)
+    report = profile.report()
+    assert report["memory"] == "traced"
+    assert report["counters"]["pages_shown"] == 4
+    for timing in report["phases"] + report["pages"]:
+        assert timing["peak_bytes"] >= timing["allocated_bytes"]
+    # nothing is recorded outside of the profile, and reportlab is left alone
+    with profiling.phase("nothing"):
+        pass
+    assert "nothing" not in [phase["name"] for phase in profile.phases]
+    assert pdfmetrics.stringWidth.__module__ == "reportlab.pdfbase.pdfmetrics"
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_generate_many(tmp_path, jobs):
+    batch = tmp_path / "jobs.jsonl"
+    with open(batch, "w") as f:
+        for papersize in ("A4", "letter"):
+            args = [
+                "--expansions=alchemy",
+                "--no-tab-artwork",
+                f"--papersize={papersize}",
+            ]
+            args.append(f"--outfile={tmp_path / papersize}.pdf")
+            f.write(json.dumps({"args": args}) + "\n")
+        f.write("\n")
+        f.write(
+            json.dumps(
+                {
+                    "args": f"--expansions=alchemy --size=sleeved --outfile={tmp_path}/s.pdf"
+                }
+            )
+        )
+
+    results = main.generate_many(main.read_batch(batch), jobs)
+    assert [r["outfile"] for r in results] == [
+        f"{tmp_path}/A4.pdf",
+        f"{tmp_path}/letter.pdf",
+        f"{tmp_path}/s.pdf",
+    ]
+    for r in results:
+        assert r["seconds"] > 0
+        with open(r["outfile"], "rb") as f:
+            assert f.read(5) == b"%PDF-"
+
+
 def test_no_group_global():
     options = get_clean_opts([])
     assert not options.group_global
@@ -0,0 +1,67 @@
+import io
+
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from domdiv import artwork, images, resource_handling
+
+
+def draw(cls, **kwargs):
+    # A page with each kind of image drawn twice; returns the PDF
+    outfile = io.BytesIO()
+    c = cls(outfile, **kwargs)
+    card = resource_handling.get_image_filepath("card.png")
+    coin = str(resource_handling.get_image_filepath("coin_small_1.png"))
+    debt = resource_handling.get_image_filepath("debt.png")
+    for x in [0, 100]:
+        c.drawImage(card, x, 0, 16, 16, mask="auto", preserveAspectRatio=True)
+        c.drawImage(ImageReader(coin), x, 20, 10, 10, mask="auto")
+        c.drawImage(debt, x, 40, 10, 10, [170, 255, 170, 255, 170, 255])
+        c.drawImage(artwork.get_artwork("action.png", 20, 10, 72, 0.5), x, 60, 20, 10)
+    c.showPage()
+    c.save()
+    return outfile.getvalue()
+
+
+def test_image_cache(monkeypatch):
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    monkeypatch.setattr(images, "image_cache", images.ImageCache())
+    expected = draw(canvas.Canvas)
+    assert draw(images.ImageCachingCanvas) == expected
+    stats = images.get_cache_stats()
+    assert stats["hits"] == 0 and stats["misses"] == 4
+    # kept as they are written, so saving doesn't encode them again
+    for record, _ in images.image_cache.entries.values():
+        assert isinstance(record.attrs["streamContent"], bytes)
+    # the next document embeds the same images without encoding them again
+    monkeypatch.setattr(images, "encode_image", None)
+    assert draw(images.ImageCachingCanvas) == expected
+    assert images.get_cache_stats()["hits"] == 4
+
+
+def test_image_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    monkeypatch.setattr(images, "image_cache", images.ImageCache())
+    expected = draw(images.ImageCachingCanvas, cache_dir=str(tmp_path))
+    assert images.get_cache_stats()["disk_writes"] == 4
+    # as another process would
+    images.image_cache.clear()
+    monkeypatch.setattr(images, "encode_image", None)
+    assert draw(images.ImageCachingCanvas, cache_dir=str(tmp_path)) == expected
+    assert images.get_cache_stats()["disk_hits"] == 4
+
+
+def test_image_embedded_once():
+    # The same file drawn directly and through an ImageReader is embedded once
+    def draw_both(cls):
+        outfile = io.BytesIO()
+        c = cls(outfile)
+        fname = str(resource_handling.get_image_filepath("coin.png"))
+        c.drawImage(fname, 0, 0, 10, 10)
+        c.drawImage(ImageReader(fname), 20, 0, 10, 10)
+        c.save()
+        return outfile.getvalue().count(b"/Subtype /Image")
+
+    assert draw_both(canvas.Canvas) == 2
+    assert draw_both(images.ImageCachingCanvas) == 1
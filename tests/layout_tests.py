@@ -1,6 +1,6 @@
 from reportlab.lib.units import cm
 
-from domdiv import config_options, main
+from domdiv import config_options, db, main
 
 
 def test_horizontal():
@@ -79,3 +79,36 @@ def test_set_icon():
     options = config_options.parse_opts(["--set-icon=tab", "--set-icon=body-top"])
     options = config_options.clean_opts(options)
     assert set(options.set_icon) == {"tab", "body-top"}
+
+
+def get_plots(args):
+    options = config_options.clean_opts(config_options.parse_opts(args))
+    card_db = db.get_card_database(language=options.language).view()
+    cards = main.filter_sort_cards(db.read_card_data(options, card_db), options)
+    dd = main.calculate_layout(options, cards, card_db)
+    return [item for _, _, page in dd.pages for item in page]
+
+
+def test_tab_layouts_are_independent():
+    serpentine = get_plots(
+        [
+            "--expansions=alchemy",
+            "--tab-side=left",
+            "--tab-number=4",
+            "--tab-serpentine",
+        ]
+    )
+    tabs = [item.tabIndex for item in serpentine]
+    # a second layout with other tabs doesn't change the first one
+    single = get_plots(
+        ["--expansions=alchemy", "--tab-side=left", "--tab-number=1", "--size=sleeved"]
+    )
+    assert {item.tabIndex for item in single} == {1}
+    assert [item.tabIndex for item in serpentine] == tabs
+    assert tabs[:7] == [1, 2, 3, 4, 3, 2, 1]
+    assert {item.tabNumber for item in serpentine} == {4}
+    assert serpentine[0].cardWidth < single[0].cardWidth
+    assert serpentine[0].layout is not single[0].layout
+    # dividers keep their attributes in slots
+    assert not hasattr(serpentine[0], "__dict__")
+    assert not hasattr(serpentine[0].card, "__dict__")
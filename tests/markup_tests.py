@@ -0,0 +1,141 @@
+import re
+
+import pytest
+
+from domdiv import config_options, db, main, markup, resource_handling
+
+
+def legacy_add_inline_text(text, emWidth):
+    # The original conversion, one substitution per tag
+    # <line>: 11 em dashes, but not wider than the text box
+    line = "<center>{}</center>\n".format("&mdash;" * min(11, int(emWidth)))
+    text = re.sub(r"\<line\>", line, text)
+    #  <tab> and \t
+    text = re.sub(r"\<tab\>", "\t", text)
+    text = re.sub(r"\<t\>", "\t", text)
+    text = re.sub(r"\t", "&nbsp;" * 4, text)
+
+    # various breaks
+    text = re.sub(r"\<br\>", "<br />", text)
+    text = re.sub(r"\<n\>", "\n", text)
+
+    # alignments
+    text = re.sub(r"\<c\>", "<center>", text)
+    text = re.sub(r"\<center\>", "\n<para alignment='center'>", text)
+    text = re.sub(r"\</c\>", "</center>", text)
+    text = re.sub(r"\</center\>", "</para>", text)
+
+    text = re.sub(r"\<l\>", "<left>", text)
+    text = re.sub(r"\<left\>", "\n<para alignment='left'>", text)
+    text = re.sub(r"\</l\>", "</left>", text)
+    text = re.sub(r"\</left\>", "</para>", text)
+
+    text = re.sub(r"\<r\>", "<right>", text)
+    text = re.sub(r"\<right\>", "\n<para alignment='right'>", text)
+    text = re.sub(r"\</r\>", "</right>", text)
+    text = re.sub(r"\</right\>", "</para>", text)
+
+    text = re.sub(r"\<j\>", "<justify>", text)
+    text = re.sub(r"\<justify\>", "\n<para alignment='justify'>", text)
+    text = re.sub(r"\</j\>", "</justify>", text)
+    text = re.sub(r"\</justify\>", "</para>", text)
+
+    return text.strip().strip("\n")
+
+
+def legacy_add_inline_images(text, fontsize):
+    # The original conversion, one pass per image
+    def replace_image_tag(
+        text,
+        fontsize,
+        tag_pattern,
+        fname_replace,
+        fontsize_multiplier,
+        height_percent,
+        text_fontsize_multiplier=None,
+    ):
+        replace_template = '<img src="{fpath}" width={width} height="{height_percent}%" valign="middle" />'
+        offset = 0
+        for match in re.finditer(tag_pattern, text):
+            replace = replace_template
+            tag = match.group(0)
+            fname = re.sub(tag_pattern, fname_replace, tag)
+            if text_fontsize_multiplier is not None:
+                font_replace = re.sub(
+                    tag_pattern,
+                    f"<font size={fontsize * text_fontsize_multiplier}>\\1</font>",
+                    tag,
+                )
+                replace = font_replace + replace
+            replace = replace.format(
+                fpath=resource_handling.get_image_filepath(fname),
+                width=fontsize * fontsize_multiplier,
+                height_percent=height_percent,
+            )
+            text = (
+                text[: match.start() + offset] + replace + text[match.end() + offset :]
+            )
+            offset += len(replace) - len(match.group(0))
+        return text
+
+    replace_specs = [
+        (r"(\d+)\s\<\*COIN\*\>", "coin_small_\\1.png", 2.4, 200),
+        (r"(\d+)\s(c|C)oin(s)?", "coin_small_\\1.png", 1.2, 100),
+        (r"([Xx])\s(c|C)oin(s)?", "coin_small_x.png", 1.2, 100),
+        (r"\?\s(c|C)oin(s)?", "coin_small_question.png", 1.2, 100),
+        (r"(empty|\_)\s(c|C)oin(s)?", "coin_small_empty.png", 1.2, 100),
+        (r"(?:\s+|\<)VP(?:\s+|\>|\.|$)", "victory_emblem.png", 1.25, 100),
+        (r"(\d+)\s*\<\*VP\*\>", "victory_emblem.png", 2, 160, 1.3),
+        (r"(\d+)\sDebt", "debt_\\1.png", 1.2, 105),
+        (r"Debt", "debt.png", 1.2, 105),
+        (r"(\d+)\s*\<\*POTION\*\>", "potion_small.png", 2, 140, 1.5),
+        (r"Potion", "potion_small.png", 1.2, 100),
+        (r"SunToken", "sun.png", 1.2, 120),
+    ]
+    for args in replace_specs:
+        text = replace_image_tag(text, fontsize, *args)
+
+    return text.strip()
+
+
+def test_markup():
+    assert (
+        markup.add_inline_text("<c>A<tab>B</c><br>C<n><line>D", 3)
+        == "<para alignment='center'>A&nbsp;&nbsp;&nbsp;&nbsp;B</para><br />C\n\n"
+        "<para alignment='center'>&mdash;&mdash;&mdash;</para>\nD"
+    )
+    images = markup.add_inline_images("+2 Coins and 1 <*VP*>", 10)
+    assert images.startswith("+<img src=")
+    assert "coin_small_2.png" in images
+    assert '<font size=13.0>1</font><img src="' in images
+    # cached by text and font size
+    assert markup.add_inline_images("+2 Coins and 1 <*VP*>", 10) is images
+
+
+@pytest.mark.parametrize("language", db.get_languages("card_db"))
+def test_markup_matches_legacy(language):
+    # Every card text in every language converts exactly as it used to
+    options = config_options.clean_opts(
+        config_options.parse_opts(
+            ["--edition=all", "--expansions", "*", f"--language={language}"]
+        )
+    )
+    card_db = db.get_card_database(language=language).view()
+    cards = main.filter_sort_cards(
+        db.read_card_data(options, card_db), options, card_db
+    )
+    for card in cards:
+        if card.isExpansion():
+            continue
+        for text in [card.description, card.extra]:
+            if not text:
+                continue
+            text = card.getBonusBoldText(text)
+            for emWidth in [7.5, 20]:
+                converted = markup.add_inline_text(text, min(11, int(emWidth)))
+                assert converted == legacy_add_inline_text(text, emWidth)
+                for paragraph in converted.split("\n"):
+                    for fontsize in [10, 7, 3]:
+                        assert markup.add_inline_images(
+                            paragraph, fontsize
+                        ) == legacy_add_inline_images(paragraph, fontsize)
@@ -0,0 +1,77 @@
+import io
+import os
+
+import pytest
+
+from domdiv import main, output_cache
+from tests import parse_and_clean_args
+
+
+def get_key(args, kind="pdf"):
+    return output_cache.get_cache_key(parse_and_clean_args(args), kind)
+
+
+def test_equivalent_options_share_key():
+    assert get_key(["--sleeved"]) == get_key(["--size=Sleeved"])
+    assert get_key(["--size=unsleeved"]) == get_key([])
+    assert get_key(["--papersize=a4"]) == get_key(["--papersize=A4"])
+    assert get_key(["--expansions", "Base", "intrigue"]) == get_key(
+        ["--expansions", "intrigue", "base"]
+    )
+    assert get_key(["--wrapper"]) == get_key(["--head=strap", "--tail=folder"])
+    assert get_key(["--outfile=a.pdf", "--jobs=2"]) == get_key(["--outfile=b.pdf"])
+
+
+def test_different_options_have_different_keys():
+    assert get_key([]) != get_key(["--papersize=A4"])
+    assert get_key([]) != get_key(["--count"])
+    assert get_key([]) != get_key(["--language=de"])
+    assert get_key(["--preview"]) != get_key(["--preview"], "png")
+
+
+def test_cardlist_keyed_on_contents(tmp_path):
+    first = tmp_path / "first.txt"
+    second = tmp_path / "second.txt"
+    first.write_text("Village\n")
+    second.write_text("Village\n")
+    assert get_key([f"--cardlist={first}"]) == get_key([f"--cardlist={second}"])
+    second.write_text("Smithy\n")
+    assert get_key([f"--cardlist={first}"]) != get_key([f"--cardlist={second}"])
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = output_cache.OutputCache(str(tmp_path), max_bytes=250)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    # make "a" the most recently used
+    os.utime(cache.get_filename("a"), (0, 0))
+    os.utime(cache.get_filename("b"), (0, 0))
+    assert cache.get("a") == b"a" * 100
+    cache.put("c", b"c" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 100
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 200, 1)
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (2, 1, 3)
+
+
+def test_generate_from_cache(tmp_path, monkeypatch):
+    args = ["--expansions=alchemy", f"--cache-dir={tmp_path}"]
+    options = parse_and_clean_args(args)
+    options.outfile = io.BytesIO()
+    main.generate(options)
+    drawn = options.outfile.getvalue()
+    assert len(os.listdir(tmp_path)) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("drawn again")
+
+    monkeypatch.setattr(main, "prepare_generation", fail)
+    outfile = tmp_path / "alchemy.pdf"
+    options = parse_and_clean_args(args + [f"--outfile={outfile}"])
+    main.generate(options)
+    assert outfile.read_bytes() == drawn
+
+    options = parse_and_clean_args(args + ["--no-cache"])
+    with pytest.raises(AssertionError):
+        main.generate(options)
@@ -0,0 +1,30 @@
+from PIL import Image
+
+from domdiv import resource_handling
+
+
+def test_resource_cache():
+    cache = resource_handling.ResourceCache()
+    path = cache.filepath("images/coin.png")
+    assert cache.filepath("images/coin.png") is path
+    assert cache.stats()["path"] == {"hits": 1, "misses": 1, "entries": 1}
+
+    with Image.open(path) as img:
+        assert cache.image_size("coin.png") == img.size
+    assert cache.image_size("coin.png") == cache.image_size("coin.png")
+    stats = cache.stats()
+    assert stats["size"] == {"hits": 2, "misses": 1, "entries": 1}
+    # reading the size resolved the same path again
+    assert stats["path"]["hits"] == 2
+
+    cache.clear()
+    assert cache.stats()["path"] == {"hits": 0, "misses": 0, "entries": 0}
+
+
+def test_module_cache_counts_hits():
+    before = resource_handling.get_cache_stats()["path"]
+    resource_handling.get_image_filepath("coin.png")
+    resource_handling.get_image_filepath("coin.png")
+    after = resource_handling.get_cache_stats()["path"]
+    assert after["hits"] + after["misses"] == before["hits"] + before["misses"] + 2
+    assert after["hits"] > before["hits"]
@@ -0,0 +1,130 @@
+import base64
+import email
+import io
+import json
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from domdiv import service
+
+ARGS = ["--expansions", "alchemy", "--no-tab-artwork"]
+
+
+def get_service():
+    return service.DividerService(languages=["en_us"])
+
+
+def test_generate_repeatedly():
+    svc = get_service()
+    first = svc.generate(svc.parse(ARGS))
+    second = svc.generate(svc.parse(ARGS))
+    assert first.startswith(b"%PDF")
+    assert second.startswith(b"%PDF")
+    assert len(first) == len(second)
+
+
+def test_font_dir(tmp_path):
+    svc = service.DividerService(languages=["en_us"], font_dir=str(tmp_path))
+    assert svc.parse(ARGS).font_dir == str(tmp_path)
+    assert svc.parse(ARGS + ["--font-dir", str(tmp_path)]).font_dir == str(tmp_path)
+    # fonts are registered for the whole process, so requests can't bring their own
+    with pytest.raises(ValueError):
+        svc.parse(ARGS + ["--font-dir", str(tmp_path / "other")])
+
+
+def test_request_paths(tmp_path):
+    svc = service.DividerService(languages=["en_us"], cache_dir=str(tmp_path))
+    assert svc.parse(ARGS).cache_dir == str(tmp_path)
+    assert svc.parse(ARGS).image_cache_dir is None
+    # requests can't make the service write anywhere else, or anything but the reply
+    for args in [
+        ["--cache-dir", str(tmp_path / "other")],
+        ["--image-cache-dir", str(tmp_path)],
+        ["--tab-artwork-cache-dir", str(tmp_path)],
+        ["--cache-size", "1"],
+        ["--outfile", str(tmp_path / "out.pdf")],
+        ["--profile"],
+        ["--batch", str(tmp_path / "jobs.jsonl")],
+    ]:
+        with pytest.raises(ValueError):
+            svc.parse(ARGS + args)
+
+
+def test_info_argv():
+    svc = get_service()
+    assert svc.parse(ARGS).argv is None
+    options = svc.parse(ARGS + ["--info"])
+    assert options.argv == ["dominion_dividers"] + ARGS + ["--info"]
+
+
+def test_generate_threads():
+    svc = get_service()
+    results = {}
+
+    def run(i):
+        results[i] = svc.generate(svc.parse(ARGS))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 3
+    assert len({len(r) for r in results.values()}) == 1
+
+
+def test_serve_stdin():
+    svc = get_service()
+    requests = [
+        json.dumps({"id": 1, "args": " ".join(ARGS)}),
+        json.dumps({"id": 2, "args": ["--no-such-option"]}),
+    ]
+    out = io.StringIO()
+    service.serve_stdin(svc, io.StringIO("\n".join(requests) + "\n"), out)
+    replies = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert replies[0]["id"] == 1
+    assert replies[0]["content_type"] == service.PDF_CONTENT_TYPE
+    assert base64.b64decode(replies[0]["data"]).startswith(b"%PDF")
+    assert replies[1]["id"] == 2
+    assert "error" in replies[1]
+
+
+def test_serve_stdin_chunks():
+    svc = get_service()
+    request = json.dumps({"id": 3, "args": ARGS + ["--chunk-pages", "1"]})
+    out = io.StringIO()
+    service.serve_stdin(svc, io.StringIO(request + "\n"), out)
+    replies = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [reply["id"] for reply in replies] == [3, 3, 3]
+    assert [reply.get("part") for reply in replies] == [1, 2, None]
+    for reply in replies[:2]:
+        assert base64.b64decode(reply["data"]).startswith(b"%PDF")
+    assert replies[2]["parts"] == 2
+    assert "data" not in replies[2]
+
+
+def test_serve_http_chunks():
+    svc = get_service()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), service.make_http_handler(svc))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/"
+        body = json.dumps({"args": ARGS + ["--chunk-pages", "1"]}).encode("utf-8")
+        with urllib.request.urlopen(url, data=body) as reply:
+            content_type = reply.headers["Content-Type"]
+            data = reply.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert content_type.startswith("multipart/mixed")
+    message = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("ascii") + data
+    )
+    parts = [part.get_payload(decode=True) for part in message.get_payload()]
+    assert len(parts) == 2
+    assert all(part.startswith(b"%PDF") for part in parts)
@@ -0,0 +1,83 @@
+import copy
+
+import pytest
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Paragraph
+
+from domdiv import textfit
+
+TEXT = [
+    "+1 Card<br />+1 Action<br />+2 Coins",
+    "When you play this, you may trash a card from your hand. "
+    "If you do, gain a card costing up to 2 Coins more than it.",
+    "2 <*VP*>",
+]
+
+
+def fit_linearly(descriptions, width, height, fontName, alignment, spacerHeight):
+    # The original fitting loop, one point at a time
+    s = copy.copy(textfit.get_body_style())
+    s.fontName = fontName
+    s.alignment = alignment
+    while True:
+        paragraphs = []
+        h = (len(descriptions) - 1) * spacerHeight
+        w = 0
+        for d in descriptions:
+            p = Paragraph(textfit.add_inline_images(d, s.fontSize), s)
+            pWidth, pHeight = p.wrap(width, height)
+            h += pHeight
+            w = max(w, pWidth)
+            paragraphs.append(p)
+        if (h <= height and w <= width) or s.fontSize <= 1 or s.leading <= 1:
+            return s.fontSize, s.leading, spacerHeight
+        s.fontSize -= 1
+        s.leading -= 1
+        spacerHeight = max(spacerHeight - 1, 0.05 * cm)
+
+
+@pytest.mark.parametrize("alignment", [TA_CENTER, TA_JUSTIFY])
+@pytest.mark.parametrize("height", [0.5, 1, 2, 3, 4, 6, 10])
+def test_fit_matches_linear_search(height, alignment):
+    width = 4 * cm
+    height = height * cm
+    fit = textfit.fit_paragraphs(
+        TEXT, width, height, "Times-Roman", alignment, 0.2 * cm, 0.05 * cm
+    )
+    expected = fit_linearly(TEXT, width, height, "Times-Roman", alignment, 0.2 * cm)
+    assert (fit.fontSize, fit.leading, fit.spacerHeight) == expected
+    assert len(fit.paragraphs) == len(TEXT)
+
+
+def test_fit_is_cached():
+    args = (TEXT, 5 * cm, 3 * cm, "Times-Roman", TA_CENTER, 0.2 * cm, 0.05 * cm)
+    assert textfit.fit_paragraphs(*args) is textfit.fit_paragraphs(*args)
+    assert textfit.fit_paragraphs(*args) is not textfit.fit_paragraphs(
+        *args, inlineImages=False
+    )
+
+
+def shrink_linearly(measure, fontSize, maxWidth, minFontSize):
+    # The original label loop, 0.01pt at a time
+    width = measure(fontSize)
+    while width > maxWidth and fontSize > minFontSize:
+        fontSize -= 0.01
+        width = measure(fontSize)
+    return fontSize, width
+
+
+@pytest.mark.parametrize("maxWidth", [0, 10, 50, 60.5, 75, 80, 90, 200])
+@pytest.mark.parametrize("minFontSize", [0, 6, 7.5, 9])
+def test_font_size_matches_linear_search(maxWidth, minFontSize):
+    calls = []
+
+    def measure(size):
+        calls.append(size)
+        return stringWidth("Action - Attack", "Times-Roman", size)
+
+    fit = textfit.fit_font_size(measure, 8, maxWidth, minFontSize)
+    bisected = len(calls)
+    assert fit == shrink_linearly(measure, 8, maxWidth, minFontSize)
+    assert bisected <= len(calls) - bisected